@@ -1,9 +1,33 @@
-from flask import Flask, jsonify, request, render_template_string, send_file
+import time
+# cold start clock: everything in the startup report is measured from here
+STARTED_AT = time.perf_counter()
+
+from flask import Flask, jsonify, request, render_template_string, send_file, send_from_directory
+from werkzeug.exceptions import NotFound
 from flask_cors import CORS
-import uuid, os, logging, threading
-from datetime import datetime
-from gst_automator import GSTAutomator
+import os, io, sys, base64, atexit, signal, socket, logging, threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http_engine import HttpPortalEngine
+from driver_pool import DriverPool
+from job_queue import JobQueue, QueueFull
+from cookie_store import CookieStore
+from captcha_dataset import CaptchaDataset
+from invoice_validation import MasterData
+from bill_store import BillStore
+from keepalive import KeepAlive
 from config import Config
+from routing import new_id
+import metrics
+
+# cold start timings in seconds since STARTED_AT, logged once warm and served on /api/startup
+startup = {"imports_seconds": round(time.perf_counter() - STARTED_AT, 3), "app_ready_seconds": None,
+           "listening_seconds": None, "chromedriver_seconds": None, "pool_warm_seconds": None}
+
+def selenium_engine():
+    """GSTAutomator, imported on first use: Selenium only loads once a browser is actually needed."""
+    from gst_automator import GSTAutomator
+    return GSTAutomator
 
 app = Flask(__name__)
 CORS(app)
@@ -11,27 +35,367 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("GSTService")
 
-# in-memory sessions: sid -> {"automator": GSTAutomator(), "created_at":..., "last_activity":...}
+# in-memory sessions: sid -> {"automator": GSTAutomator(), "lock": RLock, "created_at":..., "last_activity":...}
+# `lock` only guards the registry itself and is never held across browser work;
+# each session's own lock serialises access to its driver
 sessions = {}
 lock = threading.Lock()
+
+# pre-warmed browsers parked on Login.aspx, handed out to new sessions
+driver_pool = DriverPool(
+    factory=lambda: selenium_engine().launch_driver(),
+    reset=lambda driver: selenium_engine().park_driver(driver),
+    min_size=Config.DRIVER_POOL_MIN,
+    max_size=Config.DRIVER_POOL_MAX,
+    acquire_timeout=Config.DRIVER_POOL_ACQUIRE_TIMEOUT,
+    max_park_age=Config.DRIVER_POOL_MAX_PARK_SECONDS,
+    # parked browsers keep a captured captcha, re-captured before the portal expires it
+    refresh_after=Config.CAPTCHA_REFRESH_SECONDS if Config.CAPTCHA_PREFETCH else None,
+)
+
+# authenticated portal cookies by GSTIN username, lets new sessions skip the captcha
+cookie_store = CookieStore(ttl=Config.PORTAL_SESSION_TTL_MINUTES * 60)
+
+# (captcha, answer, outcome) samples from real logins, for training and benchmarking solvers
+captcha_dataset = CaptchaDataset(Config.CAPTCHA_DATASET_PATH) if Config.CAPTCHA_DATASET_PATH else None
+
+# portal state list / IGST rates, invoices are checked against them before any browser work
+master_data = MasterData(Config.MASTER_DATA_PATH, ttl=Config.MASTER_DATA_TTL_HOURS * 3600)
+
+# every bill generated, by (GSTIN, doc_no): retries are answered from here, never resubmitted
+bill_store = BillStore(Config.BILL_STORE_PATH, flush_interval=Config.BILL_STORE_FLUSH_SECONDS)
+
+# bounded worker pool for the long login/fill/preview and print flows
+job_queue = JobQueue(
+    workers=Config.JOB_WORKERS,
+    max_queue=Config.JOB_QUEUE_MAX,
+    result_ttl=Config.JOB_RESULT_TTL_SECONDS,
+    id_factory=lambda: new_id(Config.WORKER_ID),
+)
+# heartbeat schedule for idle logged-in sessions (Config.KEEPALIVE), adapts to the portal's idle timeout
+keepalive = KeepAlive(Config.PORTAL_SESSION_TTL_MINUTES * 60,
+                      min_interval=Config.KEEPALIVE_MIN_SECONDS, max_interval=Config.KEEPALIVE_MAX_SECONDS)
+# eviction counters, reported on /api/session-stats
+eviction_stats = {"idle": 0, "lru": 0, "manual": 0}
+# sessions whose browser is being launched right now, counted against MAX_LIVE_SESSIONS
+pending_starts = 0
+
+# scrape-time gauges for /metrics
+metrics.REGISTRY.gauge("ewb_live_sessions", "Sessions held in memory", lambda: len(sessions))
+metrics.REGISTRY.gauge("ewb_busy_sessions", "Sessions running a flow or with one queued",
+                       lambda: sum(1 for s in list(sessions.values()) if s.get("busy")))
+metrics.REGISTRY.gauge("ewb_live_browsers", "Chrome drivers by pool state",
+                       lambda: {k: v for k, v in driver_pool.snapshot().items()
+                                if k in ("idle", "in_use", "launching", "recycling")}, labelname="state")
+metrics.REGISTRY.gauge("ewb_job_queue_depth", "Jobs waiting for a worker", lambda: job_queue.snapshot()["queue_depth"])
+metrics.REGISTRY.gauge("ewb_busy_workers", "Job workers running a flow", lambda: job_queue.snapshot()["busy_workers"])
+metrics.REGISTRY.gauge("ewb_keepalive_interval_seconds", "Current heartbeat interval for idle sessions",
+                       lambda: keepalive.interval)
+
+def touch_session(sid):
+    session = sessions.get(sid)
+    if session is not None:
+        session["last_activity"] = datetime.now()
+
+class InvalidSession(LookupError):
+    """The session was closed (evicted, reaped, cleaned up) between the route's check and its use."""
+
+@contextmanager
+def session_in_use(sid):
+    """
+    Hold the session's own lock while a flow drives its browser. Requests for the
+    same session (double clicks, polling + submit) queue here instead of sharing
+    the driver; the busy count keeps the session from being reaped or evicted.
+    """
+    with lock:
+        session = sessions.get(sid)
+        if session is None:
+            raise InvalidSession("Invalid session")
+        session["busy"] += 1
+    try:
+        with session["lock"]:
+            session["last_activity"] = datetime.now()
+            yield session
+    finally:
+        with lock:
+            session["busy"] -= 1
+        session["last_activity"] = datetime.now()
+
+def detach_session(sid, reason):
+    """Drop a session from the registry. Caller must hold `lock` and then release_session() it outside."""
+    session = sessions.pop(sid, None)
+    if session is not None:
+        eviction_stats[reason] = eviction_stats.get(reason, 0) + 1
+        logger.info("Closing session %s (%s)", sid, reason)
+    return session
+
+def release_session(sid, session):
+    """Hand a detached session's browser back, after any flow still running on it."""
+    with session["lock"]:
+        try:
+            session["automator"].close()
+        except Exception:
+            logger.warning("Closing automator for %s failed", sid, exc_info=True)
+
+def close_session(sid, reason):
+    with lock:
+        session = detach_session(sid, reason)
+    if session is not None:
+        release_session(sid, session)
+
+def shutdown_browsers():
+    """
+    Quit every browser on the way out (atexit / SIGTERM): the parked ones, then those
+    held by sessions. Flows still running are not waited for, their browser just goes.
+    """
+    driver_pool.shutdown()
+    with lock:
+        closing = [(sid, detach_session(sid, "shutdown")) for sid in list(sessions)]
+    for sid, session in closing:
+        try:
+            # the pool is closed, so handing a driver back quits it
+            session["automator"].close()
+        except Exception:
+            logger.warning("Closing automator for %s failed", sid, exc_info=True)
+
+def lru_idle_session():
+    """Least recently active session with no flow running, or None. Caller must hold `lock`."""
+    idle = [(s["last_activity"], sid) for sid, s in sessions.items() if not s["busy"]]
+    return min(idle)[1] if idle else None
+
+def reap_idle_sessions():
+    cutoff = datetime.now() - timedelta(minutes=Config.SESSION_TIMEOUT_MINUTES)
+    with lock:
+        expired = [(sid, detach_session(sid, "idle")) for sid, s in list(sessions.items())
+                   if not s["busy"] and s["last_activity"] < cutoff]
+    for sid, session in expired:
+        release_session(sid, session)
+
+def session_reaper_loop():
+    while True:
+        time.sleep(Config.SESSION_REAPER_INTERVAL_SECONDS)
+        try:
+            reap_idle_sessions()
+        except Exception:
+            logger.exception("session reaper failed")
+
+def start_session_reaper():
+    threading.Thread(target=session_reaper_loop, name="session-reaper", daemon=True).start()
+
+def last_portal_activity(session):
+    return max(session["last_activity"].timestamp(), session.get("heartbeat_at", 0))
+
+def heartbeat_sessions():
+    """
+    Ping the idle logged-in sessions that are due. A session running a flow is
+    skipped, never waited for: its lock is only tried, and a flow that queued
+    up behind the heartbeat makes it back off straight away.
+    """
+    now = time.time()
+    with lock:
+        due = [(sid, s) for sid, s in sessions.items()
+               if not s["busy"] and s["automator"].logged_in and keepalive.due(last_portal_activity(s), now)]
+    for sid, session in due:
+        if not session["lock"].acquire(blocking=False):
+            keepalive.count("skipped_busy")
+            continue
+        try:
+            if session["busy"]:
+                keepalive.count("skipped_busy")
+                continue
+            automator = session["automator"]
+            idle = time.time() - last_portal_activity(session)
+            try:
+                alive = automator.heartbeat()
+            except Exception:
+                logger.warning("Heartbeat for session %s failed", sid, exc_info=True)
+                keepalive.count("errors")
+                continue
+            keepalive.observe(idle, alive)
+            if alive:
+                session["heartbeat_at"] = time.time()
+                continue
+            # logged out: have the captcha ready before the next job arrives for this session
+            logger.info("Session %s was logged out by the portal after %.0fs idle", sid, idle)
+            automator.session_expired(Config.username)
+            automator.get_captcha(sid)
+        except Exception:
+            logger.exception("Handling the logout of session %s failed", sid)
+        finally:
+            session["lock"].release()
+
+def session_keepalive_loop():
+    while True:
+        time.sleep(Config.KEEPALIVE_TICK_SECONDS)
+        try:
+            heartbeat_sessions()
+        except Exception:
+            logger.exception("session keep-alive failed")
+
+def start_session_keepalive():
+    threading.Thread(target=session_keepalive_loop, name="session-keepalive", daemon=True).start()
+
+def refresh_session_captchas():
+    """
+    Keep the captcha of idle logged-out sessions current: re-capture it once it is
+    CAPTCHA_REFRESH_SECONDS old and pre-solve it (Config.CAPTCHA_PRESOLVE). Busy
+    sessions are skipped, like heartbeat_sessions() does.
+    """
+    with lock:
+        idle = [(sid, s) for sid, s in sessions.items() if not s["busy"] and not s["automator"].logged_in]
+    for sid, session in idle:
+        if not session["lock"].acquire(blocking=False):
+            continue
+        try:
+            if session["busy"]:
+                continue
+            automator = session["automator"]
+            age = automator.captcha_age()
+            if age is None or age >= Config.CAPTCHA_REFRESH_SECONDS:
+                if automator.load_login_page(sid).get("success"):
+                    metrics.CAPTCHA_REFRESHES.inc(where="session")
+            automator.presolve_captcha()
+        except Exception:
+            logger.exception("Refreshing the captcha of session %s failed", sid)
+        finally:
+            session["lock"].release()
+
+def captcha_refresh_loop():
+    while True:
+        time.sleep(Config.CAPTCHA_REFRESH_TICK_SECONDS)
+        try:
+            refresh_session_captchas()
+        except Exception:
+            logger.exception("captcha refresh failed")
+
+def start_captcha_refresher():
+    threading.Thread(target=captcha_refresh_loop, name="captcha-refresh", daemon=True).start()
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+def warm_up(port):
+    """
+    Cold start, second half: once the HTTP port answers, look up chromedriver and
+    launch the pooled browsers (Config.WARM_START), then log the startup report.
+    """
+    if wait_for_port(port):
+        startup["listening_seconds"] = round(time.perf_counter() - STARTED_AT, 3)
+    warm = Config.WARM_START
+    if warm:
+        try:
+            from gst_automator import chromedriver_path
+            chromedriver_path()
+            startup["chromedriver_seconds"] = round(time.perf_counter() - STARTED_AT, 3)
+        except Exception:
+            logger.warning("Selenium engine unavailable, browsers will not be warmed", exc_info=True)
+            warm = False
+    driver_pool.start(warm=warm)
+    if warm and driver_pool.wait_warm(timeout=Config.DRIVER_POOL_ACQUIRE_TIMEOUT * 2):
+        startup["pool_warm_seconds"] = round(time.perf_counter() - STARTED_AT, 3)
+    logger.info("🚀 Startup: " + ", ".join(f"{k} {v}" for k, v in startup.items() if v is not None))
+
+def captcha_required(sid, captcha_text):
+    """409 answer when a session needs a captcha login but the request carries none, else None."""
+    session = sessions.get(sid)
+    if session is None:
+        raise InvalidSession("Invalid session")
+    automator = session["automator"]
+    if captcha_text or automator.logged_in:
+        return None
+    return jsonify({"success": False, "error": "Portal session expired, captcha required", "needs_captcha": True,
+                    "captcha_url": f"/images/{sid}/captcha.png"}), 409
+
 global invoice_data
 def create_session_obj():
-    sid = str(uuid.uuid4())
+    """
+    Reserve a slot under the registry lock, then launch/load outside it so
+    independent sessions start in parallel.
+    """
+    global pending_starts
+    sid = new_id(Config.WORKER_ID)
+    evicted = []
+    with lock:
+        # keep the number of live browsers bounded (sessions still starting count too):
+        # evict the LRU idle session when at the cap
+        while len(sessions) + pending_starts >= Config.MAX_LIVE_SESSIONS:
+            victim = lru_idle_session()
+            if victim is None:
+                break
+            evicted.append((victim, detach_session(victim, "lru")))
+        full = len(sessions) + pending_starts >= Config.MAX_LIVE_SESSIONS
+        if not full:
+            pending_starts += 1
+    for victim, session in evicted:
+        release_session(victim, session)
+    if full:
+        raise RuntimeError("Too many active sessions, try again later")
+    try:
+        automator = create_automator(sid)
+    finally:
+        with lock:
+            pending_starts -= 1
+    with lock:
+        sessions[sid] = {
+            "automator": automator,
+            "lock": threading.RLock(),
+            "created_at": datetime.now(),
+            "last_activity": datetime.now(),
+            "busy": 0,
+        }
+    return sid
+
+def create_automator(sid):
+    """
+    Pick the engine for a new session and get it to a usable state: a restored
+    portal session (no captcha) or a loaded login page. The HTTP engine falls
+    back to Selenium when it can't handle the portal's login page.
+    """
+    if Config.ENGINE == "http":
+        engine = HttpPortalEngine(cookie_store=cookie_store, captcha_dataset=captcha_dataset,
+                                  master_data=master_data, bill_store=bill_store)
+        if engine.resume_session(Config.username) or engine.load_login_page(sid).get("success"):
+            return engine
+        logger.warning("HTTP engine could not load the login page, falling back to Selenium")
+        metrics.RETRIES.inc(kind="engine_fallback")
+        engine.close()
+
     print("🚀 Creating GSTAutomator instance...")
-    automator = GSTAutomator()   # change to True if you want headless
-    sessions[sid] = {
-        "automator": automator,
-        "created_at": datetime.now(),
-        "last_activity": datetime.now()
-    }
+    GSTAutomator = selenium_engine()
+    automator = GSTAutomator(pool=driver_pool, cookie_store=cookie_store, captcha_dataset=captcha_dataset,
+                             master_data=master_data, bill_store=bill_store)
+    # a still-valid portal session for this user means no captcha at all
+    if automator.resume_session(Config.username):
+        return automator
     # load login page and capture captcha immediately
     automator.load_login_page(sid)
-    return sid
+    return automator
+
+# read-only status polls (the page asks every 30s): they must not count as activity, or an open
+# tab would keep the keep-alive from ever being due and the reaper from reclaiming the session
+PASSIVE_PATHS = {"/api/session-status"}
+
+@app.before_request
+def update_last_activity():
+    if request.path in PASSIVE_PATHS:
+        return
+    sid = request.args.get("session_id")
+    if sid is None and request.is_json:
+        sid = (request.get_json(silent=True) or {}).get("session_id")
+    if sid:
+        touch_session(sid)
 
 # ---------------- Disable Captcha Caching ----------------
 @app.after_request
 def add_no_cache_headers(response):
-    if "static/captchas" in request.path or "static/previews" in request.path:
+    if request.path.startswith("/images/"):
         response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
         response.headers["Pragma"] = "no-cache"
         response.headers["Expires"] = "0"
@@ -96,12 +460,32 @@ document.getElementById("confirmSubmitBtn").addEventListener("click", async () =
 
       <script>
         let sessionId = null;
+        let captchaAt = null;
+        function showCaptcha(data) {
+            captchaAt = data.captcha_captured_at;
+            document.getElementById('captcha-area').innerHTML = `<img src="${data.captcha_url}?t=${Date.now()}" />`;
+            if (data.captcha_answer) {
+                document.getElementById('captcha_text').value = data.captcha_answer;
+            }
+        }
+        // the server re-captures an idle captcha before the portal expires it: pick the new one up
+        setInterval(async () => {
+            if (!sessionId) return;
+            const res = await fetch(`/api/session-status?session_id=${sessionId}`);
+            const data = await res.json();
+            if (data.success && data.needs_captcha && data.captcha_captured_at !== captchaAt) {
+                showCaptcha(data);
+            }
+        }, 30000);
         async function start() {
             const res = await fetch('/api/start-session');
             const data = await res.json();
-            if (data.success) {
+            if (data.success && data.captcha_required === false) {
+                sessionId = data.session_id;
+                document.getElementById('captcha-area').innerText = 'Portal session restored, no captcha needed';
+            } else if (data.success) {
                 sessionId = data.session_id;
-                document.getElementById('captcha-area').innerHTML = `<img src="${data.captcha_url}?t=${Date.now()}" />`;
+                showCaptcha(data);
             } else {
                 document.getElementById('captcha-area').innerText = 'Failed to start session';
             }
@@ -113,7 +497,7 @@ document.getElementById("confirmSubmitBtn").addEventListener("click", async () =
             });
             const data = await res.json();
             if (data.success) {
-                document.getElementById('captcha-area').innerHTML = `<img src="${data.captcha_url}?t=${Date.now()}" />`;
+                showCaptcha(data);
             } else {
                 document.getElementById('captcha-area').innerText = 'Failed';
             }
@@ -126,7 +510,8 @@ document.getElementById("confirmSubmitBtn").addEventListener("click", async () =
             document.getElementById('status').innerText = JSON.stringify(data, null, 2);
             if (!data.success && data.new_captcha) {
                 // replace captcha
-                document.getElementById('captcha-area').innerHTML = `<img src="${data.new_captcha}?t=${Date.now()}" />`;
+                showCaptcha({captcha_url: data.new_captcha, captcha_captured_at: data.new_captcha_captured_at,
+                             captcha_answer: data.new_captcha_answer});
             }
             if (data.success && data.preview_image) {
                 document.getElementById('preview').src = data.preview_image + '?t=' + Date.now();
@@ -152,12 +537,21 @@ document.getElementById("confirmSubmitBtn").addEventListener("click", async () =
 @app.route("/api/start-session", methods=["GET"])
 def start_session():
     try:
-        with lock:
-            sid = create_session_obj()
-        automator = sessions[sid]["automator"]
-        captcha = automator.get_captcha(sid)
+        started = time.perf_counter()
+        sid = create_session_obj()
+        with session_in_use(sid) as session:
+            automator = session["automator"]
+            if automator.logged_in:
+                return jsonify({"success": True, "session_id": sid, "captcha_required": False})
+            captcha = automator.get_captcha(sid)
+        if captcha.get("success"):
+            source = "prefetched" if automator.captcha_info["prefetched"] else "loaded"
+            metrics.TIME_TO_FIRST_CAPTCHA_SECONDS.observe(time.perf_counter() - started, source=source)
         captcha["session_id"] = sid
+        captcha["captcha_required"] = True
         return jsonify(captcha)
+    except InvalidSession:
+        return jsonify({"success": False, "error": "Invalid session"}), 404
     except Exception as e:
         logger.exception("start_session failed")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -166,21 +560,175 @@ def start_session():
 def refresh_captcha():
     try:
         sid = request.json.get("session_id")
-        automator = sessions.get(sid)
-        if not automator:
+        if sid not in sessions:
             return jsonify({"success": False, "error": "Invalid session"}), 404
-        return jsonify(automator.get_captcha(sid))
+        with session_in_use(sid) as session:
+            # served from memory while it is fresh, the portal is only asked once it is getting old
+            return jsonify(session["automator"].current_captcha(sid))
+    except InvalidSession:
+        return jsonify({"success": False, "error": "Invalid session"}), 404
     except Exception as e:
         logger.exception("refresh captcha failed")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/images/<sid>/<name>.png", methods=["GET"])
+def session_image(sid, name):
+    """Captcha / preview PNGs straight from the automator's memory, nothing touches disk."""
+    session = sessions.get(sid)
+    png = session["automator"].images.get(name) if session else None
+    if png is None:
+        return jsonify({"success": False, "error": "Image not found"}), 404
+    return send_file(io.BytesIO(png), mimetype="image/png")
+
+@app.route("/api/solve-captcha", methods=["POST"])
+def solve_captcha():
+    """Run the in-memory captcha of a session through CaptchaSolver (local first, then remote)."""
+    try:
+        sid = request.json.get("session_id")
+        session = sessions.get(sid)
+        if session is None:
+            return jsonify({"success": False, "error": "Invalid session"}), 404
+        automator = session["automator"]
+        png = automator.images.get("captcha")
+        if png is None:
+            return jsonify({"success": False, "error": "No captcha captured for this session"}), 404
+        if automator.captcha_info and automator.captcha_info["answer"]:
+            # pre-solved while the session was idle (Config.CAPTCHA_PRESOLVE)
+            return jsonify({"success": True, "text": automator.captcha_info["answer"], "confidence": None,
+                            "source": "prefetched"})
+        from captcha_solver import CaptchaSolver  # optional cv2/genai backends, only needed here
+        answer = CaptchaSolver().solve_captcha(png)
+        return jsonify({"success": bool(answer.get("text")), **answer})
+    except Exception as e:
+        logger.exception("solve captcha failed")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# -------------- Flows (run inline or on the job queue) --------------
+def run_create_flow(sid, captcha_text):
+    """login + navigate + fill + preview for one session, with the hardcoded invoice."""
+    with session_in_use(sid) as session:
+        return _create_flow(session["automator"], sid, captcha_text)
+
+def _create_flow(automator, sid, captcha_text):
+
+    # build credentials from Config
+    credentials = {"username": Config.username, "password": Config.password, "captcha": captcha_text}
+
+    # hardcoded invoice data (change as needed)
+    invoice_data = {
+        "doc_no": "1001",
+        "gstin": "URP",                # or a GSTIN string
+        "name": "Demo Company",
+        "state": "UTTAR PRADESH",
+        "city": "Lucknow",
+        "pincode": "226001",
+        "amount": "15000",
+        "igst_rate": "5.000",
+        "transporter_id": "09AAEFC1392H1ZH",
+    }
+
+    # call master flow (login + navigate + fill + preview)
+    result = automator.create_eway_bill(credentials, invoice_data, sid, auto_submit=False)
+
+    # if login failed (create_eway_bill will return login error), refresh captcha and return new url
+    if not result.get("success"):
+        # after login failure, login() already reloaded the page and captured its captcha
+        new_c = automator.get_captcha(sid)
+        result["new_captcha"] = new_c.get("captcha_url")
+        result["new_captcha_captured_at"] = new_c.get("captcha_captured_at")
+        result["new_captcha_answer"] = new_c.get("captcha_answer")
+    else:
+        # on success preview returned with preview_image path
+        pass
+    return result
+
+def run_batch_flow(sid, captcha_text, invoices):
+    with session_in_use(sid) as session:
+        return _batch_flow(session, sid, captcha_text, invoices)
+
+def _batch_flow(session, sid, captcha_text, invoices):
+    automator = session["automator"]
+
+    credentials = {"username": Config.username, "password": Config.password, "captcha": captcha_text}
+    batch = {"total": len(invoices), "done": 0, "succeeded": 0, "failed": 0, "results": [], "finished": False}
+    session["batch"] = batch
+
+    def on_progress(done, total, result):
+        batch["done"] = done
+        batch["results"].append(result)
+        if result.get("success"):
+            batch["succeeded"] += 1
+        else:
+            batch["failed"] += 1
+        touch_session(sid)
+
+    result = automator.create_eway_bills(credentials, invoices, sid, progress=on_progress)
+    batch["finished"] = True
+
+    if not result.get("results") and not result.get("success"):
+        # login failed, nothing was attempted: hand back a fresh captcha
+        new_c = automator.get_captcha(sid)
+        result["new_captcha"] = new_c.get("captcha_url")
+        result["new_captcha_captured_at"] = new_c.get("captcha_captured_at")
+        result["new_captcha_answer"] = new_c.get("captcha_answer")
+    return result
+
+def run_submit_flow(sid):
+    with session_in_use(sid) as session:
+        # claimed in the bill store first: a retried submit gets the stored bill back
+        res = session["automator"].submit_bill()
+    if not res.get("success"):
+        return res
+    # the PDF is already saved under a name unique to this bill, hand back its link
+    # (the HTTP engine saves the portal's print page as HTML instead, and says so)
+    pdf_produced = (res.get("pdf_name") or "").endswith(".pdf")
+    return {
+        "success": True,
+        "message": res.get("message") if res.get("duplicate") or not pdf_produced else "EWB generated successfully.",
+        "duplicate": bool(res.get("duplicate")),
+        "pdf_produced": pdf_produced,
+        "ewb_no": res.get("ewb_no"),
+        "download_url": res.get("download_url"),
+        "pdf_path": res.get("pdf_path"),
+    }
+
+def enqueue(kind, fn, sid, *args):
+    """
+    Queue a flow and answer 202 with the job id right away. The session counts as
+    busy from here until the job ends, so a job still waiting for a worker keeps
+    it from being reaped or evicted.
+    """
+    with lock:
+        session = sessions.get(sid)
+        if session is None:
+            return jsonify({"success": False, "error": "Invalid session"}), 404
+        session["busy"] += 1
+
+    def release():
+        with lock:
+            session["busy"] -= 1
+
+    def run(*job_args):
+        try:
+            return fn(*job_args)
+        finally:
+            release()
+
+    try:
+        job = job_queue.submit(kind, run, sid, *args, session_id=sid)
+    except QueueFull as e:
+        release()
+        return jsonify({"success": False, "error": str(e)}), 503
+    return jsonify({"success": True, "job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"}), 202
+
 @app.route("/api/login", methods=["POST"])
 def api_login_and_create():
     """
-    Accepts {"session_id":..., "captcha_text": "..."}
+    Accepts {"session_id":..., "captcha_text": "...", "async": false}
     Uses Config.username/password and the provided captcha to login.
     On successful login, automatically runs create_eway_bill with hardcoded invoice_data,
     returns preview image info back to frontend.
+    With "async": true the flow runs on the job queue and a job id is returned immediately.
     """
     try:
         payload = request.json
@@ -188,84 +736,235 @@ def api_login_and_create():
         captcha_text = payload.get("captcha_text", "")
         if sid not in sessions:
             return jsonify({"success": False, "error": "Invalid session"}), 404
-        automator = sessions[sid]["automator"]
-
-        # build credentials from Config
-        credentials = {"username": Config.username, "password": Config.password, "captcha": captcha_text}
-
-        # hardcoded invoice data (change as needed)
-        invoice_data = {
-            "doc_no": "1001",
-            "gstin": "URP",                # or a GSTIN string
-            "name": "Demo Company",
-            "state": "UTTAR PRADESH",
-            "city": "Lucknow",
-            "pincode": "226001",
-            "amount": "15000",
-            "igst_rate": "5.000",
-            "transporter_id": "09AAEFC1392H1ZH",
-        }
-
-        # call master flow (login + navigate + fill + preview)
-        result = automator.create_eway_bill(credentials, invoice_data, sid, auto_submit=False)
-
-        # if login failed (create_eway_bill will return login error), refresh captcha and return new url
-        if not result.get("success"):
-            # after login failure, load_login_page already called inside login() to refresh captcha
-            new_c = automator.get_captcha(sid)
-            result["new_captcha"] = new_c.get("captcha_url")
-        else:
-            # on success preview returned with preview_image path
-            pass
-
-        return jsonify(result)
+        needs_captcha = captcha_required(sid, captcha_text)
+        if needs_captcha:
+            return needs_captcha
+        if payload.get("async"):
+            return enqueue("create", run_create_flow, sid, captcha_text)
+        return jsonify(run_create_flow(sid, captcha_text))
+    except InvalidSession:
+        return jsonify({"success": False, "error": "Invalid session"}), 404
     except Exception as e:
         logger.exception("create flow failed")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/login-batch", methods=["POST"])
+def api_login_and_create_batch():
+    """
+    Accepts {"session_id":..., "captcha_text": "...", "invoices": [{...}, ...], "async": false}
+    Logs in once and generates + submits one EWB per invoice on the same portal session.
+    Progress can be polled on /api/batch-status while this request runs.
+    """
+    try:
+        payload = request.json
+        sid = payload.get("session_id")
+        captcha_text = payload.get("captcha_text", "")
+        invoices = payload.get("invoices") or []
+        if sid not in sessions:
+            return jsonify({"success": False, "error": "Invalid session"}), 404
+        if not isinstance(invoices, list) or not invoices:
+            return jsonify({"success": False, "error": "invoices must be a non-empty list"}), 400
+        needs_captcha = captcha_required(sid, captcha_text)
+        if needs_captcha:
+            return needs_captcha
+        if payload.get("async"):
+            return enqueue("batch", run_batch_flow, sid, captcha_text, invoices)
+        return jsonify(run_batch_flow(sid, captcha_text, invoices))
+    except InvalidSession:
+        return jsonify({"success": False, "error": "Invalid session"}), 404
+    except Exception as e:
+        logger.exception("batch create flow failed")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/api/validate-invoices", methods=["POST"])
+def validate_invoices():
+    """
+    Accepts {"invoices": [{...}, ...]} and returns the local validation errors of each
+    invoice (portal state list, IGST rates, pincode/state, GSTIN checksums) without a session.
+    """
+    invoices = (request.get_json(silent=True) or {}).get("invoices") or []
+    if not isinstance(invoices, list):
+        return jsonify({"success": False, "error": "invoices must be a list"}), 400
+    results = [{"index": i, "doc_no": inv.get("doc_no"), "errors": master_data.validate(inv)}
+               for i, inv in enumerate(invoices)]
+    return jsonify({"success": all(not r["errors"] for r in results), "results": results})
+
+@app.route("/api/batch-status", methods=["GET"])
+def batch_status():
+    sid = request.args.get("session_id")
+    session = sessions.get(sid)
+    if session is None:
+        return jsonify({"success": False, "error": "Invalid session"}), 404
+    batch = session.get("batch")
+    if batch is None:
+        return jsonify({"success": False, "error": "No batch running for this session"}), 404
+    return jsonify({"success": True, **batch})
+
 @app.route("/api/submit-bill", methods=["POST"])
 def submit_bill():
     try:
-        sid = request.json.get("session_id")
+        payload = request.json or {}
+        sid = payload.get("session_id")
         if sid not in sessions:
             return jsonify({"success": False, "error": "Invalid session"}), 404
-        automator = sessions[sid]["automator"]
-        res = automator.confirm_and_submit()
-        pdf_name = f"EWB.pdf"
-        pdf_path = os.path.join("downloads", pdf_name)
-
-        # Save the PDF file (already done)
-        # return the downloadable link
-        return jsonify({
-            "success": True,
-            "message": "EWB generated successfully.",
-            "download_url": f"/Downloads/{pdf_name}"
-        })
+        if payload.get("async"):
+            return enqueue("submit", run_submit_flow, sid)
+        return jsonify(run_submit_flow(sid))
+    except InvalidSession:
+        return jsonify({"success": False, "error": "Invalid session"}), 404
     except Exception as e:
         logger.exception("submit failed")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# -------------- Jobs --------------
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Poll job status; ?wait=N long-polls up to N seconds (capped) for the job to finish."""
+    try:
+        wait = min(float(request.args.get("wait", 0)), Config.JOB_LONG_POLL_MAX_SECONDS)
+    except ValueError:
+        wait = 0
+    job = job_queue.wait(job_id, timeout=max(wait, 0))
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    data = job.to_dict()
+    if isinstance(data["result"], dict):
+        # keep status responses small, images/PDFs have their own routes
+        data["result"] = {k: v for k, v in data["result"].items() if k != "preview_b64"}
+    return jsonify({"success": True, **data})
+
+@app.route("/api/jobs/<job_id>/preview", methods=["GET"])
+def job_preview(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    b64 = (job.result or {}).get("preview_b64")
+    if not b64:
+        return jsonify({"success": False, "error": "No preview for this job", "status": job.status}), 404
+    return send_file(io.BytesIO(base64.b64decode(b64)), mimetype="image/png")
+
+@app.route("/api/jobs/<job_id>/pdf", methods=["GET"])
+def job_pdf(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    pdf_path = (job.result or {}).get("pdf_path")
+    if not pdf_path or not os.path.exists(pdf_path):
+        return jsonify({"success": False, "error": "No PDF for this job", "status": job.status}), 404
+    return download_pdf(os.path.basename(pdf_path))
+
+@app.route("/api/jobs-stats", methods=["GET"])
+def jobs_stats():
+    return jsonify({"success": True, "jobs": job_queue.snapshot()})
+
 @app.route("/api/cleanup")
 def cleanup():
     with lock:
-        for sid, obj in list(sessions.items()):
-            try:
-                obj["automator"].close()
-            except:
-                pass
-            sessions.pop(sid, None)
+        closing = [(sid, detach_session(sid, "manual")) for sid in list(sessions)]
+    for sid, session in closing:
+        release_session(sid, session)
     return jsonify({"success": True, "message": "All sessions closed"})
 
+@app.route("/api/session-stats")
+def session_stats():
+    with lock:
+        busy = sum(1 for s in sessions.values() if s.get("busy"))
+        logged_in = sum(1 for s in sessions.values() if s["automator"].logged_in)
+        live = len(sessions)
+    return jsonify({
+        "success": True,
+        "live_sessions": live,
+        "busy_sessions": busy,
+        "logged_in_sessions": logged_in,
+        "max_live_sessions": Config.MAX_LIVE_SESSIONS,
+        "evictions": dict(eviction_stats),
+        "keepalive": dict(keepalive.snapshot(), enabled=Config.KEEPALIVE),
+    })
+
+@app.route("/api/session-status")
+def session_status():
+    """Whether a session is still logged in to the portal or needs a captcha login (shown at captcha_url)."""
+    sid = request.args.get("session_id")
+    session = sessions.get(sid)
+    if session is None:
+        return jsonify({"success": False, "error": "Invalid session"}), 404
+    automator = session["automator"]
+    logged_in = automator.logged_in
+    captcha_info = None if logged_in else automator.captcha_info
+    return jsonify({
+        "success": True,
+        "logged_in": logged_in,
+        "needs_captcha": not logged_in,
+        "captcha_url": None if logged_in else f"/images/{sid}/captcha.png",
+        "captcha_captured_at": captcha_info["captured_at"] if captcha_info else None,
+        "captcha_answer": captcha_info["answer"] if captcha_info else None,
+        "busy": bool(session["busy"]),
+        "last_heartbeat": session.get("heartbeat_at"),
+    })
+
+@app.route("/api/cookie-stats")
+def cookie_stats():
+    return jsonify({"success": True, "cookies": cookie_store.snapshot()})
+
+@app.route("/api/bills/<doc_no>", methods=["GET", "DELETE"])
+def stored_bill(doc_no):
+    """
+    GET: the stored record of a document (status, EWB number, PDF, timestamps).
+    DELETE: drop a failed / unknown record once the portal was checked by hand, so it can be submitted again.
+    """
+    if request.method == "DELETE":
+        if not bill_store.forget(Config.username, doc_no):
+            return jsonify({"success": False, "error": "No record to drop (generated bills are kept)"}), 404
+        return jsonify({"success": True})
+    record = bill_store.get(Config.username, doc_no)
+    if record is None:
+        return jsonify({"success": False, "error": "Unknown document"}), 404
+    return jsonify({"success": True, "bill": record})
+
+@app.route("/api/bill-stats")
+def bill_stats():
+    return jsonify({"success": True, "bills": bill_store.snapshot()})
+
+@app.route("/api/master-data-stats")
+def master_data_stats():
+    return jsonify({"success": True, "master_data": master_data.snapshot()})
+
+@app.route("/api/startup")
+def startup_report():
+    """Cold start timings: imports, app ready, port listening, chromedriver found, browser pool warm."""
+    return jsonify({"success": True, "startup": startup})
+
+@app.route("/api/pool-stats")
+def pool_stats():
+    return jsonify({"success": True, "pool": driver_pool.snapshot()})
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of step timings, counters and session/browser gauges."""
+    return metrics.REGISTRY.exposition(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
 @app.route("/download/<filename>")
 def download_pdf(filename):
-    file_path = os.path.join("downloads", filename)
-    if os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True)
-    else:
+    # send_from_directory refuses names that escape PDF_DIR and streams the file in chunks
+    try:
+        # the type follows the name: .pdf, or .html for print pages saved by the HTTP engine
+        return send_from_directory(Config.PDF_DIR, filename, as_attachment=True)
+    except NotFound:
         return jsonify({"error": "File not found"}), 404
 
 if __name__ == "__main__":
-    os.makedirs("static/captchas", exist_ok=True)
-    os.makedirs("static/previews", exist_ok=True)
+    # Chrome processes outlive a killed Python parent; quit them on exit and on SIGTERM
+    # (what the host and the dispatcher send), which unwinds through the atexit hooks
+    atexit.register(shutdown_browsers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    job_queue.start()
+    start_session_reaper()
+    if Config.KEEPALIVE:
+        start_session_keepalive()
+    if Config.CAPTCHA_PREFETCH:
+        start_captcha_refresher()
     port = int(os.environ.get("PORT", 5099))
+    # browsers warm up behind the listening port, never in front of it
+    threading.Thread(target=warm_up, args=(port,), name="warm-up", daemon=True).start()
+    startup["app_ready_seconds"] = round(time.perf_counter() - STARTED_AT, 3)
     app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,305 @@
+"""
+End-to-end throughput benchmark against the local fake portal (fake_portal.py).
+
+    python bench_e2e.py [--engine http|selenium] [--target engine|app] [--users 4]
+                        [--bills 5] [--latency 0.05] [--fail-rate 0] [--portal-url URL] [--json]
+                        [--profile lean|full] [--compare-profiles]
+
+--target engine drives GSTAutomator / HttpPortalEngine directly, one instance
+per simulated user; --target app goes through the Flask routes of app.py
+(/api/start-session + /api/login-batch) with the Flask test client.
+Reports bills/minute, per-step p50/p99 latency and peak RSS (this process,
+plus the Chrome processes it spawned when psutil is installed).
+--compare-profiles runs the selenium engine once per Chrome profile
+(Config.CHROME_PROFILE lean vs full) and prints them side by side.
+"""
+import os, sys, json, time, argparse, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+STEPS = ["load_login_page", "get_captcha", "resume_session", "login", "navigate_to_bill_generation",
+         "fill_consignor_details", "fill_invoice_and_preview", "submit_form", "print_bill"]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KiB on Linux
+    except ImportError:
+        # Windows: psutil exposes the peak working set
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 / 1024
+
+
+class BrowserMemory:
+    """Samples the summed RSS of all child processes (chromedriver + Chrome) and keeps the peak."""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+
+    def _sample(self, proc):
+        total = 0
+        for child in proc.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except Exception:
+                continue   # exited between listing and sampling
+        return total / 1024 / 1024
+
+    def _run(self, proc):
+        while not self._stop.wait(self.interval):
+            mb = self._sample(proc)
+            if self.peak_mb is None or mb > self.peak_mb:
+                self.peak_mb = mb
+
+    def start(self):
+        try:
+            import psutil
+        except ImportError:
+            return self
+        threading.Thread(target=self._run, args=(psutil.Process(),), daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        return self.peak_mb
+
+
+class StepTimer:
+    """Wraps the step methods of engine instances and collects per-step latencies."""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, step, seconds):
+        with self.lock:
+            self.samples.setdefault(step, []).append(seconds)
+
+    def instrument(self, engine):
+        for step in STEPS:
+            method = getattr(engine, step, None)
+            if method is None:
+                continue
+
+            def timed(*args, _method=method, _step=step, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    self.record(_step, time.perf_counter() - t0)
+            setattr(engine, step, timed)
+        return engine
+
+    def report(self):
+        with self.lock:
+            return {
+                step: {
+                    "count": len(values),
+                    "p50_ms": percentile(values, 50) * 1000,
+                    "p99_ms": percentile(values, 99) * 1000,
+                }
+                for step, values in self.samples.items()
+            }
+
+
+def make_invoices(user, count):
+    return [{
+        "doc_no": f"B{user:03d}-{i:05d}-{int(time.time() * 1000) % 100000}",
+        "gstin": "URP",
+        "name": "Bench Company",
+        "state": "UTTAR PRADESH",
+        "city": "Lucknow",
+        "pincode": "226001",
+        "amount": str(1000 + i),
+        "igst_rate": "5.000",
+        "transporter_id": "09AAEFC1392H1ZH",
+    } for i in range(count)]
+
+
+def make_engine(engine_name, cookie_store):
+    if engine_name == "http":
+        from http_engine import HttpPortalEngine
+        return HttpPortalEngine(cookie_store=cookie_store)
+    from gst_automator import GSTAutomator
+    return GSTAutomator(cookie_store=cookie_store)
+
+
+def run_engine_user(user, args, timer, cookie_store, captcha):
+    from config import Config
+
+    engine = timer.instrument(make_engine(args.engine, cookie_store))
+    sid = f"bench-{user}"
+    try:
+        credentials = {"username": f"{Config.username}-{user}", "password": Config.password, "captcha": captcha}
+        if not engine.resume_session(credentials["username"]):
+            engine.load_login_page(sid)
+            engine.get_captcha(sid)
+        result = engine.create_eway_bills(credentials, make_invoices(user, args.bills), sid)
+        return result.get("results") or [result]
+    finally:
+        engine.close()
+
+
+def run_app_user(user, args, timer, captcha):
+    import app as app_module
+
+    client = app_module.app.test_client()
+    t0 = time.perf_counter()
+    start = client.get("/api/start-session").get_json()
+    timer.record("app:start_session", time.perf_counter() - t0)
+    if not start.get("success"):
+        return [start]
+    t0 = time.perf_counter()
+    result = client.post("/api/login-batch", json={
+        "session_id": start["session_id"], "captcha_text": captcha, "invoices": make_invoices(user, args.bills),
+    }).get_json()
+    timer.record("app:login_batch", time.perf_counter() - t0)
+    app_module.close_session(start["session_id"], "bench")
+    return result.get("results") or [result]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end e-way bill throughput benchmark")
+    parser.add_argument("--engine", choices=["http", "selenium"], default="http")
+    parser.add_argument("--target", choices=["engine", "app"], default="engine")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--bills", type=int, default=5, help="bills per user")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--portal-url", default=None, help="use an already running portal instead of starting one")
+    parser.add_argument("--captcha", default="ABC123")
+    parser.add_argument("--password", default="secret")
+    parser.add_argument("--profile", choices=["lean", "full"], default=None,
+                        help="Chrome profile for the selenium engine (default Config.CHROME_PROFILE)")
+    parser.add_argument("--compare-profiles", action="store_true",
+                        help="run the selenium engine with the lean and the full profile and compare")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.compare_profiles:
+        return compare_profiles(argv if argv is not None else sys.argv[1:])
+
+    portal = None
+    url = args.portal_url
+    if url is None:
+        from fake_portal import start_fake_portal
+        portal, _, url = start_fake_portal(latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate,
+                                           captcha_answer=args.captcha, password=args.password)
+    # Config reads these at import time, so they must be set before any engine is imported
+    os.environ["PORTAL_BASE_URL"] = url
+    os.environ["GST_ENGINE"] = args.engine
+    os.environ["GST_PASSWORD"] = args.password
+    os.environ.setdefault("MAX_LIVE_SESSIONS", str(args.users))
+    if args.profile:
+        os.environ["CHROME_PROFILE"] = args.profile
+
+    from cookie_store import CookieStore
+
+    timer = StepTimer()
+    if args.target == "app":
+        import app as app_module
+        if args.engine == "selenium":
+            app_module.driver_pool.start()
+        _patch_app_engines(app_module, timer)
+        user_fn = lambda u: run_app_user(u, args, timer, args.captcha)
+    else:
+        cookie_store = CookieStore()
+        user_fn = lambda u: run_engine_user(u, args, timer, cookie_store, args.captcha)
+
+    memory = BrowserMemory().start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        per_user = list(pool.map(user_fn, range(args.users)))
+    elapsed = time.perf_counter() - start
+    browser_rss = memory.stop()
+
+    results = [r for user_results in per_user for r in user_results]
+    succeeded = sum(1 for r in results if r.get("success"))
+    report = {
+        "engine": args.engine,
+        "target": args.target,
+        "profile": os.environ.get("CHROME_PROFILE", "lean") if args.engine == "selenium" else None,
+        "users": args.users,
+        "bills_requested": args.users * args.bills,
+        "bills_succeeded": succeeded,
+        "bills_failed": len(results) - succeeded,
+        "elapsed_seconds": elapsed,
+        "bills_per_minute": succeeded / elapsed * 60 if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_browser_rss_mb": browser_rss,
+        "steps": timer.report(),
+        "portal": dict(portal.stats) if portal else None,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"Engine {args.engine} via {args.target}: {args.users} users x {args.bills} bills, portal {url}")
+    print(f"✅ {succeeded}/{report['bills_requested']} bills in {elapsed:.1f}s "
+          f"= {report['bills_per_minute']:.1f} bills/min, peak RSS {report['peak_rss_mb']:.0f} MB")
+    if browser_rss is not None:
+        print(f"🌐 Peak browser RSS {browser_rss:.0f} MB ({browser_rss / max(args.users, 1):.0f} MB per user)")
+    print(f"{'step':<30}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for step, s in report["steps"].items():
+        print(f"{step:<30}{s['count']:>8}{s['p50_ms']:>10.1f}{s['p99_ms']:>10.1f}")
+    return 0
+
+
+def compare_profiles(argv):
+    """Re-run this benchmark once per Chrome profile in a fresh process (Config is read at import)."""
+    argv = [a for a in argv if a not in ("--compare-profiles", "--json")]
+    for flag in ("--engine", "--profile"):
+        if flag in argv:
+            i = argv.index(flag)
+            del argv[i:i + 2]
+    reports = {}
+    for profile in ("full", "lean"):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--engine", "selenium",
+                              "--profile", profile, "--json"], capture_output=True, text=True)
+        lines = out.stdout.splitlines()
+        try:
+            # the JSON report follows any progress prints, starting at a bare "{" line
+            reports[profile] = json.loads("\n".join(lines[lines.index("{"):]))
+        except ValueError:
+            print(f"❌ {profile} run failed:\n{out.stderr[-2000:]}")
+            return 1
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    full, lean = reports["full"], reports["lean"]
+    print(f"{'':<30}{'full':>12}{'lean':>12}")
+    print(f"{'bills/min':<30}{fmt(full['bills_per_minute'], '.1f'):>12}{fmt(lean['bills_per_minute'], '.1f'):>12}")
+    print(f"{'peak browser RSS MB':<30}{fmt(full['peak_browser_rss_mb'], '.0f'):>12}"
+          f"{fmt(lean['peak_browser_rss_mb'], '.0f'):>12}")
+    for step in STEPS:
+        if step in full["steps"] or step in lean["steps"]:
+            f_ms = full["steps"].get(step, {}).get("p50_ms")
+            l_ms = lean["steps"].get(step, {}).get("p50_ms")
+            print(f"{step + ' p50 ms':<30}{fmt(f_ms, '.0f'):>12}{fmt(l_ms, '.0f'):>12}")
+    return 0
+
+
+def _patch_app_engines(app_module, timer):
+    """Instrument every engine app.py creates, by wrapping its create_automator()."""
+    original = app_module.create_automator
+
+    def create_automator(sid):
+        return timer.instrument(original(sid))
+    app_module.create_automator = create_automator
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+import os, re, time, uuid, base64, logging
+from config import Config
+from captcha_dataset import REJECTED, classify_login_error
+from bill_store import GENERATED, FAILED, UNKNOWN, IN_PROGRESS
+from captcha_prefetch import presolve
+from metrics import LOGIN_FAILURES, RETRIES, INVOICES_REJECTED, CAPTCHA_AGE_SECONDS
+
+logger = logging.getLogger("BillFlow")
+
+# e-way bill numbers are 12 digits; the print page shows the bill's own in EWB_NO_ID
+EWB_NO_RE = re.compile(r"\b(\d{12})\b")
+EWB_NO_ID = "lblEwbNo"
+
+# checkpoints of one bill, in order; the engine's `checkpoint` is the last one reached
+CHECKPOINTS = ("logged_in", "on_bill_page", "consignor_filled", "previewed", "submitted", "printed")
+# engine.locate() answer -> furthest checkpoint that page proves ("login" = session gone, "unknown" = can't tell)
+LOCATION_CHECKPOINTS = {"other": "logged_in", "bill_form": "on_bill_page", "bill_form_filled": "consignor_filled",
+                        "preview": "previewed", "submitted": "submitted", "printed": "printed"}
+# never repeated blindly: a second click on submit could generate a second bill
+NO_RETRY = {"submitted"}
+
+
+def read_ewb_no(label_text, page_text):
+    """The EWB number from the EWB_NO_ID element's text; the first 12-digit run on the page only when it is absent."""
+    match = EWB_NO_RE.search(label_text if label_text is not None else page_text or "")
+    return match.group(1) if match else None
+
+
+def _order(checkpoint):
+    return CHECKPOINTS.index(checkpoint) if checkpoint in CHECKPOINTS else -1
+
+
+class BillFlow:
+    """
+    Engine-independent e-way bill orchestration (single bill, batch, session reuse).
+
+    Engines (GSTAutomator over Selenium, HttpPortalEngine over plain form posts)
+    provide the step methods: login, navigate_to_bill_generation,
+    fill_consignor_details, fill_invoice_and_preview, submit_form, print_bill,
+    restore_session, session_expired, heartbeat, current_url, clear_page_state,
+    scrape_master_data, locate and recover_step, plus the `logged_in`,
+    `checkpoint`, `portal_user`, `previewed_invoice`, `cookie_store`,
+    `captcha_dataset`, `master_data`, `bill_store`, `captcha_info` and
+    `images` attributes.
+    """
+
+    # ---------- SHARED HELPERS ----------
+    def store_image(self, name, png):
+        self.images[name] = png
+        self.images.move_to_end(name)
+        while len(self.images) > Config.IMAGE_CACHE_MAX:
+            self.images.popitem(last=False)
+
+    def _record_captcha(self, png, captcha_text, outcome):
+        if self.captcha_dataset is None:
+            return
+        try:
+            self.captcha_dataset.record(png, captcha_text, outcome)
+        except Exception:
+            logger.warning("Could not record captcha sample", exc_info=True)
+
+    @staticmethod
+    def save_pdf(pdf, ewb_no=None, ext="pdf"):
+        """Write an EWB PDF (or another print format, by ext) under a unique name in Config.PDF_DIR; returns the name."""
+        os.makedirs(Config.PDF_DIR, exist_ok=True)
+        token = uuid.uuid4().hex[:12]
+        name = f"EWB-{ewb_no}-{token}.{ext}" if ewb_no else f"EWB-{token}.{ext}"
+        with open(os.path.join(Config.PDF_DIR, name), "wb") as f:
+            f.write(pdf)
+        return name
+
+    # ---------- CAPTCHA ----------
+    def set_captcha(self, png, answer=None, captured_at=None, prefetched=False):
+        """Keep the captcha shown on the current login page (and a pre-computed answer) in memory."""
+        self.store_image("captcha", png)
+        self.captcha_info = {"captured_at": captured_at or time.time(), "answer": answer, "prefetched": prefetched}
+
+    def forget_captcha(self):
+        """The login page was (re)loaded: the captcha in memory is not the one on screen any more."""
+        self.images.pop("captcha", None)
+        self.captcha_info = None
+
+    def captcha_age(self):
+        if self.captcha_info is None or self.images.get("captcha") is None:
+            return None
+        return time.time() - self.captcha_info["captured_at"]
+
+    def captcha_response(self, session_id):
+        info = self.captcha_info
+        return {
+            "success": True,
+            "captcha_url": f"/images/{session_id}/captcha.png",
+            "captcha_b64": base64.b64encode(self.images["captcha"]).decode("utf-8"),
+            "captcha_captured_at": info["captured_at"],
+            "captcha_answer": info["answer"],
+        }
+
+    def current_captcha(self, session_id):
+        """The captcha in memory while it is younger than Config.CAPTCHA_REFRESH_SECONDS, else a fresh login page."""
+        age = self.captcha_age()
+        if age is not None and age < Config.CAPTCHA_REFRESH_SECONDS:
+            return self.captcha_response(session_id)
+        return self.load_login_page(session_id)
+
+    def presolve_captcha(self):
+        """Run the solver on the captcha in memory ahead of the user (Config.CAPTCHA_PRESOLVE); True if answered."""
+        info = self.captcha_info
+        if info is None or info["answer"] or not Config.CAPTCHA_PRESOLVE:
+            return False
+        info["answer"] = presolve(self.images.get("captcha"))
+        return bool(info["answer"])
+
+    # ---------- LOCAL VALIDATION ----------
+    def check_invoice(self, invoice_data):
+        """Rejection result for an invoice that would fail on the portal, None when it is fine to send."""
+        if self.master_data is None:
+            return None
+        errors = self.master_data.validate(invoice_data)
+        if not errors:
+            return None
+        INVOICES_REJECTED.inc()
+        return {"success": False, "error": "Invalid invoice: " + "; ".join(errors),
+                "validation_errors": errors, "rejected_locally": True}
+
+    def refresh_master_data(self):
+        """Re-read the state list and IGST rates from the bill page when the cached copy is stale; True if refreshed."""
+        if self.master_data is None or not self.master_data.claim_refresh():
+            return False
+        try:
+            scraped = self.scrape_master_data()
+        except Exception:
+            logger.warning("Scraping portal master data failed", exc_info=True)
+            scraped = None
+        self.master_data.update(scraped)
+        return bool(scraped)
+
+    # ---------- IDEMPOTENCY ----------
+    @staticmethod
+    def _stored_result(record):
+        if record["status"] == GENERATED:
+            name = record.get("pdf_name")
+            return {
+                "success": True,
+                "duplicate": True,
+                "message": "E-way bill already generated for this document.",
+                "ewb_no": record.get("ewb_no"),
+                "pdf_name": name,
+                "pdf_path": record.get("pdf_path"),
+                "download_url": f"/download/{name}" if name else None,
+                "generated_at": record.get("updated_at"),
+            }
+        if record["status"] == IN_PROGRESS:
+            error = "This document is already being submitted"
+        else:
+            error = "An earlier submission of this document got no answer from the portal; check it there before retrying"
+        return {"success": False, "duplicate": True, "bill_status": record["status"], "error": error}
+
+    def stored_bill(self, username, invoice_data):
+        """Answer from the bill store when this document was already generated (or is being), else None."""
+        if self.bill_store is None:
+            return None
+        record = self.bill_store.get(username, invoice_data.get("doc_no"))
+        if record is None or record["status"] == FAILED:
+            return None
+        return self._stored_result(record)
+
+    def submit_bill(self, invoice_data=None):
+        """confirm_and_submit for the previewed invoice, claimed in the bill store first and recorded after."""
+        invoice_data = invoice_data or self.previewed_invoice
+        if self.bill_store is None or invoice_data is None:
+            return self.confirm_and_submit()
+        doc_no = invoice_data.get("doc_no")
+        known_ewb_no = None
+        if self.checkpoint == "submitted":
+            # generated already but the print failed: run only the print step again
+            known_ewb_no = (self.bill_store.get(self.portal_user, doc_no) or {}).get("ewb_no")
+            res = self.confirm_and_submit({"ewb_no": known_ewb_no})
+        else:
+            blocking = self.bill_store.claim(self.portal_user, doc_no)
+            if blocking:
+                return self._stored_result(blocking)
+            res = self.confirm_and_submit()
+
+        ewb_no = res.get("ewb_no") or known_ewb_no
+        if res.get("success") or ewb_no:
+            status = GENERATED
+        elif res.get("outcome_unknown") or res.get("last_checkpoint", self.checkpoint) in ("submitted", "printed"):
+            # submit went through (only the print failed) or may have: never FAILED, that would allow a resubmit
+            status = UNKNOWN
+        else:
+            status = FAILED
+        self.bill_store.record(self.portal_user, doc_no, status, ewb_no=ewb_no,
+                               pdf_name=res.get("pdf_name"), pdf_path=res.get("pdf_path"), error=res.get("error"))
+        # previewed_invoice stays set: a retried submit is answered from the store
+        return res
+
+    # ---------- SESSION REUSE ----------
+    def resume_session(self, username):
+        """Try to skip the captcha login by reusing the stored cookies for username."""
+        if self.cookie_store is None:
+            return False
+        cookies = self.cookie_store.get(username)
+        if not cookies:
+            return False
+        try:
+            ok = self.restore_session(cookies)
+        except Exception:
+            logger.warning("Restoring portal session failed", exc_info=True)
+            ok = False
+        if ok:
+            self.cookie_store.mark_reused(username)
+            logger.info("GSTService: reused portal session for %s, captcha skipped", username)
+            return True
+        self.cookie_store.invalidate(username)
+        RETRIES.inc(kind="resume_session")
+        return False
+
+    # ---------- MASTER FLOW ----------
+    def create_eway_bill(self, credentials, invoice_data, session_id, auto_submit=False):
+        answered = self.check_invoice(invoice_data) or self.stored_bill(credentials["username"], invoice_data)
+        if answered:
+            return answered
+
+        login_result = self.ensure_logged_in(credentials)
+        if not login_result.get("success"):
+            return login_result
+
+        result = self.generate_bill(invoice_data, session_id, auto_submit=auto_submit)
+        self._after_bill(credentials, result)
+        return result
+
+    def ensure_logged_in(self, credentials):
+        """Skip the captcha login when this engine already holds a live portal session."""
+        self.portal_user = credentials["username"]
+        if self.logged_in:
+            return {"success": True, "reused_session": True}
+        age = self.captcha_age()
+        result = self.login(credentials["username"], credentials["password"], credentials["captcha"])
+        if age is not None:
+            CAPTCHA_AGE_SECONDS.observe(age, outcome="success" if result.get("success") else "failure")
+        if result.get("success"):
+            # spent: the next login (after a logout) needs the captcha of a new login page
+            self.forget_captcha()
+        else:
+            reason = "captcha" if classify_login_error(result.get("error")) == REJECTED else "other"
+            LOGIN_FAILURES.inc(reason=reason)
+        return result
+
+    def _after_bill(self, credentials, result):
+        if result.get("session_expired"):
+            self.session_expired(credentials["username"])
+        elif self.cookie_store is not None:
+            self.cookie_store.touch(credentials["username"])
+
+    # ---------- CHECKPOINTED STEPS ----------
+    def run_steps(self, steps, context):
+        """
+        Run the (checkpoint, fn) steps that come after self.checkpoint; fn(context)
+        returns a step result. A failed step is not simply repeated: locate() first
+        checks where the browser really is. A step that went through after all is
+        picked up from the page (recover_step), otherwise the flow resumes from the
+        furthest checkpoint the page still proves, after a bounded backoff. A live
+        session is never logged into again and a loaded form never re-navigated.
+        """
+        result = {"success": True}
+        retries = 0
+        while True:
+            pending = [(cp, fn) for cp, fn in steps if _order(cp) > _order(self.checkpoint)]
+            if not pending:
+                return result
+            checkpoint, fn = pending[0]
+            res = fn(context)
+            if res.get("success"):
+                self.checkpoint = checkpoint
+                context.update(res)
+                result.update(res)
+                continue
+
+            where = self.locate()
+            logger.info("Step %s failed (%s), browser is at %s", checkpoint, res.get("error"), where)
+            if where == "login":
+                # last_checkpoint: a bill submitted before the logout must not be treated as never sent
+                expired = {"success": False, "error": "Portal session expired", "session_expired": True,
+                           "last_checkpoint": self.checkpoint}
+                self.checkpoint = None
+                return dict(result, **{**res, **expired})
+            reached = LOCATION_CHECKPOINTS.get(where)
+            if reached is not None and _order(reached) >= _order(checkpoint):
+                # the step landed (late page, lost response): take its result from the page
+                recovered = self.recover_step(checkpoint, context)
+                if recovered.get("success"):
+                    RETRIES.inc(kind="step_recovered")
+                    self.checkpoint = checkpoint
+                    context.update(recovered)
+                    result.update(recovered)
+                    continue
+            if reached is None or checkpoint in NO_RETRY or retries >= Config.STEP_RETRIES:
+                return dict(result, **res)
+
+            # resume from the step before the failed one, or further back if the page moved
+            previous = CHECKPOINTS[_order(checkpoint) - 1]
+            self.checkpoint = reached if _order(reached) < _order(previous) else previous
+            time.sleep(min(Config.STEP_RETRY_BACKOFF * 2 ** retries, Config.STEP_RETRY_BACKOFF_MAX))
+            retries += 1
+            RETRIES.inc(kind="step")
+            logger.info("Retrying from checkpoint %s (retry %d)", self.checkpoint, retries)
+            self.clear_page_state()
+
+    def _navigate_step(self, context):
+        if self.navigate_to_bill_generation():
+            return {"success": True}
+        return {"success": False, "error": "Failed to load Bill Generation page"}
+
+    def bill_steps(self):
+        return [
+            ("on_bill_page", self._navigate_step),
+            ("consignor_filled", lambda ctx: self.fill_consignor_details(ctx["invoice"])),
+            ("previewed", lambda ctx: self.fill_invoice_and_preview(ctx["invoice"], ctx["session_id"],
+                                                                    image_name=ctx["image_name"])),
+        ]
+
+    def generate_bill(self, invoice_data, session_id, auto_submit=False, image_name="preview"):
+        """Post-login part of the flow: navigate -> consignor -> invoice + preview -> (submit -> print)."""
+        context = {"invoice": invoice_data, "session_id": session_id, "image_name": image_name}
+        steps = self.bill_steps()
+        self.checkpoint = "logged_in"
+        res = self.run_steps(steps[:1], context)
+        if not res.get("success"):
+            return res
+        if self.refresh_master_data():
+            # the invoice was checked against the old copy; the portal's own lists win
+            rejected = self.check_invoice(invoice_data)
+            if rejected:
+                return rejected
+
+        preview_res = self.run_steps(steps, context)
+        if not preview_res.get("success"):
+            return preview_res
+        self.previewed_invoice = invoice_data
+
+        if auto_submit:
+            return self.submit_bill(invoice_data)
+
+        return preview_res
+
+    def confirm_and_submit(self, context=None):
+        """Submit the previewed bill and print it; a failed print is retried without submitting again."""
+        if self.checkpoint not in ("previewed", "submitted"):
+            return {"success": False, "error": "No previewed bill to submit"}
+        steps = [
+            ("submitted", lambda ctx: self.submit_form()),
+            ("printed", lambda ctx: self.print_bill(ctx.get("ewb_no"))),
+        ]
+        return self.run_steps(steps, context or {})
+
+    # ---------- BATCH FLOW ----------
+    def create_eway_bills(self, credentials, invoices, session_id, progress=None):
+        """
+        Login once and generate + submit a bill for every invoice on the same session.
+
+        A failing invoice is recorded and the batch moves on to the next one; only a lost
+        portal session stops it (remaining invoices are reported as not attempted).
+        Invoices that fail local validation or were already generated are answered
+        without touching the portal (and no login happens when that covers all of them).
+        progress(done, total, result) is called after every invoice.
+        Returns {"success": ..., "results": [...], "succeeded": n, "failed": n}.
+        """
+        invoices = list(invoices)
+        total = len(invoices)
+        username = credentials["username"]
+        answered = [self.check_invoice(invoice) or self.stored_bill(username, invoice) for invoice in invoices]
+
+        if any(a is None for a in answered):
+            login_result = self.ensure_logged_in(credentials)
+            if not login_result.get("success"):
+                return {"success": False, "error": login_result.get("error"), "results": [], "succeeded": 0, "failed": 0}
+
+        results = []
+        expired = False
+        for index, invoice in enumerate(invoices):
+            doc_no = invoice.get("doc_no")
+            # re-checked in turn: an earlier invoice may have refreshed the master data
+            # or generated the same document
+            result = answered[index] or self.check_invoice(invoice) or self.stored_bill(username, invoice)
+            if result is None and expired:
+                result = {"success": False, "error": "Not attempted: portal session expired"}
+            elif result is None:
+                self.clear_page_state()
+                try:
+                    result = self.generate_bill(invoice, session_id, auto_submit=True, image_name=f"preview-{index}")
+                except Exception as e:
+                    logger.exception("Batch invoice %s failed", doc_no)
+                    result = {"success": False, "error": str(e)}
+                expired = bool(result.get("session_expired"))
+                self._after_bill(credentials, result)
+
+            result = dict(result, index=index, doc_no=doc_no)
+            results.append(result)
+            logger.info("Batch %s: %d/%d doc_no=%s success=%s", session_id, index + 1, total, doc_no, result["success"])
+            if progress:
+                progress(index + 1, total, result)
+
+        succeeded = sum(1 for r in results if r["success"])
+        return {
+            "success": succeeded == total,
+            "results": results,
+            "succeeded": succeeded,
+            "failed": total - succeeded,
+        }
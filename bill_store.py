@@ -0,0 +1,195 @@
+import os, time, atexit, sqlite3, logging, threading
+
+logger = logging.getLogger("BillStore")
+
+# a bill is claimed (durably) right before the portal's submit button is pressed
+IN_PROGRESS = "in_progress"
+GENERATED = "generated"
+FAILED = "failed"        # the portal rejected the bill or submit was never pressed: safe to retry
+UNKNOWN = "unknown"      # submit was pressed but no answer came back: check the portal before retrying
+
+# statuses that stop a new submission of the same document
+BLOCKING = (IN_PROGRESS, GENERATED, UNKNOWN)
+
+FIELDS = ("gstin", "doc_no", "status", "ewb_no", "pdf_name", "pdf_path", "error", "created_at", "updated_at")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bills (
+    gstin TEXT NOT NULL,
+    doc_no TEXT NOT NULL,
+    status TEXT NOT NULL,
+    ewb_no TEXT,
+    pdf_name TEXT,
+    pdf_path TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (gstin, doc_no)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bills_ewb_no ON bills (ewb_no);
+"""
+
+_UPSERT = """
+INSERT INTO bills (gstin, doc_no, status, ewb_no, pdf_name, pdf_path, error, created_at, updated_at)
+VALUES (:gstin, :doc_no, :status, :ewb_no, :pdf_name, :pdf_path, :error, :created_at, :updated_at)
+ON CONFLICT (gstin, doc_no) DO UPDATE SET
+    status = excluded.status, ewb_no = excluded.ewb_no, pdf_name = excluded.pdf_name,
+    pdf_path = excluded.pdf_path, error = excluded.error, updated_at = excluded.updated_at
+"""
+
+
+def bill_key(gstin, doc_no):
+    # doc_no may arrive as a number (JSON bodies, CSV rows typed by a spreadsheet)
+    return str(gstin or "").strip().upper(), str(doc_no or "").strip().upper()
+
+
+class BillStore:
+    """
+    Durable (GSTIN, doc_no) -> e-way bill record, so a retried submit is answered
+    from here instead of generating a second EWB for the same invoice.
+
+    SQLite in WAL mode, shared by every worker process. Claims are committed
+    before the submit button is pressed (they are what prevents a duplicate if
+    the process dies mid-submit); outcomes are queued and written in batches
+    every flush_interval seconds or batch_size records, and lookups see queued
+    records before they reach the file.
+    """
+
+    def __init__(self, path, flush_interval=0.5, batch_size=100):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = {}            # key -> record not yet written
+        self._wake = threading.Event()
+        self._closed = False
+        self.stats = {"lookups": 0, "hits": 0, "claims": 0, "blocked": 0, "written": 0, "flushes": 0}
+        self._flusher = threading.Thread(target=self._flush_loop, name="bill-store-flush", daemon=True)
+        self._flusher.start()
+        # queued outcomes must reach the file even when the process just exits
+        atexit.register(self.close)
+
+    # ---------- reads ----------
+    def _get(self, key):
+        record = self._pending.get(key)
+        if record is not None:
+            return dict(record)
+        row = self._db.execute("SELECT * FROM bills WHERE gstin = ? AND doc_no = ?", key).fetchone()
+        return dict(row) if row else None
+
+    def get(self, gstin, doc_no):
+        """The stored record for this document, or None."""
+        with self._lock:
+            self.stats["lookups"] += 1
+            record = self._get(bill_key(gstin, doc_no))
+            if record is not None:
+                self.stats["hits"] += 1
+            return record
+
+    # ---------- writes ----------
+    def claim(self, gstin, doc_no):
+        """
+        Mark the document in progress before submitting it. Returns None when the
+        caller may submit, else the existing record that blocks it.
+        """
+        key = bill_key(gstin, doc_no)
+        now = time.time()
+        with self._lock:
+            record = self._get(key)
+            if record is not None and record["status"] in BLOCKING:
+                self.stats["blocked"] += 1
+                return record
+            queued = self._pending.pop(key, None)
+            # BEGIN IMMEDIATE so two worker processes can't both claim the same document
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT status FROM bills WHERE gstin = ? AND doc_no = ?", key).fetchone()
+                # a queued outcome of our own is newer than the row it is about to replace
+                if queued is None and row is not None and row["status"] in BLOCKING:
+                    self._db.execute("COMMIT")
+                    self.stats["blocked"] += 1
+                    return self._get(key)
+                self._db.execute(_UPSERT, self._record(key, IN_PROGRESS, now, created_at=now))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self.stats["claims"] += 1
+        return None
+
+    def record(self, gstin, doc_no, status, ewb_no=None, pdf_name=None, pdf_path=None, error=None):
+        """Queue the outcome of a claimed submission; written with the next batch."""
+        key = bill_key(gstin, doc_no)
+        now = time.time()
+        with self._lock:
+            previous = self._get(key) or {}
+            self._pending[key] = self._record(key, status, now, previous.get("created_at") or now,
+                                              ewb_no=ewb_no, pdf_name=pdf_name, pdf_path=pdf_path, error=error)
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    def forget(self, gstin, doc_no):
+        """Drop a record (e.g. an UNKNOWN one after checking the portal by hand). Generated bills are kept."""
+        key = bill_key(gstin, doc_no)
+        with self._lock:
+            record = self._get(key)
+            if record is None or record["status"] == GENERATED:
+                return False
+            self._pending.pop(key, None)
+            self._db.execute("DELETE FROM bills WHERE gstin = ? AND doc_no = ?", key)
+            return True
+
+    @staticmethod
+    def _record(key, status, updated_at, created_at, **fields):
+        record = dict.fromkeys(FIELDS)
+        record.update(fields, gstin=key[0], doc_no=key[1], status=status,
+                      created_at=created_at, updated_at=updated_at)
+        return record
+
+    # ---------- batching ----------
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return 0
+            records = list(self._pending.values())
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(_UPSERT, records)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._pending.clear()
+            self.stats["written"] += len(records)
+            self.stats["flushes"] += 1
+            return len(records)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.warning("Writing bill records failed, will retry", exc_info=True)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM bills GROUP BY status").fetchall())
+            return dict(self.stats, pending=len(self._pending), bills=counts)
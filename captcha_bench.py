@@ -0,0 +1,136 @@
+"""
+Replay the collected captcha dataset through CaptchaSolver variants and report
+accuracy, p50/p99 latency and throughput.
+
+    python captcha_bench.py [dataset] [--solvers preprocess,local,remote,combined]
+                            [--limit N] [--holdout 0.2] [--stub-latency 0.3] [--json]
+
+--stub-latency points the remote solver at a local captcha_stub.py server
+instead of the real providers, to measure client overhead and racing.
+"""
+import sys, json, time, random, argparse
+from config import Config
+from captcha_dataset import CaptchaDataset
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def run_variant(name, solve, samples):
+    """solve(png) -> answer text (or None for preprocessing-only). Returns a report dict."""
+    latencies, correct, answered = [], 0, 0
+    start = time.perf_counter()
+    for png, label in samples:
+        t0 = time.perf_counter()
+        try:
+            answer = solve(png)
+        except Exception as e:
+            print(f"⚠️ {name}: solver raised {e}")
+            answer = None
+        latencies.append(time.perf_counter() - t0)
+        if answer is not None:
+            answered += 1
+            correct += int(answer.strip().upper() == label.upper())
+    elapsed = time.perf_counter() - start
+    return {
+        "solver": name,
+        "samples": len(latencies),
+        "answered": answered,
+        "accuracy": correct / answered if answered else None,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "throughput_per_s": len(latencies) / elapsed if elapsed else None,
+    }
+
+
+def build_solvers(names, train, remote_service=None):
+    from captcha_solver import CaptchaSolver
+    from local_captcha import LocalCaptchaRecognizer
+
+    solvers = {}
+    if "preprocess" in names:
+        def preprocess(png):
+            CaptchaSolver.clean_captcha_image(png)
+            return None
+        solvers["preprocess"] = preprocess
+    if "local" in names or "combined" in names:
+        if train:
+            # train on the non-holdout part so accuracy isn't measured on seen samples
+            model = LocalCaptchaRecognizer(k=Config.LOCAL_CAPTCHA_K).fit(
+                (CaptchaSolver.clean_captcha_image(png), label) for png, label in train
+            )
+            CaptchaSolver._local_model = model
+        else:
+            model = CaptchaSolver.local_model()
+        if "local" in names:
+            if model is None:
+                print("⚠️ No local captcha model, skipping 'local'")
+            else:
+                solvers["local"] = lambda png: model.predict(CaptchaSolver.clean_captcha_image(png))[0]
+    if "remote" in names:
+        if remote_service is not None:
+            solvers["remote"] = lambda png: (remote_service.solve(png) or {}).get("text")
+        else:
+            solvers["remote"] = CaptchaSolver().solve_captcha_with_gemini
+    if "combined" in names:
+        combined = CaptchaSolver()
+        solvers["combined"] = lambda png: combined.solve_captcha(png).get("text")
+    return solvers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Captcha solver accuracy/latency benchmark")
+    parser.add_argument("dataset", nargs="?", default=Config.CAPTCHA_DATASET_PATH)
+    parser.add_argument("--solvers", default="preprocess,local")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--holdout", type=float, default=0.0,
+                        help="fraction of samples held out for testing; the rest trains the local model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stub-latency", type=float, default=None,
+                        help="race the remote solver against a local stub server with this latency")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    dataset = CaptchaDataset(args.dataset)
+    samples = list(dataset.labelled())
+    if not samples:
+        print(f"❌ No labelled samples in {args.dataset}")
+        return 1
+    train = None
+    if args.holdout:
+        random.Random(args.seed).shuffle(samples)
+        cut = int(len(samples) * (1 - args.holdout))
+        train, samples = samples[:cut], samples[cut:]
+    if args.limit:
+        samples = samples[:args.limit]
+
+    names = [n.strip() for n in args.solvers.split(",") if n.strip()]
+    remote_service = None
+    if args.stub_latency is not None:
+        from captcha_stub import start_stub
+        from remote_captcha import RemoteCaptchaService, HttpProvider
+
+        _, url = start_stub(latency=args.stub_latency)
+        remote_service = RemoteCaptchaService([HttpProvider(url + "/solve", Config.REMOTE_CAPTCHA_TIMEOUT)],
+                                              timeout=Config.REMOTE_CAPTCHA_TIMEOUT)
+    solvers = build_solvers(names, train, remote_service)
+    reports = [run_variant(name, solve, samples) for name, solve in solvers.items()]
+
+    if args.json:
+        print(json.dumps({"dataset": dataset.summary(), "reports": reports}, indent=2))
+        return 0
+    print(f"Dataset {args.dataset}: {dataset.summary()}, testing on {len(samples)} samples")
+    print(f"{'solver':<12}{'accuracy':>10}{'p50 ms':>10}{'p99 ms':>10}{'per sec':>10}")
+    for r in reports:
+        acc = f"{r['accuracy'] * 100:.1f}%" if r["accuracy"] is not None else "-"
+        print(f"{r['solver']:<12}{acc:>10}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_per_s']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import os, time, struct, logging, threading
+
+logger = logging.getLogger("CaptchaDataset")
+
+# outcome of the login the captcha answer was used for
+CORRECT = 1      # login went through: the typed answer is the true label
+REJECTED = 0     # portal said the captcha was wrong
+UNKNOWN = 2      # login failed for another reason (password, portal error, ...)
+
+# record: png length, unix time, outcome, answer length | answer bytes | png bytes
+_HEADER = struct.Struct("<IdBB")
+
+
+def classify_login_error(message):
+    """Map an alert / lblError text from a failed login to REJECTED or UNKNOWN."""
+    return REJECTED if message and "captcha" in message.lower() else UNKNOWN
+
+
+class CaptchaDataset:
+    """
+    Append-only binary file of (captcha PNG, answer, outcome) samples collected
+    from real logins. One file, no per-sample files, safe to append from
+    several sessions at once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, png, answer, outcome):
+        if not png or not answer:
+            return
+        data = answer.encode("utf-8")[:255]
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        record = _HEADER.pack(len(png), time.time(), outcome, len(data)) + data + bytes(png)
+        # one append per record, so worker processes sharing the file don't interleave
+        with self._lock, open(self.path, "ab") as f:
+            f.write(record)
+
+    def __iter__(self):
+        """Yield dicts {"png", "answer", "outcome", "ts"} in recording order."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return
+                png_len, ts, outcome, answer_len = _HEADER.unpack(header)
+                answer = f.read(answer_len).decode("utf-8", "replace")
+                png = f.read(png_len)
+                if len(png) < png_len:
+                    logger.warning("Truncated record at end of %s", self.path)
+                    return
+                yield {"png": png, "answer": answer, "outcome": outcome, "ts": ts}
+
+    def labelled(self):
+        """Only samples whose answer is known to be right: (png, label)."""
+        for sample in self:
+            if sample["outcome"] == CORRECT:
+                yield sample["png"], sample["answer"]
+
+    def summary(self):
+        counts = {CORRECT: 0, REJECTED: 0, UNKNOWN: 0}
+        for sample in self:
+            counts[sample["outcome"]] = counts.get(sample["outcome"], 0) + 1
+        return {"correct": counts[CORRECT], "rejected": counts[REJECTED], "unknown": counts[UNKNOWN]}
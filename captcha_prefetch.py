@@ -0,0 +1,33 @@
+"""
+Captcha prefetching: a login page's captcha is captured (and, with
+Config.CAPTCHA_PRESOLVE, solved) while the browser or session holding it is
+idle, so a user asking for a captcha gets one straight from memory.
+"""
+import time, logging, threading
+from config import Config
+
+logger = logging.getLogger("CaptchaPrefetch")
+
+_solver = None
+_solver_lock = threading.Lock()
+
+
+def presolve(png):
+    """CaptchaSolver answer for a prefetched captcha, or None (pre-solving off, no answer, solver error)."""
+    global _solver
+    if not Config.CAPTCHA_PRESOLVE or not png:
+        return None
+    try:
+        with _solver_lock:
+            if _solver is None:
+                from captcha_solver import CaptchaSolver  # optional cv2/genai backends
+                _solver = CaptchaSolver()
+        return _solver.solve_captcha(png).get("text") or None
+    except Exception:
+        logger.warning("Pre-solving a captcha failed", exc_info=True)
+        return None
+
+
+def prefetched_captcha(png, answer=None, captured_at=None):
+    """What DriverPool keeps next to a parked driver: the captcha on its login page."""
+    return {"png": png, "answer": answer, "captured_at": captured_at or time.time()}
@@ -1,6 +1,4 @@
 from flask import Flask, render_template_string, request, jsonify, send_file
-from selenium import webdriver
-from selenium.webdriver.common.by import By
 import threading, time, os
 
 app = Flask(__name__)
@@ -16,22 +14,35 @@ login_status = {"success": False, "message": ""}
 os.makedirs("static", exist_ok=True)
 
 # ------------------ Selenium Driver Setup ------------------
-options = webdriver.ChromeOptions()
-options.add_argument("--no-sandbox")
-options.add_argument("--disable-dev-shm-usage")
-options.add_argument("--window-size=1920,1080")
-options.add_argument("--disable-blink-features=AutomationControlled")
-options.add_argument("--start-maximized")
-options.add_experimental_option("excludeSwitches", ["enable-automation"])
-options.add_experimental_option('useAutomationExtension', False)
-options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                     "AppleWebKit/537.36 (KHTML, like Gecko) "
-                     "Chrome/122.0.0.0 Safari/537.36")
-
-print("🚀 Creating driver now...")
-driver = webdriver.Chrome(options=options)
-driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-print("✅ Driver created successfully")
+# created on the first /start_login, not at import: the server answers before Chrome is up
+driver = None
+driver_lock = threading.Lock()
+
+
+def get_driver():
+    global driver
+    with driver_lock:
+        if driver is not None:
+            return driver
+        from selenium import webdriver
+
+        options = webdriver.ChromeOptions()
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--disable-blink-features=AutomationControlled")
+        options.add_argument("--start-maximized")
+        options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        options.add_experimental_option('useAutomationExtension', False)
+        options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                             "AppleWebKit/537.36 (KHTML, like Gecko) "
+                             "Chrome/122.0.0.0 Safari/537.36")
+
+        print("🚀 Creating driver now...")
+        driver = webdriver.Chrome(options=options)
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        print("✅ Driver created successfully")
+        return driver
 # ------------------------------------------------------------
 
 HTML_TEMPLATE = """<!DOCTYPE html>
@@ -125,6 +136,13 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 
 def login_with_retry(username, password):
     global captcha_text, login_status
+    from selenium.webdriver.common.by import By
+
+    try:
+        driver = get_driver()
+    except Exception as e:
+        login_status["message"] = f"❌ Could not start the browser: {e}"
+        return False
 
     print("🌍 Navigating to eWayBill login page...")
     driver.get("https://ewaybillgst.gov.in/login.aspx")
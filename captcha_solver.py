@@ -1,27 +1,54 @@
-import os
-from google import genai
-from google.genai import types
+import os, logging
 from config import Config
-from google.api_core import exceptions as api_exceptions
-import cv2
-import numpy as np
+from remote_captcha import get_remote_service
+from metrics import span, CAPTCHA_SOLVE_SECONDS
+# the local recognizer needs opencv-python + numpy; without them only the remote solvers run
+try:
+    import cv2
+    import numpy as np
+    from local_captcha import LocalCaptchaRecognizer
+    LOCAL_SOLVER_ERROR = None
+except ImportError as e:
+    cv2 = np = LocalCaptchaRecognizer = None
+    LOCAL_SOLVER_ERROR = str(e)
+
+logger = logging.getLogger("CaptchaSolver")
+
 class CaptchaSolver:
+    _local_model = None
+    _warned = False
+
+    @classmethod
+    def local_model(cls):
+        """Offline k-NN recognizer, loaded once from Config.LOCAL_CAPTCHA_MODEL_PATH (None if not trained)."""
+        if LocalCaptchaRecognizer is None:
+            if not cls._warned:
+                cls._warned = True
+                logger.warning("Local captcha solver unavailable (%s), using remote solvers only", LOCAL_SOLVER_ERROR)
+            return None
+        if cls._local_model is None and os.path.exists(Config.LOCAL_CAPTCHA_MODEL_PATH):
+            cls._local_model = LocalCaptchaRecognizer.load(Config.LOCAL_CAPTCHA_MODEL_PATH)
+        return cls._local_model
+
     @staticmethod
-    def clean_captcha_image(image_path):
+    def clean_captcha_image(image):
         """
         CAPTCHA इमेज से पतली रेखाओं और शोर को हटाता है।
         
         Args:
-            image_path (str): इनपुट इमेज फ़ाइल का पाथ।
+            image (bytes | str): PNG bytes (in-memory screenshot) या इनपुट इमेज फ़ाइल का पाथ।
         
         Returns:
             numpy.ndarray: साफ़ की गई (cleaned) इमेज।
         """
         
-        # 1. इमेज को ग्रेस्केल में लोड करें
-        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        # 1. इमेज को ग्रेस्केल में लोड करें (bytes सीधे मेमोरी से decode होते हैं, डिस्क नहीं)
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            img = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            img = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
         if img is None:
-            print(f"Error: Could not load image from {image_path}")
+            print("Error: Could not decode captcha image")
             return None
         
         # 2. बाइनराइज़ेशन (Binarization): अक्षरों को काला और बैकग्राउंड को सफ़ेद करें
@@ -45,82 +72,46 @@ class CaptchaSolver:
         return final_cleaned_img
 
     
-    # अब आप अपने Gemini कोड में इस 'processed_captcha.png' फ़ाइल का उपयोग करें
-    def solve_captcha_with_gemini(self):
-        os.environ['GEMINI_API_KEY'] = Config.API_KEY
-        try:
-            client = genai.Client()
-        except Exception as e:
-            print(f"❌ Error initializing client: {e}. Make sure GEMINI_API_KEY is set.")
-            exit()
-
-        # 2. मॉडल की प्राथमिकता सूची (Model Priority List)
-        # PRO को पहले, FLASH को दूसरे नंबर पर
-        MODEL_FALLBACK_LIST = ["gemini-2.5-flash"]
-        image_file_path = "static/captchas/captcha_live.png" 
-        output_file = "processed_captcha.png" # नई, साफ की गई फ़ाइल का नाम
-
-        processed_image = CaptchaSolver.clean_captcha_image(image_file_path)
-
-        if processed_image is not None:
-            # साफ़ की गई इमेज को सेव करें
-            cv2.imwrite(output_file, processed_image)
-            print(f"Image successfully cleaned and saved as {output_file}")
-        prompt = "The CAPTCHA image contains a 6-character alphanumeric string. Identify this exact string. Output ONLY the 6-character result, nothing else, no explanation, no quotes."
+    def solve_captcha(self, image):
+        """
+        image: PNG bytes straight from the driver screenshot (or a file path).
 
-        uploaded_file = None
-        solved_captcha = None
-        used_model = None
+        Local recognizer first; the remote Gemini solver only runs when the local
+        answer is missing or below Config.LOCAL_CAPTCHA_MIN_CONFIDENCE.
+        Returns {"text": ..., "confidence": ..., "source": "local" | "gemini"}.
+        """
+        model = CaptchaSolver.local_model()
+        text, confidence = None, 0.0
+        if model is not None:
+            with span(CAPTCHA_SOLVE_SECONDS, solver="local") as labels:
+                text, confidence = model.predict(CaptchaSolver.clean_captcha_image(image))
+                if not text or confidence < Config.LOCAL_CAPTCHA_MIN_CONFIDENCE:
+                    labels["outcome"] = "low_confidence"
+            if text and confidence >= Config.LOCAL_CAPTCHA_MIN_CONFIDENCE:
+                print(f"✅ Local captcha answer {text} (confidence {confidence:.2f})")
+                return {"text": text, "confidence": confidence, "source": "local"}
+            print(f"⚠️ Local captcha confidence too low ({confidence:.2f}), asking Gemini...")
+        remote = self.solve_captcha_with_gemini(image)
+        return {"text": remote, "confidence": None, "source": "gemini"}
 
+    # इमेज bytes सीधे (inline) भेजें: कोई upload/delete नहीं, client एक बार बनता है और सारे
+    # कॉन्फ़िगर किए गए मॉडल/providers एक साथ दौड़ते हैं, पहला सही 6-अक्षर उत्तर जीतता है
+    def solve_captcha_with_gemini(self, image):
+        if not isinstance(image, (bytes, bytearray, memoryview)):
+            with open(image, "rb") as f:
+                image = f.read()
         try:
-            # 3. फ़ाइल अपलोड करें (लोकल फ़ाइल)
-            print(f"Uploading current CAPTCHA file: {image_file_path}...")
-            uploaded_file = client.files.upload(file=image_file_path)
-            print(f"File uploaded successfully: {uploaded_file.name}")
-            
-            # 4. हर मॉडल को प्राथमिकता क्रम में आज़माएं
-            for model_name in MODEL_FALLBACK_LIST:
-                print("-" * 40)
-                print(f"🎯 Attempting to use model: **{model_name}**")
-                
-                try:
-                    # Gemini API कॉल
-                    response = client.models.generate_content(
-                        model=model_name,
-                        contents=[uploaded_file, prompt]
-                    )
-                    
-                    # यदि सफल, तो लूप तोड़ दें
-                    solved_captcha = response.text.strip()
-                    used_model = model_name
-                    break # ब्रेक करें क्योंकि हमें समाधान मिल गया है
-                    
-                except api_exceptions.ResourceExhausted as e:
-                    # यह एरर तब आती है जब कोटा (Quota) खत्म हो जाता है (HTTP 429)
-                    print(f"⚠️ Quota Exhausted for {model_name}: {e}")
-                    print("➡️ Switching to the next fallback model...")
-                    # यह अगला मॉडल (Flash) ट्राई करने के लिए लूप को जारी रखेगा
-                
-                except Exception as e:
-                    # किसी अन्य API एरर को हैंडल करें (जैसे Bad Request)
-                    print(f"❌ An error occurred with {model_name}: {e}")
-                    print("➡️ Switching to the next fallback model...")
-
-            # 5. अंतिम परिणाम प्रिंट करें
-            if solved_captcha:
-                print( f"✅ SUCCESS: Solved CAPTCHA using {used_model}: **{solved_captcha}**")
-                return solved_captcha
-            else:
-                print("❌ FAILURE: All models' quotas are exhausted or an unrecoverable error occurred.")
-                return None
-
-        except FileNotFoundError as e:
-            return str(e)
+            service = get_remote_service()
         except Exception as e:
-            return str(e)
+            print(f"❌ Error initializing remote captcha client: {e}. Make sure GEMINI_API_KEY is set.")
+            return None
 
-        finally:
-            # 6. क्लीनअप: सर्वर से फ़ाइल हटाएँ
-            if uploaded_file:
-                client.files.delete(name=uploaded_file.name)
-                print(f"\n✨ Cleanup complete: Deleted temporary file {uploaded_file.name}.")
\ No newline at end of file
+        with span(CAPTCHA_SOLVE_SECONDS, solver="remote") as labels:
+            result = service.solve(image)
+            if not result:
+                labels["outcome"] = "failure"
+        if result:
+            print(f"✅ SUCCESS: Solved CAPTCHA using {result['provider']}: **{result['text']}** ({result['latency']:.2f}s)")
+            return result["text"]
+        print("❌ FAILURE: No remote provider returned a valid answer in time.")
+        return None
@@ -0,0 +1,71 @@
+"""
+Local stand-in for remote captcha solvers, to measure RemoteCaptchaService
+latency/racing without network or quota.
+
+    python captcha_stub.py --port 5199 --latency 0.3 --answer AB12CD
+
+Serves POST /solve (HttpProvider, answers {"text": ...}) and the Gemini
+POST /v1beta/models/<model>:generateContent shape, so a real genai client
+can be pointed at it with Config.GEMINI_BASE_URL=http://127.0.0.1:5199.
+"""
+import sys, json, time, random, argparse, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+    answer = "AB12CD"
+    fail_rate = 0.0
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.fail_rate:
+            return self._reply(503, {"error": "injected failure"})
+        if self.path.startswith("/solve"):
+            return self._reply(200, {"text": self.answer})
+        if ":generateContent" in self.path:
+            return self._reply(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": self.answer}]}, "finishReason": "STOP"}],
+            })
+        self._reply(404, {"error": "unknown path"})
+
+
+def start_stub(port=0, latency=0.0, jitter=0.0, answer="AB12CD", fail_rate=0.0):
+    """Start the stub in a background thread; returns (server, base_url)."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "latency": latency, "jitter": jitter, "answer": answer, "fail_rate": fail_rate,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local remote-captcha stub server")
+    parser.add_argument("--port", type=int, default=5199)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--answer", default="AB12CD")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = start_stub(args.port, args.latency, args.jitter, args.answer, args.fail_rate)
+    print(f"🧪 Captcha stub listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
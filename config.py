@@ -4,18 +4,140 @@ class Config:
     # Flask settings
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     
+    # E-way bill portal (point at a local fake portal for testing)
+    PORTAL_BASE_URL = os.environ.get('PORTAL_BASE_URL', 'https://ewaybillgst.gov.in').rstrip('/')
+
+    # Automation engine: 'selenium' (Chrome) or 'http' (direct ASP.NET form posts,
+    # falls back to selenium when the portal pages can't be handled)
+    ENGINE = os.environ.get('GST_ENGINE', 'selenium')
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 32))
+    HTTP_TIMEOUT = 20
+    # ASP.NET page method the bill form calls to look up a GSTIN's trade name
+    HTTP_GSTIN_LOOKUP_METHOD = os.environ.get('HTTP_GSTIN_LOOKUP_METHOD', 'GetGSTINDetails')
+
     # Selenium settings
-    CHROME_HEADLESS = True
+    CHROME_HEADLESS = os.environ.get('CHROME_HEADLESS', '1').lower() not in ('0', 'false', 'no')
+    # 'lean' turns off unneeded Chrome features and blocks images, fonts and trackers;
+    # 'full' is the old profile (everything loads), kept for comparison and debugging
+    CHROME_PROFILE = os.environ.get('CHROME_PROFILE', 'lean')
+    # the captcha is the one image the automation needs: patterns matching it are never blocked
+    # (a pattern found blocking the login page's actual captcha src is dropped at runtime too)
+    CAPTCHA_URL = os.environ.get('CAPTCHA_URL', f'{PORTAL_BASE_URL}/Captcha.aspx')
+    CHROME_BLOCKED_URLS = [
+        '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp', '*.bmp',
+        '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+        '*fonts.googleapis.com*', '*fonts.gstatic.com*',
+        '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+        '*facebook.net*', '*hotjar.com*', '*clarity.ms*',
+    ]
+    # chromedriver binary; empty = look it up once (PATH, then webdriver-manager) and cache the
+    # result in CHROMEDRIVER_CACHE_PATH so later cold starts skip the lookup (a cached driver that
+    # fails to start Chrome, e.g. after a Chrome upgrade, is dropped and looked up again)
+    CHROMEDRIVER_PATH = os.environ.get('CHROMEDRIVER_PATH', '')
+    CHROMEDRIVER_CACHE_PATH = os.environ.get('CHROMEDRIVER_CACHE_PATH', 'data/chromedriver.path')
     PAGE_LOAD_TIMEOUT = 30
     IMPLICIT_WAIT = 10
+
+    # Driver pool settings (browsers kept launched and parked on Login.aspx)
+    DRIVER_POOL_MIN = int(os.environ.get('DRIVER_POOL_MIN', 1))
+    DRIVER_POOL_MAX = int(os.environ.get('DRIVER_POOL_MAX', 4))
+    DRIVER_POOL_ACQUIRE_TIMEOUT = 60
+    DRIVER_POOL_MAX_PARK_SECONDS = 600
+    # launch the pooled browsers (and look up chromedriver) in the background right after the
+    # HTTP port is up; 0 = launch them on first use (e.g. GST_ENGINE=http deployments)
+    WARM_START = os.environ.get('WARM_START', '1').lower() not in ('0', 'false', 'no')
+
+    # Wait engine: 'condition' finishes each step as soon as the portal is ready,
+    # 'fixed' restores the old time.sleep pacing as a fallback
+    WAIT_MODE = os.environ.get('WAIT_MODE', 'condition')
+    # Bill form entry: 'batch' sets every field in one execute_script (with the change/blur
+    # events the portal listens to), 'keys' types field by field like before
+    FORM_FILL_MODE = os.environ.get('FORM_FILL_MODE', 'batch')
+    WAIT_POLL_INTERVAL = 0.1
+    # a failed bill step is retried (after checking where the browser is) up to STEP_RETRIES
+    # times per flow, waiting STEP_RETRY_BACKOFF seconds, doubled each time, capped at the max
+    STEP_RETRIES = int(os.environ.get('STEP_RETRIES', 2))
+    STEP_RETRY_BACKOFF = 1.0
+    STEP_RETRY_BACKOFF_MAX = 8.0
+    STEP_TIMEOUT_DEFAULT = 10
+    STEP_TIMEOUTS = {
+        'login_result': 10,       # alert, MainMenu.aspx redirect or lblError
+        'bill_form': 15,          # bill generation form usable
+        'gstin_lookup': 8,        # AJAX lookup fills the trade name
+        'invoice_form': 10,       # item row rendered
+        'tax_recalc': 5,          # tax totals recalculated after amount/rate change
+        'preview': 15,            # preview panel rendered (submit button shown)
+        'submit_alert': 3,        # confirmation alerts after submit
+        'print_link': 15,         # printOnlyDiv() link rendered
+        'print_ready': 10,        # printOnlyDiv() swapped the page to the EWB
+        'print_images': 5,        # images unblocked for the PDF finished loading
+    }
     
+    # in-memory captcha/preview images kept per automator
+    IMAGE_CACHE_MAX = 8
+    # generated EWB PDFs, one file per bill, served by /download/<filename>
+    PDF_DIR = os.path.abspath(os.environ.get('PDF_DIR', 'downloads'))
+
+    # portal master data (state list, IGST rates) used to validate invoices before any
+    # browser work; re-read from the bill page once the cached copy is older than the TTL
+    MASTER_DATA_PATH = os.environ.get('MASTER_DATA_PATH', 'data/master_data.json')
+    MASTER_DATA_TTL_HOURS = float(os.environ.get('MASTER_DATA_TTL_HOURS', 24))
+
+    # generated bills by (GSTIN, doc_no): a retried submit is answered from here, never resubmitted
+    BILL_STORE_PATH = os.environ.get('BILL_STORE_PATH', 'data/bills.sqlite3')
+    BILL_STORE_FLUSH_SECONDS = 0.5
+
     # CAPTCHA settings
     CAPTCHA_MAX_RETRIES = 3
     CAPTCHA_SOLVE_TIMEOUT = 30
+    # captcha prefetching: parked browsers and idle logged-out sessions keep a captured captcha
+    # in memory, re-captured every CAPTCHA_REFRESH_SECONDS (well before the portal expires it);
+    # CAPTCHA_PRESOLVE also runs CaptchaSolver on it ahead of time and offers the answer
+    CAPTCHA_PREFETCH = os.environ.get('CAPTCHA_PREFETCH', '1').lower() in ('1', 'true', 'yes')
+    CAPTCHA_REFRESH_SECONDS = float(os.environ.get('CAPTCHA_REFRESH_SECONDS', 300))
+    CAPTCHA_REFRESH_TICK_SECONDS = 15
+    CAPTCHA_PRESOLVE = os.environ.get('CAPTCHA_PRESOLVE', '0').lower() in ('1', 'true', 'yes')
+    # offline k-NN recognizer (train with: python local_captcha.py <labelled_dir>)
+    LOCAL_CAPTCHA_MODEL_PATH = os.environ.get('LOCAL_CAPTCHA_MODEL_PATH', 'models/captcha_knn.npz')
+    LOCAL_CAPTCHA_K = 3
+    LOCAL_CAPTCHA_MIN_CONFIDENCE = 0.85
+    # remote solvers, raced concurrently (first well-formed answer wins)
+    GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+    GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL', '')   # e.g. captcha_stub.py for local testing
+    REMOTE_CAPTCHA_MODELS = [m for m in os.environ.get('REMOTE_CAPTCHA_MODELS', 'gemini-2.5-flash').split(',') if m]
+    REMOTE_CAPTCHA_HTTP_URLS = [u for u in os.environ.get('REMOTE_CAPTCHA_HTTP_URLS', '').split(',') if u]
+    REMOTE_CAPTCHA_TIMEOUT = float(os.environ.get('REMOTE_CAPTCHA_TIMEOUT', 10))
+    # captcha samples collected from real logins (empty to disable collection)
+    CAPTCHA_DATASET_PATH = os.environ.get('CAPTCHA_DATASET_PATH', 'data/captchas.bin')
     
+    # Job queue settings (async create / submit flows)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+    JOB_QUEUE_MAX = int(os.environ.get('JOB_QUEUE_MAX', 100))
+    JOB_RESULT_TTL_SECONDS = 3600
+    JOB_LONG_POLL_MAX_SECONDS = 30
+
     # Session settings
     SESSION_TIMEOUT_MINUTES = 30
+    SESSION_REAPER_INTERVAL_SECONDS = 60
+    # how long an idle authenticated portal session stays usable for cookie reuse
+    PORTAL_SESSION_TTL_MINUTES = 20
+    MAX_LIVE_SESSIONS = int(os.environ.get('MAX_LIVE_SESSIONS', DRIVER_POOL_MAX))
+    # optional heartbeat keeping idle logged-in sessions alive on the portal (one cheap
+    # authenticated GET); the interval adapts to the idle timeout the portal is seen to use
+    KEEPALIVE = os.environ.get('KEEPALIVE', '0').lower() in ('1', 'true', 'yes')
+    KEEPALIVE_URL = os.environ.get('KEEPALIVE_URL', f'{PORTAL_BASE_URL}/MainMenu.aspx')
+    KEEPALIVE_MIN_SECONDS = float(os.environ.get('KEEPALIVE_MIN_SECONDS', 60))
+    KEEPALIVE_MAX_SECONDS = float(os.environ.get('KEEPALIVE_MAX_SECONDS', 600))
+    KEEPALIVE_TICK_SECONDS = 15
     
+    # Multi-process mode (python dispatcher.py): one app.py process per worker, each with its
+    # own share of the browsers (capped at DRIVER_POOL_MAX workers); WORKER_ID is encoded in
+    # session/job ids for routing
+    WORKERS = int(os.environ.get('WORKERS', os.cpu_count() or 1))
+    WORKER_ID = int(os.environ.get('WORKER_ID', 0))
+    WORKER_BASE_PORT = int(os.environ.get('WORKER_BASE_PORT', 5100))
+    DISPATCH_TIMEOUT = 600    # seconds; synchronous login/batch flows can run for minutes
+
     # Logging
     LOG_LEVEL = 'INFO'
     LOG_FILE = 'logs/automation.log'
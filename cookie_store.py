@@ -0,0 +1,79 @@
+import time, logging, threading
+
+logger = logging.getLogger("CookieStore")
+
+
+class CookieStore:
+    """
+    Authenticated portal cookie jars keyed by GSTIN username.
+
+    An entry is saved after a successful captcha login and re-injected into a
+    fresh/pooled driver so the next session can skip the captcha. The portal
+    expires idle sessions, so entries carry a sliding expiry (ttl seconds since
+    last successful use) and are dropped as soon as a probe finds them dead.
+    """
+
+    def __init__(self, ttl=1200):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "lookups": 0,
+            "reused": 0,       # login skipped thanks to a stored jar
+            "missing": 0,      # nothing stored for this user
+            "expired": 0,      # stored jar past ttl or rejected by the portal
+            "saved": 0,
+        }
+
+    def save(self, username, cookies):
+        now = time.time()
+        with self._lock:
+            self._entries[username] = {"cookies": cookies, "saved_at": now, "last_used": now}
+            self.stats["saved"] += 1
+
+    def get(self, username):
+        """Return the cookie list for username if it hasn't expired yet, else None."""
+        with self._lock:
+            self.stats["lookups"] += 1
+            entry = self._entries.get(username)
+            if entry is None:
+                self.stats["missing"] += 1
+                return None
+            if time.time() - entry["last_used"] > self.ttl:
+                self._entries.pop(username, None)
+                self.stats["expired"] += 1
+                return None
+            return entry["cookies"]
+
+    def mark_reused(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                entry["last_used"] = time.time()
+            self.stats["reused"] += 1
+
+    def touch(self, username):
+        """Slide the expiry after the portal accepted the session again."""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                entry["last_used"] = time.time()
+
+    def invalidate(self, username):
+        with self._lock:
+            if self._entries.pop(username, None) is not None:
+                self.stats["expired"] += 1
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            snap = dict(self.stats)
+            snap["entries"] = {
+                user: {
+                    "age_seconds": round(now - e["saved_at"], 1),
+                    "expires_in_seconds": round(self.ttl - (now - e["last_used"]), 1),
+                }
+                for user, e in self._entries.items()
+            }
+        snap["login_skip_rate"] = snap["reused"] / snap["lookups"] if snap["lookups"] else 0.0
+        return snap
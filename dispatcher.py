@@ -0,0 +1,199 @@
+"""
+Multi-process front for app.py.
+
+    WORKERS=4 DRIVER_POOL_MAX=16 python dispatcher.py
+
+Starts WORKERS app.py processes on WORKER_BASE_PORT + i (no more than
+DRIVER_POOL_MAX, so each has a browser), each owning a share of the browser
+pool (DRIVER_POOL_MIN/MAX and MAX_LIVE_SESSIONS are split between them so the
+shares add up to the configured totals), and proxies the public API on PORT. Session and job ids carry
+their worker ("w2-..."), so every request for a session lands on the process
+holding its browser; new sessions are spread round-robin. Stats routes and
+/api/cleanup are fanned out to every worker, /metrics is merged with a
+worker label. A worker that dies is restarted (its sessions are lost).
+"""
+import os, sys, time, logging, threading, itertools, subprocess
+import requests
+from flask import Flask, Response, jsonify, request
+from config import Config
+from routing import owner_of
+
+logger = logging.getLogger("Dispatcher")
+
+# routes answered by every worker; the dispatcher returns {"workers": {id: answer}}
+FAN_OUT = {"/api/cleanup", "/api/session-stats", "/api/pool-stats", "/api/cookie-stats", "/api/jobs-stats",
+           "/api/master-data-stats", "/api/bill-stats", "/api/startup"}
+# per-hop headers that must not be copied between the two connections
+HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+               "trailers", "transfer-encoding", "upgrade", "host", "content-length"}
+
+
+class WorkerSet:
+    """Spawns and supervises the app.py worker processes."""
+
+    def __init__(self, count, base_port):
+        self.count = count
+        self.base_port = base_port
+        self.procs = {}
+        self._rr = itertools.cycle(range(count))
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def url(self, worker_id):
+        return f"http://127.0.0.1:{self.base_port + worker_id}"
+
+    def _env(self, worker_id):
+        env = dict(os.environ)
+        # the first (total % count) workers get one more, so the shares add up to the total
+        share = lambda total: str(total // self.count + (worker_id < total % self.count))
+        env.update({
+            "WORKER_ID": str(worker_id),
+            "PORT": str(self.base_port + worker_id),
+            "DRIVER_POOL_MIN": share(Config.DRIVER_POOL_MIN),
+            "DRIVER_POOL_MAX": share(Config.DRIVER_POOL_MAX),
+            "MAX_LIVE_SESSIONS": share(Config.MAX_LIVE_SESSIONS),
+        })
+        return env
+
+    def spawn(self, worker_id):
+        app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+        proc = subprocess.Popen([sys.executable, app_path], env=self._env(worker_id))
+        self.procs[worker_id] = proc
+        print(f"🚀 Worker {worker_id} started (pid {proc.pid}) on {self.url(worker_id)}")
+
+    def start(self):
+        for worker_id in range(self.count):
+            self.spawn(worker_id)
+        threading.Thread(target=self._supervise, name="worker-supervisor", daemon=True).start()
+        return self
+
+    def _supervise(self):
+        while not self._stopping:
+            time.sleep(2)
+            for worker_id, proc in list(self.procs.items()):
+                if proc.poll() is not None and not self._stopping:
+                    logger.warning("Worker %s exited with %s, restarting", worker_id, proc.returncode)
+                    self.spawn(worker_id)
+
+    def next(self):
+        with self._lock:
+            return next(self._rr)
+
+    def stop(self):
+        self._stopping = True
+        for proc in self.procs.values():
+            proc.terminate()
+        for proc in self.procs.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def owning_worker(path, args, body):
+    """Worker named by the session/job id in the request, or None when the request isn't tied to one."""
+    parts = path.strip("/").split("/")
+    # /images/<sid>/<name>.png, /api/jobs/<job id>[/...]
+    if len(parts) >= 2 and parts[0] == "images":
+        return owner_of(parts[1])
+    if len(parts) >= 3 and parts[:2] == ["api", "jobs"]:
+        return owner_of(parts[2])
+    sid = args.get("session_id")
+    if sid is None and isinstance(body, dict):
+        sid = body.get("session_id")
+    return owner_of(sid) if sid else None
+
+
+def merge_metrics(texts):
+    """Merge Prometheus text from several workers, grouping samples by family and adding worker="<id>"."""
+    families = {}   # family name -> [header lines, sample lines]
+    for worker_id, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("# "):
+                family = line.split()[2]
+                headers = families.setdefault(family, [[], []])[0]
+                if line not in headers:
+                    headers.append(line)
+                continue
+            label = f'worker="{worker_id}"'
+            if "{" in line.split(" ", 1)[0]:
+                line = line.replace("{", "{" + label + ",", 1)
+            else:
+                name, value = line.split(" ", 1)
+                line = f"{name}{{{label}}} {value}"
+            families.setdefault(family, [[], []])[1].append(line)
+    return "\n".join(l for headers, samples in families.values() for l in headers + samples) + "\n"
+
+
+def create_app(workers):
+    app = Flask("dispatcher")
+    local = threading.local()
+
+    def http():
+        # one keep-alive connection pool per dispatcher thread
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def forward(worker_id, path):
+        resp = http().request(
+            request.method, workers.url(worker_id) + path,
+            params=request.args, data=request.get_data(),
+            headers={k: v for k, v in request.headers if k.lower() not in HOP_HEADERS},
+            stream=True, allow_redirects=False, timeout=(5, Config.DISPATCH_TIMEOUT),
+        )
+        headers = [(k, v) for k, v in resp.raw.headers.items() if k.lower() not in HOP_HEADERS]
+        return Response(resp.raw.stream(64 * 1024, decode_content=False), status=resp.status_code, headers=headers)
+
+    def fan_out(path):
+        answers = {}
+        for worker_id in range(workers.count):
+            try:
+                resp = http().request(request.method, workers.url(worker_id) + path, params=request.args, timeout=10)
+                answers[worker_id] = resp.json() if path != "/metrics" else resp.text
+            except Exception as e:
+                answers[worker_id] = {"success": False, "error": str(e)} if path != "/metrics" else ""
+        return answers
+
+    @app.route("/metrics")
+    def metrics():
+        return merge_metrics(fan_out("/metrics")), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    @app.route("/", defaults={"path": ""}, methods=["GET", "POST", "PUT", "DELETE"])
+    @app.route("/<path:path>", methods=["GET", "POST", "PUT", "DELETE"])
+    def dispatch(path):
+        path = "/" + path
+        if path in FAN_OUT:
+            return jsonify({"success": True, "workers": fan_out(path)})
+        body = request.get_json(silent=True) if request.is_json else None
+        worker_id = owning_worker(path, request.args, body)
+        if worker_id is None:
+            worker_id = workers.next()
+        elif worker_id >= workers.count:
+            return jsonify({"success": False, "error": "Invalid session"}), 404
+        try:
+            return forward(worker_id, path)
+        except requests.RequestException as e:
+            logger.warning("Worker %s unreachable: %s", worker_id, e)
+            return jsonify({"success": False, "error": f"Worker {worker_id} unavailable"}), 502
+
+    return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # every worker needs at least one browser of its own, so the pool caps the worker count
+    count = max(1, min(Config.WORKERS, Config.DRIVER_POOL_MAX, Config.MAX_LIVE_SESSIONS))
+    if count < Config.WORKERS:
+        logger.warning("WORKERS=%s exceeds the browser budget (DRIVER_POOL_MAX=%s, MAX_LIVE_SESSIONS=%s), "
+                       "starting %s workers", Config.WORKERS, Config.DRIVER_POOL_MAX, Config.MAX_LIVE_SESSIONS, count)
+    workers = WorkerSet(count, Config.WORKER_BASE_PORT).start()
+    port = int(os.environ.get("PORT", 5099))
+    print(f"🔀 Dispatching to {workers.count} workers on http://0.0.0.0:{port}")
+    try:
+        create_app(workers).run(host="0.0.0.0", port=port, debug=False, threaded=True)
+    finally:
+        workers.stop()
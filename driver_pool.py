@@ -0,0 +1,280 @@
+import time, logging, threading
+from collections import deque
+
+logger = logging.getLogger("DriverPool")
+
+
+class DriverPool:
+    """
+    Keeps Chrome drivers launched and parked on the login page so a new session
+    gets a browser in milliseconds instead of paying a full launch + page load.
+
+    factory() -> new driver, reset(driver) -> parks a driver on a clean login page.
+    min_size is the number of parked (idle) browsers we try to keep warm,
+    max_size caps the total number of browsers (idle + in use + launching).
+
+    Whatever reset() returns (the captcha it captured) is kept with the parked
+    driver and handed out once through prefetched(). With refresh_after set, a
+    background thread re-parks idle drivers older than that, so the login page
+    a new session gets is never one the portal has already expired.
+    """
+
+    def __init__(self, factory, reset, min_size=1, max_size=4, acquire_timeout=60, max_park_age=None,
+                 refresh_after=None):
+        self.factory = factory
+        self.reset = reset
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.acquire_timeout = acquire_timeout
+        self.max_park_age = max_park_age
+        self.refresh_after = refresh_after
+
+        self._idle = deque()      # (driver, parked_at)
+        self._prefetched = {}     # driver -> what reset() returned when it was parked
+        self._in_use = set()
+        self._launching = 0
+        self._recycling = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.stats = {
+            "acquired": 0,
+            "released": 0,
+            "discarded": 0,
+            "launched": 0,
+            "launch_failures": 0,
+            "acquire_timeouts": 0,
+            "refreshed": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "last_wait_seconds": 0.0,
+            "launch_seconds_total": 0.0,
+            "last_launch_seconds": 0.0,
+        }
+
+    # ---------- internals ----------
+    def _total(self):
+        return len(self._idle) + len(self._in_use) + self._launching + self._recycling
+
+    def _park(self, driver):
+        prefetched = self.reset(driver)
+        if prefetched is None:
+            self._prefetched.pop(driver, None)
+        else:
+            self._prefetched[driver] = prefetched
+
+    def _launch(self):
+        """Launch and park one driver. Caller must have reserved a slot in self._launching."""
+        start = time.monotonic()
+        driver = None
+        try:
+            driver = self.factory()
+            self._park(driver)
+        except Exception:
+            logger.exception("Failed to launch pooled driver")
+            if driver is not None:
+                self._quit(driver)
+            with self._cond:
+                self._launching -= 1
+                self.stats["launch_failures"] += 1
+                self._cond.notify_all()
+            raise
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self.stats["launched"] += 1
+            self.stats["launch_seconds_total"] += elapsed
+            self.stats["last_launch_seconds"] = elapsed
+        logger.info("🚗 Pooled driver launched in %.2fs", elapsed)
+        return driver
+
+    def _launch_into_pool(self):
+        try:
+            driver = self._launch()
+        except Exception:
+            return
+        with self._cond:
+            self._launching -= 1
+            if self._closed:
+                self._quit(driver)
+            else:
+                self._idle.append((driver, time.monotonic()))
+            self._cond.notify_all()
+
+    def _refill(self):
+        """Start background launches until min_size browsers are parked (bounded by max_size)."""
+        to_launch = 0
+        with self._cond:
+            if self._closed:
+                return
+            while len(self._idle) + self._launching < self.min_size and self._total() < self.max_size:
+                self._launching += 1
+                to_launch += 1
+        for _ in range(to_launch):
+            threading.Thread(target=self._launch_into_pool, daemon=True).start()
+
+    def _recycle(self, driver):
+        try:
+            self._park(driver)
+            ok = True
+        except Exception:
+            logger.warning("Resetting pooled driver failed, replacing it", exc_info=True)
+            ok = False
+        with self._cond:
+            self._recycling -= 1
+            parked = ok and not self._closed
+            if parked:
+                self._idle.append((driver, time.monotonic()))
+            self._cond.notify_all()
+        if not parked:
+            self._quit(driver)
+            self._refill()
+
+    def _quit(self, driver):
+        self._prefetched.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _refresh_loop(self):
+        """Re-park idle drivers whose login page is older than refresh_after, one at a time."""
+        while True:
+            time.sleep(min(self.refresh_after / 4, 30))
+            with self._cond:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                stale = [entry for entry in self._idle if now - entry[1] >= self.refresh_after]
+                for entry in stale:
+                    self._idle.remove(entry)
+                self._recycling += len(stale)
+                self.stats["refreshed"] += len(stale)
+            for driver, _ in stale:
+                self._recycle(driver)
+
+    # ---------- public API ----------
+    def start(self, warm=True):
+        """
+        Warm up min_size browsers in the background (warm=False leaves that to the
+        first acquire()) and keep their login pages fresh.
+        """
+        if warm:
+            self._refill()
+        if self.refresh_after:
+            threading.Thread(target=self._refresh_loop, name="driver-pool-refresh", daemon=True).start()
+        return self
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        driver, parked_at, launch = None, None, False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+                if self._idle:
+                    driver, parked_at = self._idle.popleft()
+                    self._in_use.add(driver)
+                    break
+                if self._total() < self.max_size:
+                    self._launching += 1
+                    launch = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats["acquire_timeouts"] += 1
+                    raise TimeoutError(f"No browser available in pool after {timeout}s")
+                self._cond.wait(remaining)
+
+        if launch:
+            # pool was empty but below max_size: launch synchronously for this caller
+            driver = self._launch()
+            with self._cond:
+                self._launching -= 1
+                self._in_use.add(driver)
+        elif self.max_park_age and time.monotonic() - parked_at > self.max_park_age:
+            # login page has been sitting for too long, its captcha is likely expired
+            try:
+                self._park(driver)
+            except Exception:
+                with self._cond:
+                    self._in_use.discard(driver)
+                    self._cond.notify_all()
+                self._quit(driver)
+                self._refill()
+                remaining = deadline - time.monotonic()
+                return self.acquire(timeout=max(remaining, 0))
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self.stats["acquired"] += 1
+            self.stats["wait_seconds_total"] += waited
+            self.stats["last_wait_seconds"] = waited
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+        self._refill()
+        return driver
+
+    def wait_warm(self, timeout=None):
+        """Block until min_size browsers are parked; False on timeout or shutdown."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or len(self._idle) >= self.min_size, timeout)
+            return not self._closed and len(self._idle) >= self.min_size
+
+    def prefetched(self, driver):
+        """What reset() returned when this (just acquired) driver was parked, once; None if nothing."""
+        return self._prefetched.pop(driver, None)
+
+    def release(self, driver):
+        """Take a driver back; it is reset and parked again in the background."""
+        with self._cond:
+            if driver not in self._in_use:
+                return
+            self._in_use.discard(driver)
+            self.stats["released"] += 1
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._recycling += 1
+        if closed:
+            self._quit(driver)
+            return
+        threading.Thread(target=self._recycle, args=(driver,), daemon=True).start()
+
+    def discard(self, driver):
+        """Quit a broken driver instead of returning it, and launch a replacement."""
+        with self._cond:
+            self._in_use.discard(driver)
+            self.stats["discarded"] += 1
+            self._cond.notify_all()
+        self._quit(driver)
+        self._refill()
+
+    def snapshot(self):
+        with self._cond:
+            snap = dict(self.stats)
+            snap.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "launching": self._launching,
+                "recycling": self._recycling,
+                "prefetched": len(self._prefetched),
+                "total": self._total(),
+            })
+        acquired = snap["acquired"] or 1
+        launched = snap["launched"] or 1
+        snap["avg_wait_seconds"] = snap["wait_seconds_total"] / acquired
+        snap["avg_launch_seconds"] = snap["launch_seconds_total"] / launched
+        return snap
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            idle = [d for d, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for driver in idle:
+            self._quit(driver)
@@ -0,0 +1,295 @@
+"""
+Local stand-in for the e-way bill portal, for benchmarking and testing the
+automation without touching the live government site.
+
+    python fake_portal.py --port 5198 --latency 0.2 --fail-rate 0.05
+
+then run the app / benches with PORTAL_BASE_URL=http://127.0.0.1:5198.
+
+Reproduces the element ids GSTAutomator and HttpPortalEngine rely on
+(imgcaptcha, txt_username, btnLogin, txtDocNo, txt_TRC_1, SelectIGST_1,
+btnPreview, btnsbmt, the printOnlyDiv() link), the login/submit alerts, the
+MainMenu.aspx redirect, ASP.NET hidden fields and the GSTIN page-method lookup.
+"""
+import time, uuid, zlib, random, struct, argparse, threading
+from flask import Flask, request, redirect, jsonify, make_response
+
+SESSION_COOKIE = "ASP.NET_SessionId"
+
+STATES = ["ANDHRA PRADESH", "BIHAR", "DELHI", "GUJARAT", "KARNATAKA", "MAHARASHTRA",
+          "RAJASTHAN", "TAMIL NADU", "UTTAR PRADESH", "WEST BENGAL"]
+IGST_RATES = ["0.000", "0.100", "0.250", "1.000", "1.500", "3.000", "5.000",
+              "6.000", "7.500", "12.000", "18.000", "28.000"]
+
+
+def _png(width=120, height=40, seed=0):
+    """Tiny valid grey PNG (varied by seed) so screenshots and decoders have something real."""
+    shade = 160 + seed % 80
+    raw = b"".join(b"\x00" + bytes([shade]) * width for _ in range(height))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+LOGIN_HTML = """<!doctype html><html><head><title>E-Way Bill System</title></head><body>
+<form method="post" action="./Login.aspx" id="form1">
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{validation}" />
+<input type="text" name="txt_username" id="txt_username" />
+<input type="password" name="txt_password" id="txt_password" />
+<img id="imgcaptcha" src="Captcha.aspx?t={nonce}" width="120" height="40" />
+<input type="text" name="txtCaptcha" id="txtCaptcha" />
+<input type="submit" name="btnLogin" id="btnLogin" value="Login" />
+<span id="lblError">{error}</span>
+</form>{alert}</body></html>"""
+
+MAIN_MENU_HTML = """<!doctype html><html><body><h3>Main Menu</h3>
+<a href="BillGeneration/BillGeneration.aspx">Generate new</a></body></html>"""
+
+BILL_HTML = """<!doctype html><html><head><title>Bill Generation</title></head><body>
+<form method="post" action="./BillGeneration.aspx" id="form1">
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{validation}" />
+<input type="radio" name="ctl00$ContentPlaceHolder1$rbtOutwardInward" id="ctl00_ContentPlaceHolder1_rbtOutwardInward_0" value="O" checked="checked" />
+<input type="radio" name="ctl00$ContentPlaceHolder1$rbtOutwardInward" id="ctl00_ContentPlaceHolder1_rbtOutwardInward_1" value="I" />
+<input type="text" name="txtDocNo" id="txtDocNo" />
+<input type="text" name="ctl00$ContentPlaceHolder1$txtToGSTIN" id="ctl00_ContentPlaceHolder1_txtToGSTIN" onchange="lookupGstin(this.value)" />
+<input type="text" name="ctl00$ContentPlaceHolder1$txtToTrdName" id="ctl00_ContentPlaceHolder1_txtToTrdName" />
+<select name="ctl00$ContentPlaceHolder1$slToState" id="slToState"><option value="0">--Select--</option>{state_options}</select>
+<input type="text" name="ctl00$ContentPlaceHolder1$txtToPlace" id="ctl00_ContentPlaceHolder1_txtToPlace" />
+<input type="text" name="ctl00$ContentPlaceHolder1$txtToPincode" id="ctl00_ContentPlaceHolder1_txtToPincode" />
+<input type="text" name="txt_HSN_1" id="txt_HSN_1" />
+<input type="text" name="txt_TRC_1" id="txt_TRC_1" onchange="recalc()" />
+<select name="SelectIGST_1" id="SelectIGST_1" onchange="recalc()">{rate_options}</select>
+<input type="text" name="txtTotInvVal" id="txtTotInvVal" readonly="readonly" />
+<input type="text" name="ctl00$ContentPlaceHolder1$txtTransGSTIN" id="ctl00_ContentPlaceHolder1_txtTransGSTIN" />
+<input type="text" name="ctl00$ContentPlaceHolder1$txtTransid" id="ctl00_ContentPlaceHolder1_txtTransid" />
+<input type="button" id="btnPreview" value="Preview" onclick="showPreview()" />
+<div id="divPreview" style="display:none"><h4>Preview</h4>
+<input type="submit" name="btnsbmt" id="btnsbmt" value="Submit" /></div>
+</form>
+<script>
+function recalc() {{
+  var amt = parseFloat(document.getElementById('txt_TRC_1').value) || 0;
+  var rate = parseFloat(document.getElementById('SelectIGST_1').value) || 0;
+  document.getElementById('txtTotInvVal').value = (amt * (1 + rate / 100)).toFixed(2);
+}}
+function lookupGstin(gstin) {{
+  var xhr = new XMLHttpRequest();
+  xhr.open('POST', 'BillGeneration.aspx/{lookup_method}');
+  xhr.setRequestHeader('Content-Type', 'application/json');
+  xhr.onload = function () {{
+    var d = JSON.parse(xhr.responseText).d;
+    if (d && d.TradeName) document.getElementById('ctl00_ContentPlaceHolder1_txtToTrdName').value = d.TradeName;
+  }};
+  xhr.send(JSON.stringify({{gstin: gstin}}));
+}}
+function showPreview() {{
+  setTimeout(function () {{ document.getElementById('divPreview').style.display = 'block'; }}, {preview_delay_ms});
+}}
+</script>{alert}</body></html>"""
+
+PRINT_HTML = """<!doctype html><html><body>{alert}
+<div id="printDiv"><h3>e-Way Bill</h3>
+<table><tr><td>E-Way Bill No:</td><td id="lblEwbNo">{ewb_no}</td></tr>
+<tr><td>Document No:</td><td>{doc_no}</td></tr><tr><td>Value:</td><td>{amount}</td></tr></table></div>
+<a href="#" onclick="printOnlyDiv()">Print</a>
+<script>function printOnlyDiv() {{
+  var original = document.body.innerHTML;
+  document.body.innerHTML = document.getElementById("printDiv").innerHTML;
+  window.print();
+  document.body.innerHTML = original;
+}}</script>
+</body></html>"""
+
+
+class FakePortal:
+    """Portal state + knobs. latency/jitter in seconds, fail_rate in [0, 1]."""
+
+    def __init__(self, captcha_answer="ABC123", password="secret", latency=0.0, jitter=0.0,
+                 fail_rate=0.0, session_timeout=1200, preview_delay=0.2, submit_alerts=1,
+                 lookup_method="GetGSTINDetails"):
+        self.captcha_answer = captcha_answer
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.session_timeout = session_timeout
+        self.preview_delay = preview_delay
+        self.submit_alerts = submit_alerts
+        self.lookup_method = lookup_method
+        self.sessions = {}
+        self.bills = {}
+        self.lock = threading.Lock()
+        self._ewb_seq = 100000000000
+        self.stats = {"requests": 0, "logins": 0, "login_failures": 0, "bills": 0, "injected_failures": 0}
+
+    # ---------- helpers ----------
+    def session(self):
+        """Server-side session for the request's ASP.NET_SessionId cookie (created on demand)."""
+        sid = request.cookies.get(SESSION_COOKIE)
+        now = time.time()
+        with self.lock:
+            state = self.sessions.get(sid)
+            if state and state["logged_in"] and now - state["last_seen"] > self.session_timeout:
+                state["logged_in"] = False
+            if state is None:
+                sid = uuid.uuid4().hex
+                state = self.sessions[sid] = {"id": sid, "logged_in": False, "captcha": None, "last_seen": now}
+            state["last_seen"] = now
+        return state
+
+    def respond(self, state, body, status=200, content_type="text/html; charset=utf-8"):
+        resp = make_response(body, status)
+        resp.headers["Content-Type"] = content_type
+        resp.set_cookie(SESSION_COOKIE, state["id"], httponly=True)
+        return resp
+
+    def delay(self):
+        self.stats["requests"] += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def injected_failure(self):
+        if self.fail_rate and random.random() < self.fail_rate:
+            self.stats["injected_failures"] += 1
+            return True
+        return False
+
+    def login_page(self, state, error="", alert=""):
+        return LOGIN_HTML.format(viewstate=uuid.uuid4().hex, validation=uuid.uuid4().hex,
+                                 nonce=uuid.uuid4().hex[:8], error=error, alert=alert)
+
+    def bill_page(self, alert=""):
+        return BILL_HTML.format(
+            viewstate=uuid.uuid4().hex, validation=uuid.uuid4().hex,
+            state_options="".join(f'<option value="{i + 1}">{s}</option>' for i, s in enumerate(STATES)),
+            rate_options="".join(f'<option value="{r}">{r}</option>' for r in IGST_RATES),
+            lookup_method=self.lookup_method, preview_delay_ms=int(self.preview_delay * 1000), alert=alert,
+        )
+
+    # ---------- app ----------
+    def create_app(self):
+        app = Flask("fake_portal")
+        portal = self
+
+        @app.before_request
+        def _latency():
+            portal.delay()
+
+        @app.route("/Login.aspx", methods=["GET"])
+        @app.route("/login.aspx", methods=["GET"])
+        def login_get():
+            state = portal.session()
+            return portal.respond(state, portal.login_page(state))
+
+        @app.route("/Captcha.aspx")
+        def captcha():
+            state = portal.session()
+            state["captcha"] = portal.captcha_answer
+            return portal.respond(state, _png(seed=random.randint(0, 1000)), content_type="image/png")
+
+        @app.route("/Login.aspx", methods=["POST"])
+        @app.route("/login.aspx", methods=["POST"])
+        def login_post():
+            state = portal.session()
+            form = request.form
+            if "__VIEWSTATE" not in form:
+                return portal.respond(state, "Invalid postback", 500)
+            if portal.injected_failure():
+                return portal.respond(state, portal.login_page(state, alert="<script>alert('Server is busy, please try again')</script>"))
+            if (form.get("txtCaptcha") or "").strip().upper() != (state.get("captcha") or "").upper():
+                portal.stats["login_failures"] += 1
+                return portal.respond(state, portal.login_page(state, alert="<script>alert('Invalid Captcha')</script>"))
+            if form.get("txt_password") != portal.password:
+                portal.stats["login_failures"] += 1
+                return portal.respond(state, portal.login_page(state, error="Invalid Username or Password"))
+            state["logged_in"] = True
+            state["username"] = form.get("txt_username")
+            portal.stats["logins"] += 1
+            resp = redirect("/MainMenu.aspx")
+            resp.set_cookie(SESSION_COOKIE, state["id"], httponly=True)
+            return resp
+
+        @app.route("/MainMenu.aspx")
+        def main_menu():
+            state = portal.session()
+            if not state["logged_in"]:
+                return redirect("/Login.aspx")
+            return portal.respond(state, MAIN_MENU_HTML)
+
+        @app.route("/BillGeneration/BillGeneration.aspx", methods=["GET"])
+        def bill_get():
+            state = portal.session()
+            if not state["logged_in"]:
+                return redirect("/Login.aspx")
+            return portal.respond(state, portal.bill_page())
+
+        @app.route("/BillGeneration/BillGeneration.aspx/<method>", methods=["POST"])
+        def page_method(method):
+            state = portal.session()
+            if method != portal.lookup_method or not state["logged_in"]:
+                return portal.respond(state, jsonify({"Message": "Unknown web method"}).get_data(), 500, "application/json")
+            gstin = (request.get_json(silent=True) or {}).get("gstin", "")
+            return portal.respond(state, jsonify({"d": {"TradeName": f"TRADER {gstin[-6:]}"}}).get_data(),
+                                  content_type="application/json")
+
+        @app.route("/BillGeneration/BillGeneration.aspx", methods=["POST"])
+        def bill_post():
+            state = portal.session()
+            if not state["logged_in"]:
+                return redirect("/Login.aspx")
+            form = request.form
+            if portal.injected_failure():
+                return portal.respond(state, portal.bill_page(alert="<script>alert('Server is busy, please try again')</script>"))
+            missing = [f for f in ("txtDocNo", "txt_TRC_1", "ctl00$ContentPlaceHolder1$txtTransid") if not form.get(f)]
+            if missing or form.get("SelectIGST_1") not in IGST_RATES:
+                return portal.respond(state, portal.bill_page(alert="<script>alert('Please fill all mandatory fields')</script>"))
+            key = (state.get("username"), form.get("txtDocNo"))
+            with portal.lock:
+                if key in portal.bills:
+                    return portal.respond(state, portal.bill_page(
+                        alert="<script>alert('E-Way Bill already generated for this document')</script>"))
+                portal._ewb_seq += 1
+                ewb_no = str(portal._ewb_seq)
+                portal.bills[key] = ewb_no
+                portal.stats["bills"] += 1
+            alerts = "".join("<script>alert('E-Way Bill generated successfully');</script>"
+                             for _ in range(portal.submit_alerts))
+            return portal.respond(state, PRINT_HTML.format(alert=alerts, ewb_no=ewb_no,
+                                                           doc_no=form.get("txtDocNo"), amount=form.get("txt_TRC_1")))
+
+        @app.route("/__fake/stats")
+        def fake_stats():
+            return jsonify(dict(portal.stats, sessions=len(portal.sessions)))
+
+        return app
+
+
+def start_fake_portal(port=0, **options):
+    """Run a FakePortal in a background thread; returns (portal, server, base_url)."""
+    from werkzeug.serving import make_server
+
+    portal = FakePortal(**options)
+    server = make_server("127.0.0.1", port, portal.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return portal, server, f"http://127.0.0.1:{server.server_port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake e-way bill portal")
+    parser.add_argument("--port", type=int, default=5198)
+    parser.add_argument("--captcha-answer", default="ABC123")
+    parser.add_argument("--password", default="secret")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--session-timeout", type=float, default=1200)
+    args = parser.parse_args()
+    portal = FakePortal(captcha_answer=args.captcha_answer, password=args.password, latency=args.latency,
+                        jitter=args.jitter, fail_rate=args.fail_rate, session_timeout=args.session_timeout)
+    print(f"🧪 Fake portal on http://127.0.0.1:{args.port} (captcha answer {args.captcha_answer})")
+    portal.create_app().run(host="127.0.0.1", port=args.port, threaded=True)
@@ -1,93 +1,438 @@
-import os, time, base64, logging
+import os, base64, shutil, fnmatch, logging, threading
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import NoAlertPresentException
 from selenium.webdriver.common.action_chains import ActionChains
-import json
+from collections import OrderedDict
 # import undetected_chromedriver as uc
-from pyvirtualdisplay import Display
+from config import Config
+from bill_flow import BillFlow, EWB_NO_ID, read_ewb_no
+from captcha_dataset import CORRECT, classify_login_error
+from captcha_prefetch import presolve, prefetched_captcha
+from waits import StepWaiter, page_idle, images_settled, field_has_value, element_visible, element_has_text, js_flag
+from metrics import timed_step, span, DRIVER_LAUNCH_SECONDS, ALERTS_SEEN
 
 
 
 logger = logging.getLogger("GSTAutomator")
 
-class GSTAutomator:
-    def __init__(self, headless=True):
-        self.driver = None
-        self.setup_driver(headless=False)
+LOGIN_URL = f"{Config.PORTAL_BASE_URL}/Login.aspx"
+BILL_GENERATION_URL = f"{Config.PORTAL_BASE_URL}/BillGeneration/BillGeneration.aspx"
+
+# printOnlyDiv() swaps the page body for the EWB div, calls window.print() and swaps it
+# back. The stub marks the page ready and throws, so the swap back never runs and the
+# page holds only the EWB when Page.printToPDF renders it.
+PRINT_HOOK_JS = ("window.__ewbPrintReady = false;"
+                 "window.print = function () { window.__ewbPrintReady = true; throw new Error('ewb print hook'); };")
+
+# Chrome features the automation never uses; each one costs memory or background work
+LEAN_CHROME_ARGS = [
+    "--disable-extensions",
+    "--disable-gpu",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-translate",
+    "--disable-notifications",
+    "--mute-audio",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--metrics-recording-only",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+]
+
+# blocked URL patterns seen matching the login page's real captcha src; never blocked again
+_captcha_exempt = set()
+
+CAPTCHA_STATE_JS = ("var i = document.getElementById('imgcaptcha');"
+                    "return i && i.complete ? {src: i.currentSrc || i.src, loaded: i.naturalWidth > 0} : null;")
+
+# images the lean profile blocked get fetched again before the EWB is printed (logo, barcode)
+RELOAD_IMAGES_JS = ("Array.prototype.forEach.call(document.images, function(i) {"
+                    " if (!i.naturalWidth && i.src) { var src = i.src; i.src = ''; i.src = src; } });")
+
+# state names and IGST rate values the bill form offers (refreshes MasterData)
+MASTER_DATA_JS = (
+    "var opts = function(id, attr) { var el = document.getElementById(id);"
+    " return el ? Array.prototype.map.call(el.options, function(o) { return o[attr].trim(); }) : []; };"
+    "return {states: opts('slToState', 'text'), igst_rates: opts('SelectIGST_1', 'value')};"
+)
+
+# where the browser is after a failed step: markers of each checkpoint page
+LOCATE_JS = (
+    "var sb = document.getElementById('btnsbmt'), doc = document.getElementById('txtDocNo');"
+    "return {login: !!document.getElementById('imgcaptcha'),"
+    " printed: window.__ewbPrintReady === true,"
+    " print_link: !!document.querySelector(\"a[onclick='printOnlyDiv()']\"),"
+    " preview: !!(sb && sb.offsetParent !== null),"
+    " filled: !!(doc && doc.value), form: !!doc};"
+)
+
+# authenticated GET from inside the page (the open form stays as it is); answers the final URL
+HEARTBEAT_JS = (
+    "var done = arguments[arguments.length - 1], ctl = new AbortController();"
+    "setTimeout(function() { ctl.abort(); }, 10000);"
+    "fetch(arguments[0], {credentials: 'same-origin', cache: 'no-store', signal: ctl.signal})"
+    ".then(function(r) { done({url: r.url, status: r.status}); })"
+    ".catch(function(e) { done({error: String(e)}); });"
+)
+
+# Sets every field in one call: value (or matching <option>), then the input/change/blur
+# events the portal's inline handlers and jQuery bindings react to (tax totals, lookups).
+# Reads each value back and reports what could not be set. A select must show the wanted
+# option; a text input only has to keep a value, since handlers may reformat it ("15000" -> "15000.00").
+FILL_FORM_JS = """
+var fields = arguments[0];
+var report = {filled: [], skipped: [], missing: [], mismatched: []};
+function fire(el, type) { el.dispatchEvent(new Event(type, {bubbles: true})); }
+fields.forEach(function (f) {
+  var el = document.getElementById(f.id);
+  if (!el) { (f.optional ? report.skipped : report.missing).push(f.id); return; }
+  var kind = f.kind || 'text';
+  el.focus();
+  if (kind === 'text') {
+    el.value = f.value;
+    fire(el, 'input');
+  } else {
+    var index = -1;
+    for (var i = 0; i < el.options.length; i++) {
+      var option = el.options[i];
+      if ((kind === 'select_text' ? option.text.trim() : option.value) === f.value) { index = i; break; }
+    }
+    if (index < 0) { report.mismatched.push({id: f.id, wanted: f.value, got: null}); return; }
+    el.selectedIndex = index;
+  }
+  fire(el, 'change');
+  if (document.activeElement === el) { el.blur(); } else { fire(el, 'blur'); }
+  var got = kind === 'select_text' ? el.options[el.selectedIndex].text.trim() : el.value;
+  var kept = kind === 'text' ? (got !== '' || f.value === '') : got === f.value;
+  if (!kept) { report.mismatched.push({id: f.id, wanted: f.value, got: got}); }
+  else { report.filled.push(f.id); }
+});
+return report;
+"""
+
+_chromedriver = None
+_chromedriver_cached = False    # _chromedriver was read from Config.CHROMEDRIVER_CACHE_PATH
+_chromedriver_lock = threading.Lock()
+
+
+def _resolve_chromedriver():
+    global _chromedriver_cached
+    _chromedriver_cached = False
+    if Config.CHROMEDRIVER_PATH:
+        return Config.CHROMEDRIVER_PATH
+    cache = Config.CHROMEDRIVER_CACHE_PATH
+    if cache and os.path.exists(cache):
+        with open(cache, "r", encoding="utf-8") as f:
+            cached = f.read().strip()
+        if cached and os.access(cached, os.X_OK):
+            _chromedriver_cached = True
+            return cached
+    path = shutil.which("chromedriver")
+    if path is None:
+        try:
+            from webdriver_manager.chrome import ChromeDriverManager
+            path = ChromeDriverManager().install()
+        except Exception:
+            logger.warning("webdriver-manager could not provide chromedriver, leaving it to Selenium Manager",
+                           exc_info=True)
+            return None
+    if cache:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache)), exist_ok=True)
+            with open(cache, "w", encoding="utf-8") as f:
+                f.write(path)
+        except OSError:
+            logger.warning("Could not cache the chromedriver path in %s", cache, exc_info=True)
+    return path
+
+
+def chromedriver_path():
+    """
+    chromedriver binary, looked up once per process (and remembered across restarts in
+    Config.CHROMEDRIVER_CACHE_PATH) so launching a browser never pays for driver discovery.
+    None lets Selenium Manager find one.
+    """
+    global _chromedriver
+    with _chromedriver_lock:
+        if _chromedriver is None:
+            _chromedriver = _resolve_chromedriver() or ""
+        return _chromedriver or None
+
+
+def forget_chromedriver(path):
+    """
+    A browser could not be started with `path`. When it came from the cache file (a
+    chromedriver that may not match the Chrome installed since), drop the cache so the
+    next chromedriver_path() looks it up again. True when a retry can use another path.
+    """
+    global _chromedriver
+    with _chromedriver_lock:
+        if _chromedriver is None or _chromedriver != (path or ""):
+            return True    # another launch already dropped it
+        if not _chromedriver_cached:
+            return False
+        logger.warning("Cached chromedriver %s failed to start Chrome, looking it up again", path)
+        _chromedriver = None
+        try:
+            os.remove(Config.CHROMEDRIVER_CACHE_PATH)
+        except OSError:
+            pass
+        return True
 
-    def setup_driver(self, headless=False):
-        print("⚙️ Setting up Selenium WebDriver...")
-        download_dir = os.path.abspath("Downloads")
-        os.makedirs(download_dir, exist_ok=True)
 
+class GSTAutomator(BillFlow):
+    ENGINE_NAME = "selenium"
+
+    def __init__(self, headless=None, pool=None, cookie_store=None, captcha_dataset=None, master_data=None,
+                 bill_store=None):
+        self.driver = None
+        self.pool = pool
+        self.cookie_store = cookie_store
+        # optional CaptchaDataset collecting (captcha, answer, login outcome) samples
+        self.captcha_dataset = captcha_dataset
+        # optional MasterData: invoices are validated against it before the browser is used
+        self.master_data = master_data
+        # optional BillStore: (GSTIN, doc_no) already generated are answered from it, never resubmitted
+        self.bill_store = bill_store
+        self.portal_user = None
+        self.previewed_invoice = None
+        # last BillFlow checkpoint reached by the current bill (see BillFlow.CHECKPOINTS)
+        self.checkpoint = None
+        # True while a pooled driver is still sitting on the login page it was parked on
+        self.parked = False
+        # portal session state: logged in (captcha or restored cookies), and whether
+        # the browser is already sitting on a freshly loaded BillGeneration.aspx
+        self.logged_in = False
+        self.on_bill_page = False
+        # fill_bill_form() already set the invoice fields, fill_invoice_and_preview only previews
+        self.form_prefilled = False
+        # latest captcha / preview PNGs kept in memory (name -> bytes), served straight from RAM
+        self.images = OrderedDict()
+        # when the captcha in memory was captured, and its pre-computed answer (BillFlow.set_captcha)
+        self.captcha_info = None
+        if pool is not None:
+            self.driver = pool.acquire()
+            self.parked = True
+            # captured while the driver sat in the pool: the first captcha costs nothing
+            prefetched = pool.prefetched(self.driver)
+            if prefetched:
+                self.set_captcha(prefetched["png"], prefetched["answer"], prefetched["captured_at"], prefetched=True)
+        else:
+            self.setup_driver(headless=headless)
+
+    def setup_driver(self, headless=None):
+        self.driver = GSTAutomator.launch_driver(headless)
+
+    @staticmethod
+    def launch_driver(headless=None, profile=None):
+        """headless / profile default to Config.CHROME_HEADLESS / Config.CHROME_PROFILE."""
+        print("⚙️ Setting up Selenium WebDriver...")
+        headless = Config.CHROME_HEADLESS if headless is None else headless
+        lean = (profile or Config.CHROME_PROFILE) == "lean"
         chrome_opts = webdriver.ChromeOptions()
 
         if headless:
             chrome_opts.add_argument("--headless=new")
+            # headless has no screen size; keep the preview screenshot at desktop layout
+            chrome_opts.add_argument("--window-size=1280,1024")
 
         chrome_opts.add_argument("--no-sandbox")
         chrome_opts.add_argument("--disable-dev-shm-usage")
         chrome_opts.add_argument("--disable-blink-features=AutomationControlled")
+        if lean:
+            for arg in LEAN_CHROME_ARGS:
+                chrome_opts.add_argument(arg)
 
-        # Silent PDF printing setup
-        settings = {
-            "recentDestinations": [{"id": "Save as PDF", "origin": "local"}],
-            "selectedDestinationId": "Save as PDF",
-            "version": 2,
-            "isHeaderFooterEnabled": False,
-            "isLandscapeEnabled": False,
-            "isDuplexEnabled": False
-        }
-
-        prefs = {
-            "printing.print_preview_sticky_settings.appState": json.dumps(settings),
-            "savefile.default_directory": download_dir,
-            "printing.default_destination_selection_rules": {
-                "kind": "local",
-                "namePattern": "Save as PDF"
-            }
-        }
-
-        chrome_opts.add_experimental_option("prefs", prefs)
-        chrome_opts.add_argument("--kiosk-printing")
-
-        self.driver = webdriver.Chrome(options=chrome_opts)
-        # self.driver.set_window_size(1280, 1024)
-        logger.info(f"✅ Selenium driver initialized (downloads → {download_dir})")
+        path = chromedriver_path()
+        with span(DRIVER_LAUNCH_SECONDS):
+            try:
+                driver = webdriver.Chrome(service=Service(executable_path=path), options=chrome_opts)
+            except Exception:
+                if not forget_chromedriver(path):
+                    raise
+                driver = webdriver.Chrome(service=Service(executable_path=chromedriver_path()), options=chrome_opts)
+        if lean:
+            GSTAutomator.block_resources(driver)
+        logger.info("✅ Selenium driver initialized (headless=%s, profile=%s)", headless, "lean" if lean else "full")
+        return driver
+
+    @staticmethod
+    def blocked_url_patterns():
+        """Config.CHROME_BLOCKED_URLS minus any pattern that would also block the captcha."""
+        patterns = []
+        for pattern in Config.CHROME_BLOCKED_URLS:
+            if pattern in _captcha_exempt:
+                continue
+            if fnmatch.fnmatchcase(Config.CAPTCHA_URL, pattern):
+                logger.warning("Not blocking %s, it matches the captcha URL", pattern)
+                continue
+            patterns.append(pattern)
+        return patterns
+
+    @staticmethod
+    def wait_for_captcha(driver, timeout=12):
+        """
+        Wait for the login page's captcha. Config.CAPTCHA_URL is only a guess at its
+        address: when a blocked pattern matches the image's actual src, that pattern
+        is exempted (for every browser from now on) and the page loaded again.
+        """
+        WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.ID, "imgcaptcha")))
+        if Config.CHROME_PROFILE != "lean":
+            return
+        state = WebDriverWait(driver, timeout).until(lambda d: d.execute_script(CAPTCHA_STATE_JS))
+        if state["loaded"]:
+            return
+        matched = [p for p in Config.CHROME_BLOCKED_URLS if fnmatch.fnmatchcase(state["src"], p)]
+        if not matched:
+            return
+        logger.warning("Captcha %s was blocked by %s, unblocking it", state["src"], ", ".join(matched))
+        _captcha_exempt.update(matched)
+        GSTAutomator.block_resources(driver)
+        driver.get(LOGIN_URL)
+        WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.ID, "imgcaptcha")))
+
+    @staticmethod
+    def block_resources(driver):
+        """Drop images, fonts and trackers at the network layer (DevTools); the captcha still loads."""
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": GSTAutomator.blocked_url_patterns()})
+        except Exception:
+            logger.warning("Could not enable resource blocking, loading everything", exc_info=True)
+
+    @staticmethod
+    def park_driver(driver):
+        """
+        Reset a driver to a clean, logged-out state sitting on Login.aspx (used by
+        DriverPool). With Config.CAPTCHA_PREFETCH the captcha is captured (and
+        pre-solved) right away and returned for the pool to keep.
+        """
+        try:
+            driver.switch_to.alert.dismiss()
+        except Exception:
+            pass
+        # cookies + storage belong to the portal origin the previous session was on
+        driver.delete_all_cookies()
+        driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+        driver.get(LOGIN_URL)
+        GSTAutomator.wait_for_captcha(driver)
+        if not Config.CAPTCHA_PREFETCH:
+            return None
+        try:
+            png = driver.find_element(By.ID, "imgcaptcha").screenshot_as_png
+        except Exception:
+            logger.warning("Could not prefetch the captcha of a parked driver", exc_info=True)
+            return None
+        return prefetched_captcha(png, presolve(png))
 
 
     # ---------- LOGIN PAGE + CAPTCHA ----------
+    def _reload_login_page(self, timeout=12):
+        self.driver.get(LOGIN_URL)
+        GSTAutomator.wait_for_captcha(self.driver, timeout)
+        self.forget_captcha()
+
+    @timed_step("load_login_page")
     def load_login_page(self, session_id):
         try:
-            self.driver.get("https://ewaybillgst.gov.in/Login.aspx")
-            WebDriverWait(self.driver, 12).until(EC.presence_of_element_located((By.ID, "imgcaptcha")))
+            age = self.captcha_age()
+            if self.parked and (age is None or age < Config.CAPTCHA_REFRESH_SECONDS):
+                # pooled driver is already on a fresh login page, no need to reload it
+                self.parked = False
+                return self.get_captcha(session_id)
+            self.parked = False
+            self._reload_login_page()
             return self.get_captcha(session_id)
         except Exception as e:
             logger.exception("Failed to load login page")
             return {"success": False, "error": str(e)}
 
+    @timed_step("get_captcha")
     def get_captcha(self, session_id):
         try:
-            captcha_el = self.driver.find_element(By.ID, "imgcaptcha")
-            os.makedirs("static/captchas", exist_ok=True)
-            path = f"static/captchas/{session_id}.png"
-            captcha_el.screenshot(path)
-            with open(path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("utf-8")
-            return {"success": True, "captcha_url": f"/{path}", "captcha_b64": b64}
+            if self.images.get("captcha") is None:
+                # one screenshot per login page, later calls are answered from memory
+                png = self.driver.find_element(By.ID, "imgcaptcha").screenshot_as_png
+                self.set_captcha(png)
+            return self.captcha_response(session_id)
         except Exception as e:
             logger.exception("Failed to capture captcha")
             return {"success": False, "error": str(e)}
 
+    @staticmethod
+    def _accept_alert(driver, step=""):
+        """Accept a pending JS alert and return its text, or None when there is no alert."""
+        try:
+            alert = driver.switch_to.alert
+            msg = alert.text
+            alert.accept()
+            ALERTS_SEEN.inc(step=step)
+            return msg
+        except NoAlertPresentException:
+            return None
+
+    # ---------- SESSION REUSE ----------
+    def export_cookies(self):
+        """Authenticated cookie jar of the portal session (after login to MainMenu.aspx)."""
+        return self.driver.get_cookies()
+
+    @timed_step("restore_session")
+    def restore_session(self, cookies):
+        """
+        Inject a saved cookie jar and probe BillGeneration.aspx with it.
+        Returns True when the portal still accepts the session (no captcha needed).
+        The driver must already be on a portal page so the cookies land on the right domain.
+        """
+        driver = self.driver
+        # the probe navigates away from the parked login page (and its captcha) either way
+        self.parked = False
+        self.forget_captcha()
+        driver.delete_all_cookies()
+        for cookie in cookies:
+            cookie = {k: v for k, v in cookie.items() if k in ("name", "value", "path", "domain", "secure", "httpOnly", "expiry")}
+            try:
+                driver.add_cookie(cookie)
+            except Exception:
+                logger.debug("Skipping cookie %s", cookie.get("name"))
+
+        if self.navigate_to_bill_generation() and "Login.aspx" not in driver.current_url:
+            self.logged_in = True
+            self.on_bill_page = True
+            return True
+        return False
+
+    @timed_step("heartbeat")
+    def heartbeat(self):
+        """Keep the portal session alive with one in-page request; False once the portal has logged us out."""
+        res = self.driver.execute_async_script(HEARTBEAT_JS, Config.KEEPALIVE_URL)
+        if res.get("error"):
+            raise RuntimeError(f"Heartbeat failed: {res['error']}")
+        return "Login.aspx" not in (res.get("url") or "")
+
+    def session_expired(self, username):
+        """Portal dropped the session: forget the cookies and go back to the captcha page."""
+        self.logged_in = False
+        self.on_bill_page = False
+        if self.cookie_store is not None:
+            self.cookie_store.invalidate(username)
+        self._reload_login_page()
+
     # ---------- LOGIN ----------
+    @timed_step("login")
     def login(self, username, password, captcha_text):
+        # the captcha on screen is the last one we captured for this page
+        captcha_png = self.images.get("captcha")
         try:
             driver = self.driver
             wait = WebDriverWait(driver, 10)
+            waiter = StepWaiter(driver)
             wait.until(EC.presence_of_element_located((By.ID, "imgcaptcha")))
 
             driver.find_element(By.ID, "txt_username").clear()
@@ -100,22 +445,29 @@ class GSTAutomator:
             login_btn = wait.until(EC.element_to_be_clickable((By.ID, "btnLogin")))
             driver.execute_script("arguments[0].click();", login_btn)
 
+            # Wait for whichever outcome comes first: invalid login alert, redirect, or inline error
+            waiter.wait(
+                "login_result",
+                EC.any_of(EC.alert_is_present(), EC.url_contains("MainMenu.aspx"), element_has_text("lblError")),
+                fixed_delay=4,
+            )
+
             # Handle alert for invalid login
-            try:
-                WebDriverWait(driver, 4).until(EC.alert_is_present())
-                alert = driver.switch_to.alert
-                msg = alert.text
-                alert.accept()
+            msg = self._accept_alert(driver, "login")
+            if msg is not None:
                 logger.info("GSTService: alert during login -> %s", msg)
-                self.driver.get("https://ewaybillgst.gov.in/Login.aspx")
-                WebDriverWait(driver, 8).until(EC.presence_of_element_located((By.ID, "imgcaptcha")))
+                self._record_captcha(captcha_png, captcha_text, classify_login_error(msg))
+                # the next captcha is captured now, before the caller asks for it
+                self._reload_login_page(timeout=8)
+                self.get_captcha(None)
                 return {"success": False, "error": msg}
-            except TimeoutException:
-                pass
 
-            time.sleep(2)
             if "MainMenu.aspx" in driver.current_url:
                 logger.info("GSTService: login successful")
+                self._record_captcha(captcha_png, captcha_text, CORRECT)
+                self.logged_in = True
+                if self.cookie_store is not None:
+                    self.cookie_store.save(username, self.export_cookies())
                 return {"success": True}
             else:
                 try:
@@ -123,18 +475,24 @@ class GSTAutomator:
                 except:
                     err = "Invalid credentials or captcha."
                 print("Could not find error message on login failure.")
-                self.driver.get("https://ewaybillgst.gov.in/Login.aspx")
-                WebDriverWait(driver, 8).until(EC.presence_of_element_located((By.ID, "imgcaptcha")))
+                self._record_captcha(captcha_png, captcha_text, classify_login_error(err))
+                self._reload_login_page(timeout=8)
+                self.get_captcha(None)
                 return {"success": False, "error": err}
         except Exception as e:
             logger.exception("Login failed with exception")
             return {"success": False, "error": str(e)}
 
     # ---------- BILL PAGE ----------
+    @timed_step("navigate_to_bill_generation")
     def navigate_to_bill_generation(self):
         try:
             driver = self.driver
-            driver.get("https://ewaybillgst.gov.in/BillGeneration/BillGeneration.aspx")
+            if self.on_bill_page:
+                # the session-reuse probe already left us on a fresh bill form
+                self.on_bill_page = False
+                return True
+            driver.get(BILL_GENERATION_URL)
             WebDriverWait(driver, 12).until(
                 EC.presence_of_element_located((By.ID, "ctl00_ContentPlaceHolder1_rbtOutwardInward_0"))
             )
@@ -146,174 +504,331 @@ class GSTAutomator:
             return False
 
     # ---------- CONSIGNOR DETAILS ----------
+    @timed_step("fill_consignor_details")
     def fill_consignor_details(self, data):
+        if Config.FORM_FILL_MODE == "batch":
+            return self.fill_bill_form(data)
+        self.form_prefilled = False
         driver = self.driver
+        waiter = StepWaiter(driver)
         logger.info("Filling Bill Details")
-        time.sleep(5)
-        driver.find_element(By.ID, "txtDocNo").send_keys("1001")
-        logger.info("Filling Consignor Details")
         wait = WebDriverWait(driver, 10)
         try:
+            # form scripts must be done initialising before we type into it
+            doc_no = waiter.wait(
+                "bill_form",
+                lambda d: page_idle(d) and d.find_element(By.ID, "txtDocNo"),
+                fixed_delay=5,
+                required=True,
+            )
+            doc_no.clear()
+            doc_no.send_keys(data.get("doc_no", "1001"))
+            logger.info("Filling Consignor Details")
             gstin = (data.get("gstin") or "").strip()
             if gstin and gstin.upper() != "URP":
                 gst_field = wait.until(EC.presence_of_element_located((By.ID, "ctl00_ContentPlaceHolder1_txtToGSTIN")))
                 gst_field.clear()
                 gst_field.send_keys(gstin)
-                time.sleep(2)
+                # AJAX GSTIN lookup fills the trade name when it returns
+                waiter.wait("gstin_lookup", field_has_value("ctl00_ContentPlaceHolder1_txtToTrdName"), fixed_delay=2)
             else:
                 driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_txtToGSTIN").clear()
                 driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_txtToGSTIN").send_keys("URP")
-                driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_txtToTrdName").send_keys(data.get("name", ""))
+                for el_id, value in (("ctl00_ContentPlaceHolder1_txtToTrdName", data.get("name", "")),
+                                     ("ctl00_ContentPlaceHolder1_txtToPlace", data.get("city", "")),
+                                     ("ctl00_ContentPlaceHolder1_txtToPincode", data.get("pincode", ""))):
+                    field = driver.find_element(By.ID, el_id)
+                    field.clear()
+                    field.send_keys(value)
                 Select(driver.find_element(By.ID, "slToState")).select_by_visible_text(data.get("state", ""))
-                driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_txtToPlace").send_keys(data.get("city", ""))
-                driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_txtToPincode").send_keys(data.get("pincode", ""))
 
             return {"success": True}
         except Exception as e:
             logger.exception("Failed to fill consignor details")
             return {"success": False, "error": str(e)}
 
-    # ---------- INVOICE DETAILS + PREVIEW ----------
-    def fill_invoice_and_preview(self, invoice_data, session_id):
+    # ---------- BATCHED FORM FILL ----------
+    @staticmethod
+    def bill_form_fields(data, with_gstin_lookup):
+        """Every bill form field set from invoice data, in the order a user would fill them."""
+        fields = [{"id": "txtDocNo", "value": data.get("doc_no", "1001")}]
+        if not with_gstin_lookup:
+            fields += [
+                {"id": "ctl00_ContentPlaceHolder1_txtToGSTIN", "value": "URP"},
+                {"id": "ctl00_ContentPlaceHolder1_txtToTrdName", "value": data.get("name", "")},
+                {"id": "slToState", "value": data.get("state", ""), "kind": "select_text"},
+                {"id": "ctl00_ContentPlaceHolder1_txtToPlace", "value": data.get("city", "")},
+                {"id": "ctl00_ContentPlaceHolder1_txtToPincode", "value": data.get("pincode", "")},
+            ]
+        fields += [
+            {"id": "txt_HSN_1", "value": data.get("hsn_code", "5407"), "optional": True},
+            {"id": "txt_TRC_1", "value": data.get("amount", "")},
+            {"id": "SelectIGST_1", "value": data.get("igst_rate", "5.000"), "kind": "select_value"},
+            {"id": "ctl00_ContentPlaceHolder1_txtTransGSTIN", "value": data.get("transporter_gstin", ""), "optional": True},
+            {"id": "ctl00_ContentPlaceHolder1_txtTransid", "value": data.get("transporter_id", "")},
+        ]
+        # the script compares strings: 15000 from a JSON body must read back as "15000"
+        for field in fields:
+            field["value"] = "" if field["value"] is None else str(field["value"])
+        return fields
+
+    def fill_bill_form(self, data):
+        """
+        Consignor + invoice fields in one execute_script instead of a round trip per
+        find/clear/send_keys. A real GSTIN is still typed: its lookup listens to key events.
+        Returns {"success", "validation": {"filled", "skipped", "missing", "mismatched"}}.
+        """
         driver = self.driver
-        wait = WebDriverWait(driver, 1)
+        waiter = StepWaiter(driver)
         try:
-            time.sleep(2)
-            # HSN Code (added)
-            try:
-                hsn_field = driver.find_element(By.ID, "txt_HSN_1")
-                hsn_field.clear()
-                hsn_field.send_keys(invoice_data.get("hsn_code", "5407"))
-            except Exception:
-                logger.warning("HSN code field not found, skipping.")
-            # Taxable amount
-            trc = wait.until(EC.presence_of_element_located((By.ID, "txt_TRC_1")))
-            trc.clear()
-            trc.send_keys(invoice_data.get("amount", ""))
-
-            # IGST rate
-            Select(wait.until(EC.presence_of_element_located((By.ID, "SelectIGST_1")))).select_by_value(
-                invoice_data.get("igst_rate", "5.000")
+            waiter.wait(
+                "bill_form",
+                lambda d: page_idle(d) and d.find_element(By.ID, "txtDocNo") and d.find_element(By.ID, "txt_TRC_1"),
+                fixed_delay=5,
+                required=True,
             )
+            gstin = (data.get("gstin") or "").strip()
+            with_lookup = bool(gstin) and gstin.upper() != "URP"
+            report = driver.execute_script(FILL_FORM_JS, self.bill_form_fields(data, with_lookup))
+            if report["skipped"]:
+                logger.warning("Optional fields not on the form, skipped: %s", ", ".join(report["skipped"]))
 
-            
-            time.sleep(2)
-            # Transporter GSTIN (added)
-            try:
-                trans_gstin = driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_txtTransGSTIN")
-                trans_gstin.clear()
-                trans_gstin.send_keys(invoice_data.get("transporter_gstin", ""))
-            except Exception:
-                logger.warning("Transporter GSTIN field not found, skipping.")
+            if with_lookup:
+                gst_field = driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_txtToGSTIN")
+                gst_field.clear()
+                gst_field.send_keys(gstin)
+                # AJAX GSTIN lookup fills the trade name when it returns
+                waiter.wait("gstin_lookup", field_has_value("ctl00_ContentPlaceHolder1_txtToTrdName"), fixed_delay=2)
+
+            if report["missing"] or report["mismatched"]:
+                problems = report["missing"] + [f"{m['id']}={m['wanted']!r} (got {m['got']!r})" for m in report["mismatched"]]
+                return {"success": False, "error": "Bill form not filled: " + ", ".join(problems), "validation": report}
+            self.form_prefilled = True
+            return {"success": True, "validation": report}
+        except Exception as e:
+            logger.exception("Failed to fill bill form")
+            return {"success": False, "error": str(e)}
+
+    # ---------- INVOICE DETAILS + PREVIEW ----------
+    @timed_step("fill_invoice_and_preview")
+    def fill_invoice_and_preview(self, invoice_data, session_id, image_name="preview"):
+        driver = self.driver
+        wait = WebDriverWait(driver, 1)
+        waiter = StepWaiter(driver)
+        try:
+            if self.form_prefilled:
+                # fill_bill_form() already set the invoice fields in the same script as the consignor ones
+                self.form_prefilled = False
+            else:
+                waiter.wait("invoice_form", EC.presence_of_element_located((By.ID, "txt_TRC_1")), fixed_delay=2)
+                # HSN Code (added)
+                try:
+                    hsn_field = driver.find_element(By.ID, "txt_HSN_1")
+                    hsn_field.clear()
+                    hsn_field.send_keys(invoice_data.get("hsn_code", "5407"))
+                except Exception:
+                    logger.warning("HSN code field not found, skipping.")
+                # Taxable amount
+                trc = wait.until(EC.presence_of_element_located((By.ID, "txt_TRC_1")))
+                trc.clear()
+                trc.send_keys(invoice_data.get("amount", ""))
+
+                # IGST rate
+                Select(wait.until(EC.presence_of_element_located((By.ID, "SelectIGST_1")))).select_by_value(
+                    invoice_data.get("igst_rate", "5.000")
+                )
+
+                # tax totals are recalculated by the change handlers (plus any AJAX they kick off)
+                waiter.wait("tax_recalc", page_idle, fixed_delay=2)
+                # Transporter GSTIN (added)
+                try:
+                    trans_gstin = driver.find_element(By.ID, "ctl00_ContentPlaceHolder1_txtTransGSTIN")
+                    trans_gstin.clear()
+                    trans_gstin.send_keys(invoice_data.get("transporter_gstin", ""))
+                except Exception:
+                    logger.warning("Transporter GSTIN field not found, skipping.")
 
-            # Transporter ID
-            trans_field = wait.until(EC.presence_of_element_located((By.ID, "ctl00_ContentPlaceHolder1_txtTransid")))
-            trans_field.clear()
-            trans_field.send_keys(invoice_data.get("transporter_id", ""))
+                # Transporter ID
+                trans_field = wait.until(EC.presence_of_element_located((By.ID, "ctl00_ContentPlaceHolder1_txtTransid")))
+                trans_field.clear()
+                trans_field.send_keys(invoice_data.get("transporter_id", ""))
 
-            # wait 5 sec before preview for auto calculations
-            time.sleep(2)
+            # let auto calculations / transporter lookup settle before preview
+            waiter.wait("tax_recalc", page_idle, fixed_delay=2)
 
             # Preview
             preview_btn = wait.until(EC.element_to_be_clickable((By.ID, "btnPreview")))
             driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", preview_btn)
-            time.sleep(0.5)
             driver.execute_script("arguments[0].click();", preview_btn)
             logger.info("Clicked Preview button via JS safely")
 
-            # Handle preview alert
-            try:
-                WebDriverWait(driver, 6).until(EC.alert_is_present())
-                alert = driver.switch_to.alert
-                logger.info("Preview alert: %s", alert.text)
-                alert.accept()
-            except TimeoutException:
-                pass
-
-            time.sleep(5)
-            os.makedirs("static/previews", exist_ok=True)
-            path = f"static/previews/{session_id}.png"
-            driver.save_screenshot(path)
-            with open(path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("utf-8")
-
-            return {"success": True, "preview_image": f"/{path}", "preview_b64": b64}
+            # Preview panel is rendered once the submit button shows up (an alert may come first)
+            waiter.wait(
+                "preview",
+                EC.any_of(EC.alert_is_present(), element_visible(By.ID, "btnsbmt")),
+                fixed_delay=5,
+            )
+            msg = self._accept_alert(driver, "preview")
+            if msg is not None:
+                logger.info("Preview alert: %s", msg)
+                waiter.wait("preview", element_visible(By.ID, "btnsbmt"))
+
+            png = driver.get_screenshot_as_png()
+            self.store_image(image_name, png)
+            b64 = base64.b64encode(png).decode("utf-8")
+
+            return {"success": True, "preview_image": f"/images/{session_id}/{image_name}.png", "preview_b64": b64}
         except Exception as e:
             logger.exception("Error during invoice fill/preview")
             return {"success": False, "error": str(e)}
 
     # ---------- FINAL SUBMIT ----------
-    def confirm_and_submit(self):
+    @timed_step("submit_form")
+    def submit_form(self):
         driver = self.driver
+        waiter = StepWaiter(driver)
+        print_link = (By.XPATH, "//a[@onclick='printOnlyDiv()']")
+        # once btnsbmt is clicked a failure no longer means "no bill": report what is known
+        submitted = False
         try:
             ActionChains(driver).move_by_offset(50, 50).click().perform()
-            time.sleep(0.5)
             # Click submit button
             submit_btn = WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.ID, "btnsbmt")))
             submit_btn.click()
+            submitted = True
 
-            # Wait for alert and accept it
+            # Wait for alert and accept it; stop as soon as the print link shows up instead
             for _ in range(2):  # Adjust if 1 or 2 alerts can appear
-                try:
-                    WebDriverWait(driver, 3).until(EC.alert_is_present())
-                    alert = driver.switch_to.alert
-                    print("Alert text:", alert.text)
-                    alert.accept()
-                    time.sleep(1)
-                except Exception:
+                waiter.wait(
+                    "submit_alert",
+                    EC.any_of(EC.alert_is_present(), EC.presence_of_element_located(print_link)),
+                    fixed_delay=1,
+                )
+                msg = self._accept_alert(driver, "submit")
+                if msg is None:
                     break
+                print("Alert text:", msg)
 
             # Wait for Print button
-            print_btn = WebDriverWait(driver, 15).until(
-                EC.presence_of_element_located((By.XPATH, "//a[@onclick='printOnlyDiv()']"))
-            )
-
-            # Scroll into view (to avoid footer blocking)
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", print_btn)
-            time.sleep(0.8)
-            try:
-                print_btn.click()
-            except Exception:
-                # If footer or overlay blocks it, fallback to JS click
-                driver.execute_script("arguments[0].click();", print_btn)
-
-            # Headless “silent” print to PDF
-            time.sleep(2)
-            driver.execute_script('window.print();')
+            waiter.wait("print_link", EC.presence_of_element_located(print_link), required=True)
+            return {"success": True, "ewb_no": self.read_ewb_no()}
+        except Exception as e:
+            logger.exception("Failed to submit the bill")
+            return {"success": False, "error": str(e), "outcome_unknown": submitted}
 
-            # Wait a few seconds for Chrome to generate the file
-            time.sleep(5)
+    def read_ewb_no(self):
+        label = self.driver.execute_script(
+            "var el = document.getElementById(arguments[0]); return el ? el.textContent : null;", EWB_NO_ID)
+        body = None if label is not None else self.driver.find_element(By.TAG_NAME, "body").text
+        return read_ewb_no(label, body)
 
-            return {"success": True, "message": "EWB printed to PDF successfully."}
+    @timed_step("print_bill")
+    def print_bill(self, ewb_no=None):
+        driver = self.driver
+        waiter = StepWaiter(driver)
+        try:
+            # a retry after a failed render finds the page already swapped to the EWB
+            if not driver.execute_script("return window.__ewbPrintReady === true;"):
+                print_btn = driver.find_element(By.XPATH, "//a[@onclick='printOnlyDiv()']")
+                # Let the portal's printOnlyDiv() lay out the EWB, but render it ourselves
+                driver.execute_script(PRINT_HOOK_JS)
+                driver.execute_script("arguments[0].click();", print_btn)
+                waiter.wait("print_ready", js_flag("__ewbPrintReady"))
+            waiter.wait("print_ready", page_idle)
+
+            pdf = self.print_to_pdf()
+            name = self.save_pdf(pdf, ewb_no)
+            return {
+                "success": True,
+                "message": "EWB printed to PDF successfully.",
+                "ewb_no": ewb_no,
+                "pdf_name": name,
+                "pdf_path": os.path.join(Config.PDF_DIR, name),
+                "download_url": f"/download/{name}",
+            }
         except Exception as e:
-            logger.exception("Failed in confirm_and_submit flow")
+            logger.exception("Failed to print the bill")
             return {"success": False, "error": str(e)}
 
-
-    # ---------- MASTER FLOW ----------
-    def create_eway_bill(self, credentials, invoice_data, session_id, auto_submit=False):
-        login_result = self.login(credentials["username"], credentials["password"], credentials["captcha"])
-        if not login_result.get("success"):
-            return login_result
-
-        if not self.navigate_to_bill_generation():
-            return {"success": False, "error": "Failed to load Bill Generation page"}
-
-        res = self.fill_consignor_details(invoice_data)
-        if not res.get("success"):
-            return res
-
-        preview_res = self.fill_invoice_and_preview(invoice_data, session_id)
-        if not preview_res.get("success"):
-            return preview_res
-
-        if auto_submit:
-            return self.confirm_and_submit()
-
-        return preview_res
+    def print_to_pdf(self):
+        """
+        Render the current page with Chrome's Page.printToPDF (headless or not); returns PDF bytes.
+        The lean profile's resource blocking is lifted while printing, so the PDF has its images.
+        """
+        driver = self.driver
+        lean = Config.CHROME_PROFILE == "lean"
+        try:
+            if lean:
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+                driver.execute_script(RELOAD_IMAGES_JS)
+                StepWaiter(driver).wait("print_images", images_settled)
+            result = driver.execute_cdp_cmd("Page.printToPDF", {
+                "printBackground": True,
+                "preferCSSPageSize": True,
+            })
+        finally:
+            if lean:
+                GSTAutomator.block_resources(driver)
+        return base64.b64decode(result["data"])
+
+    # ---------- BillFlow hooks ----------
+    def current_url(self):
+        return self.driver.current_url or ""
+
+    def scrape_master_data(self):
+        return self.driver.execute_script(MASTER_DATA_JS)
+
+    def locate(self):
+        driver = self.driver
+        try:
+            self._accept_alert(driver, "locate")
+            if "Login.aspx" in (driver.current_url or ""):
+                return "login"
+            marks = driver.execute_script(LOCATE_JS)
+        except Exception:
+            logger.warning("Could not tell where the browser is", exc_info=True)
+            return "unknown"
+        for where in ("login", "printed", "print_link", "preview", "filled", "form"):
+            if marks.get(where):
+                return {"print_link": "submitted", "filled": "bill_form_filled", "form": "bill_form"}.get(where, where)
+        return "other"
+
+    def recover_step(self, checkpoint, context):
+        if checkpoint == "previewed":
+            png = self.driver.get_screenshot_as_png()
+            self.store_image(context["image_name"], png)
+            return {"success": True, "preview_image": f"/images/{context['session_id']}/{context['image_name']}.png",
+                    "preview_b64": base64.b64encode(png).decode("utf-8")}
+        if checkpoint == "submitted":
+            return {"success": True, "ewb_no": self.read_ewb_no()}
+        return {"success": True}
+
+    def clear_page_state(self):
+        # a previous failure may have left an alert open on the page
+        self._accept_alert(self.driver, "stale")
+
+    @staticmethod
+    def driver_alive(driver):
+        """Chrome and chromedriver still answer (window handles don't trip over an open alert)."""
+        try:
+            return bool(driver.window_handles)
+        except Exception:
+            return False
 
     def close(self):
+        driver, self.driver = self.driver, None
+        if driver is None:
+            return
+        if self.pool is not None:
+            if not GSTAutomator.driver_alive(driver):
+                # crashed browser or chromedriver: not worth a reset, the pool launches a new one
+                self.pool.discard(driver)
+                return
+            # hand the browser back so it can be reset and parked for the next session
+            self.pool.release(driver)
+            return
         try:
-            self.driver.quit()
+            driver.quit()
         except:
             pass
+
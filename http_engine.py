@@ -0,0 +1,491 @@
+import os, re, queue, logging, threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+from config import Config
+from bill_flow import BillFlow, EWB_NO_ID, read_ewb_no
+from captcha_dataset import CORRECT, classify_login_error
+from metrics import timed_step, ALERTS_SEEN
+
+logger = logging.getLogger("HttpPortalEngine")
+
+LOGIN_URL = f"{Config.PORTAL_BASE_URL}/Login.aspx"
+BILL_GENERATION_URL = f"{Config.PORTAL_BASE_URL}/BillGeneration/BillGeneration.aspx"
+
+# startup alerts the portal registers after a postback: <script>alert('...')</script>
+ALERT_RE = re.compile(r"<script[^>]*>\s*(?:window\.onload\s*=\s*function\s*\(\)\s*\{\s*)?alert\(\s*(['\"])(.*?)\1\s*\)", re.S | re.I)
+PRINT_MARKER = "printOnlyDiv()"
+# elements whose text is kept (by id); the EWB number sits in a table cell of the print page
+TEXT_TAGS = ("span", "label", "div", "td")
+# where a <base> can go: right after the opening <html> (or <head>) tag
+HEAD_RE = re.compile(r"<html[^>]*>|<head[^>]*>", re.I)
+
+
+# ---------- PAGE PARSING ----------
+class PortalPage(HTMLParser):
+    """
+    Parsed ASP.NET page: the form fields a browser would post (including
+    __VIEWSTATE / __EVENTVALIDATION), element id -> field name, select options,
+    submit buttons, images and label texts, plus any startup alerts.
+    """
+
+    def __init__(self, html, url):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.html = html
+        self.action = None
+        self.fields = {}      # name -> value
+        self.ids = {}         # element id -> name
+        self.radios = {}      # element id -> (name, value)
+        self.buttons = {}     # element id -> (name, value)
+        self.selects = {}     # name -> [(value, text)]
+        self.images = {}      # element id -> src
+        self.texts = {}       # element id -> text (span / label / div)
+        self._select = None
+        self._select_chosen = False
+        self._option = None
+        self._textarea = None
+        self._text_ids = []   # (tag, id or None) of the open TEXT_TAGS elements
+        self.feed(html)
+        self.close()
+        self.alerts = [m.group(2) for m in ALERT_RE.finditer(html)]
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        el_id, name = a.get("id"), a.get("name") or a.get("id")
+        if tag == "form" and self.action is None:
+            self.action = a.get("action")
+        elif tag == "input" and name:
+            kind = (a.get("type") or "text").lower()
+            if el_id:
+                self.ids[el_id] = name
+            if kind in ("submit", "button", "image"):
+                self.buttons[el_id or name] = (name, a.get("value") or "")
+            elif kind in ("radio", "checkbox"):
+                if el_id:
+                    self.radios[el_id] = (name, a.get("value") or "on")
+                if "checked" in a:
+                    self.fields[name] = a.get("value") or "on"
+            else:
+                self.fields[name] = a.get("value") or ""
+        elif tag == "select" and name:
+            self._select, self._select_chosen = name, False
+            self.selects[name] = []
+            self.fields.setdefault(name, "")
+            if el_id:
+                self.ids[el_id] = name
+        elif tag == "option" and self._select:
+            self._option = {"value": a.get("value"), "selected": "selected" in a, "text": ""}
+        elif tag == "textarea" and name:
+            self._textarea = name
+            self.fields[name] = ""
+            if el_id:
+                self.ids[el_id] = name
+        elif tag == "img" and el_id:
+            self.images[el_id] = a.get("src")
+        elif tag in TEXT_TAGS:
+            if el_id:
+                self.texts[el_id] = ""
+            self._text_ids.append((tag, el_id))
+
+    def handle_data(self, data):
+        if self._option is not None:
+            self._option["text"] += data
+        elif self._textarea is not None:
+            self.fields[self._textarea] += data
+        for _, el_id in self._text_ids:
+            if el_id:
+                self.texts[el_id] += data
+
+    def handle_endtag(self, tag):
+        if tag == "option" and self._option is not None:
+            text = self._option["text"].strip()
+            value = self._option["value"] if self._option["value"] is not None else text
+            self.selects[self._select].append((value, text))
+            if self._option["selected"] or not self._select_chosen:
+                self.fields[self._select] = value
+                self._select_chosen = self._select_chosen or self._option["selected"]
+            self._option = None
+        elif tag == "select":
+            self._select = None
+        elif tag == "textarea":
+            self._textarea = None
+        elif tag in TEXT_TAGS and self._text_ids and self._text_ids[-1][0] == tag:
+            self._text_ids.pop()
+
+    # ---------- form state ----------
+    def has(self, el_id):
+        return el_id in self.ids or el_id in self.radios or el_id in self.buttons
+
+    def set(self, el_id, value):
+        if el_id not in self.ids:
+            raise ValueError(f"Field {el_id} not found on {self.url}")
+        self.fields[self.ids[el_id]] = value
+
+    def check(self, el_id):
+        if el_id not in self.radios:
+            raise ValueError(f"Option {el_id} not found on {self.url}")
+        name, value = self.radios[el_id]
+        self.fields[name] = value
+
+    def select_by_text(self, el_id, text):
+        name = self.ids.get(el_id)
+        for value, label in self.selects.get(name, []):
+            if label.strip().upper() == (text or "").strip().upper():
+                self.fields[name] = value
+                return value
+        raise ValueError(f"Option '{text}' not found in {el_id}")
+
+    def select_by_value(self, el_id, wanted):
+        name = self.ids.get(el_id)
+        if not any(value == wanted for value, _ in self.selects.get(name, [])):
+            raise ValueError(f"Option value '{wanted}' not found in {el_id}")
+        self.fields[name] = wanted
+
+    def form_data(self, button_id=None):
+        data = dict(self.fields)
+        if button_id:
+            name, value = self.buttons.get(button_id, (button_id, ""))
+            data[name] = value
+        return data
+
+    def post_url(self):
+        return urljoin(self.url, self.action) if self.action else self.url
+
+
+# ---------- SESSION POOL ----------
+class HttpSessionPool:
+    """Reusable requests.Session objects so TCP/TLS connections stay warm across bill flows."""
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def _new(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, self.size))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                                         "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36")
+        return session
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new()
+
+    def release(self, session):
+        # portal cookies belong to the session that used them, never to the next one
+        session.cookies.clear()
+        if self._idle.qsize() < self.size:
+            self._idle.put(session)
+        else:
+            session.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_session_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = HttpSessionPool(Config.HTTP_POOL_SIZE)
+        return _default_pool
+
+
+# ---------- ENGINE ----------
+class HttpPortalEngine(BillFlow):
+    """
+    Bill generation through direct ASP.NET form posts: same step methods and
+    create_eway_bill interface as GSTAutomator, but only cookies and parsed
+    form state are held, no browser.
+    """
+
+    ENGINE_NAME = "http"
+
+    def __init__(self, cookie_store=None, captcha_dataset=None, session_pool=None, master_data=None,
+                 bill_store=None):
+        self.session_pool = session_pool or default_session_pool()
+        self.http = self.session_pool.acquire()
+        self.page = None
+        self.cookie_store = cookie_store
+        self.captcha_dataset = captcha_dataset
+        self.master_data = master_data
+        self.bill_store = bill_store
+        self.portal_user = None
+        self.previewed_invoice = None
+        self.checkpoint = None
+        self.logged_in = False
+        self.images = OrderedDict()
+        self.captcha_info = None
+        self.filled = {}
+
+    def _load(self, resp):
+        resp.raise_for_status()
+        self.page = PortalPage(resp.text, resp.url)
+        return self.page
+
+    def _get(self, url):
+        return self._load(self.http.get(url, timeout=Config.HTTP_TIMEOUT))
+
+    def _post(self, button_id=None):
+        data = self.page.form_data(button_id)
+        return self._load(self.http.post(self.page.post_url(), data=data, timeout=Config.HTTP_TIMEOUT))
+
+    def page_method(self, method, payload):
+        """ASP.NET page method (the portal's AJAX lookups): POST <page>/<method> with JSON, answer in "d"."""
+        url = f"{self.page.url.split('?')[0]}/{method}"
+        resp = self.http.post(url, json=payload, timeout=Config.HTTP_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json().get("d")
+
+    # ---------- BillFlow hooks ----------
+    def current_url(self):
+        return self.page.url if self.page else ""
+
+    def clear_page_state(self):
+        self.filled = {}
+
+    @timed_step("print_bill")
+    def print_bill(self, ewb_no=None):
+        """
+        No browser to render a PDF with: the EWB print page the submit answered with is
+        saved as HTML instead (with a <base> so its styles and images still resolve).
+        """
+        try:
+            base = f'<base href="{self.page.url}">'
+            html, found = HEAD_RE.subn(lambda m: m.group(0) + base, self.page.html, count=1)
+            if not found:
+                html = base + html
+            name = self.save_pdf(html.encode("utf-8"), ewb_no, ext="html")
+        except Exception as e:
+            logger.exception("Failed to save the EWB print page")
+            return {"success": False, "error": str(e)}
+        return {
+            "success": True,
+            "message": "EWB generated. No PDF was produced (HTTP engine); the portal's print page was saved as HTML.",
+            "pdf_produced": False,
+            "ewb_no": ewb_no,
+            "pdf_name": name,
+            "pdf_path": os.path.join(Config.PDF_DIR, name),
+            "download_url": f"/download/{name}",
+        }
+
+    def locate(self):
+        if self.page is None:
+            return "other"
+        if "Login.aspx" in self.page.url:
+            return "login"
+        if PRINT_MARKER in self.page.html:
+            return "submitted"
+        if self.page.has("txtDocNo"):
+            return "bill_form_filled" if self.filled.get("txtDocNo") else "bill_form"
+        return "other"
+
+    def recover_step(self, checkpoint, context):
+        if checkpoint == "submitted":
+            return {"success": True, "ewb_no": read_ewb_no(self.page.texts.get(EWB_NO_ID), self.page.html)}
+        return {"success": True}
+
+    def scrape_master_data(self):
+        options = lambda el_id, i: [opt[i].strip() for opt in self.page.selects.get(self.page.ids.get(el_id), [])]
+        return {"states": options("slToState", 1), "igst_rates": options("SelectIGST_1", 0)}
+
+    # ---------- LOGIN PAGE + CAPTCHA ----------
+    @timed_step("load_login_page")
+    def load_login_page(self, session_id):
+        try:
+            self._get(LOGIN_URL)
+            self.forget_captcha()
+            return self.get_captcha(session_id)
+        except Exception as e:
+            logger.exception("Failed to load login page")
+            return {"success": False, "error": str(e)}
+
+    @timed_step("get_captcha")
+    def get_captcha(self, session_id):
+        try:
+            if self.images.get("captcha") is None:
+                # every fetch of the captcha handler issues a new code, so fetch once per login page
+                src = self.page.images.get("imgcaptcha")
+                if not src:
+                    raise ValueError("imgcaptcha not found on login page")
+                resp = self.http.get(urljoin(self.page.url, src), timeout=Config.HTTP_TIMEOUT)
+                resp.raise_for_status()
+                self.set_captcha(resp.content)
+            return self.captcha_response(session_id)
+        except Exception as e:
+            logger.exception("Failed to capture captcha")
+            return {"success": False, "error": str(e)}
+
+    # ---------- SESSION REUSE ----------
+    def export_cookies(self):
+        """Cookie jar in the Selenium get_cookies() shape, so both engines share CookieStore entries."""
+        return [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path, "secure": c.secure}
+            for c in self.http.cookies
+        ]
+
+    @timed_step("restore_session")
+    def restore_session(self, cookies):
+        self.http.cookies.clear()
+        host = urlparse(Config.PORTAL_BASE_URL).hostname
+        for cookie in cookies:
+            self.http.cookies.set(cookie["name"], cookie["value"],
+                                  domain=cookie.get("domain") or host, path=cookie.get("path") or "/")
+        if self.navigate_to_bill_generation() and "Login.aspx" not in self.current_url():
+            self.logged_in = True
+            return True
+        return False
+
+    @timed_step("heartbeat")
+    def heartbeat(self):
+        """One authenticated GET (self.page is left as it is); False once the portal has logged us out."""
+        resp = self.http.get(Config.KEEPALIVE_URL, timeout=Config.HTTP_TIMEOUT)
+        resp.raise_for_status()
+        return "Login.aspx" not in resp.url
+
+    def session_expired(self, username):
+        self.logged_in = False
+        if self.cookie_store is not None:
+            self.cookie_store.invalidate(username)
+        self.load_login_page(None)
+
+    # ---------- LOGIN ----------
+    @timed_step("login")
+    def login(self, username, password, captcha_text):
+        captcha_png = self.images.get("captcha")
+        try:
+            page = self.page
+            page.set("txt_username", username)
+            page.set("txt_password", password)
+            page.set("txtCaptcha", captcha_text)
+            page = self._post("btnLogin")
+
+            if page.alerts:
+                ALERTS_SEEN.inc(len(page.alerts), step="login")
+                msg = page.alerts[0]
+                logger.info("GSTService: alert during login -> %s", msg)
+                self._record_captcha(captcha_png, captcha_text, classify_login_error(msg))
+                self.load_login_page(None)
+                return {"success": False, "error": msg}
+
+            if "MainMenu.aspx" in page.url:
+                logger.info("GSTService: login successful (http engine)")
+                self._record_captcha(captcha_png, captcha_text, CORRECT)
+                self.logged_in = True
+                if self.cookie_store is not None:
+                    self.cookie_store.save(username, self.export_cookies())
+                return {"success": True}
+
+            err = (page.texts.get("lblError") or "").strip() or "Invalid credentials or captcha."
+            self._record_captcha(captcha_png, captcha_text, classify_login_error(err))
+            self.load_login_page(None)
+            return {"success": False, "error": err}
+        except Exception as e:
+            logger.exception("Login failed with exception")
+            return {"success": False, "error": str(e)}
+
+    # ---------- BILL PAGE ----------
+    @timed_step("navigate_to_bill_generation")
+    def navigate_to_bill_generation(self):
+        try:
+            page = self._get(BILL_GENERATION_URL)
+            if not page.has("ctl00_ContentPlaceHolder1_rbtOutwardInward_0"):
+                return False
+            page.check("ctl00_ContentPlaceHolder1_rbtOutwardInward_0")
+            self.filled = {}
+            return True
+        except Exception:
+            logger.exception("Failed to load bill generation page")
+            return False
+
+    def _set(self, el_id, value, optional=False):
+        if optional and not self.page.has(el_id):
+            logger.warning("%s field not found, skipping.", el_id)
+            return
+        self.page.set(el_id, value)
+        self.filled[el_id] = value
+
+    # ---------- CONSIGNOR DETAILS ----------
+    @timed_step("fill_consignor_details")
+    def fill_consignor_details(self, data):
+        try:
+            self._set("txtDocNo", data.get("doc_no", "1001"))
+            gstin = (data.get("gstin") or "").strip()
+            if gstin and gstin.upper() != "URP":
+                self._set("ctl00_ContentPlaceHolder1_txtToGSTIN", gstin)
+                trade_name = self.lookup_gstin(gstin) or data.get("name", "")
+                self._set("ctl00_ContentPlaceHolder1_txtToTrdName", trade_name)
+            else:
+                self._set("ctl00_ContentPlaceHolder1_txtToGSTIN", "URP")
+                self._set("ctl00_ContentPlaceHolder1_txtToTrdName", data.get("name", ""))
+                self.filled["slToState"] = self.page.select_by_text("slToState", data.get("state", ""))
+                self._set("ctl00_ContentPlaceHolder1_txtToPlace", data.get("city", ""))
+                self._set("ctl00_ContentPlaceHolder1_txtToPincode", data.get("pincode", ""))
+            return {"success": True}
+        except Exception as e:
+            logger.exception("Failed to fill consignor details")
+            return {"success": False, "error": str(e)}
+
+    def lookup_gstin(self, gstin):
+        """Same AJAX lookup the browser does when the GSTIN field changes; returns the trade name or None."""
+        try:
+            result = self.page_method(Config.HTTP_GSTIN_LOOKUP_METHOD, {"gstin": gstin})
+        except Exception:
+            logger.warning("GSTIN lookup failed for %s", gstin, exc_info=True)
+            return None
+        if isinstance(result, dict):
+            return result.get("TradeName") or result.get("tradeName") or result.get("name")
+        return result or None
+
+    # ---------- INVOICE DETAILS + PREVIEW ----------
+    @timed_step("fill_invoice_and_preview")
+    def fill_invoice_and_preview(self, invoice_data, session_id, image_name="preview"):
+        try:
+            self._set("txt_HSN_1", invoice_data.get("hsn_code", "5407"), optional=True)
+            self._set("txt_TRC_1", invoice_data.get("amount", ""))
+            self.page.select_by_value("SelectIGST_1", invoice_data.get("igst_rate", "5.000"))
+            self.filled["SelectIGST_1"] = invoice_data.get("igst_rate", "5.000")
+            self._set("ctl00_ContentPlaceHolder1_txtTransGSTIN", invoice_data.get("transporter_gstin", ""), optional=True)
+            self._set("ctl00_ContentPlaceHolder1_txtTransid", invoice_data.get("transporter_id", ""))
+            if not self.page.has("btnsbmt"):
+                return {"success": False, "error": "Submit button not found on bill page"}
+            # no browser, so the preview is the form state that will be posted
+            return {"success": True, "preview": dict(self.filled)}
+        except Exception as e:
+            logger.exception("Error during invoice fill/preview")
+            return {"success": False, "error": str(e)}
+
+    # ---------- FINAL SUBMIT ----------
+    @timed_step("submit_form")
+    def submit_form(self):
+        try:
+            page = self._post("btnsbmt")
+            ALERTS_SEEN.inc(len(page.alerts), step="submit")
+            for msg in page.alerts:
+                logger.info("Alert after submit: %s", msg)
+            if PRINT_MARKER not in page.html:
+                err = page.alerts[0] if page.alerts else "EWB print page not returned after submit"
+                return {"success": False, "error": err}
+            return {
+                "success": True,
+                "message": "EWB generated successfully.",
+                "ewb_no": read_ewb_no(page.texts.get(EWB_NO_ID), page.html),
+            }
+        except Exception as e:
+            logger.exception("Failed to submit the bill")
+            # the submit post may have reached the portal before the connection failed
+            return {"success": False, "error": str(e), "outcome_unknown": True}
+
+    def close(self):
+        http, self.http = self.http, None
+        if http is not None:
+            self.session_pool.release(http)
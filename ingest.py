@@ -0,0 +1,286 @@
+"""
+Bulk e-way bill generation from CSV or JSONL invoice files.
+
+    python ingest.py invoices.csv -o results.jsonl --workers 2
+    cat invoices.jsonl | python ingest.py - --format jsonl --captcha ABC123
+
+Rows are read one at a time, validated against the portal master data and
+deduplicated by doc_no, then handed in chunks to a bounded queue; when every
+worker is busy the reader blocks, so at most (workers + queue_size + 1) *
+chunk_size invoices are in memory whatever the file size (plus the doc_nos
+seen so far, for deduplication). Each worker owns one engine (GSTAutomator
+or HttpPortalEngine), logs in once and generates + submits its chunks on
+that portal session. One result line per
+input row is written as soon as it is known (rejected and duplicate rows
+immediately, generated ones as their chunk finishes), not in input order.
+"""
+import sys, csv, json, time, queue, logging, argparse, threading
+from config import Config
+from invoice_validation import MasterData
+
+logger = logging.getLogger("Ingest")
+
+RESULT_FIELDS = ["line", "doc_no", "status", "ewb_no", "pdf_path", "error"]
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, invoice dict) from a CSV or JSONL text stream; unparseable rows carry "_error"."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames or []]
+        for row in reader:
+            yield reader.line_num, {k: (v or "").strip() for k, v in row.items() if k and v and v.strip()}
+        return
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("row is not a JSON object")
+        except ValueError as e:
+            yield line_no, {"_error": f"Unparseable JSON: {e}"}
+            continue
+        yield line_no, {k: str(v).strip() for k, v in row.items() if v is not None and str(v).strip()}
+
+
+class ResultWriter:
+    """Thread-safe JSONL or CSV result stream, flushed after every row."""
+
+    def __init__(self, stream, fmt="jsonl"):
+        self.stream = stream
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        self.counts = {"generated": 0, "failed": 0, "rejected": 0, "duplicate": 0}
+        if fmt == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, line, doc_no, status, result=None, error=None):
+        result = result or {}
+        row = {
+            "line": line,
+            "doc_no": doc_no,
+            "status": status,
+            "ewb_no": result.get("ewb_no"),
+            "pdf_path": result.get("pdf_path"),
+            "error": error or result.get("error"),
+        }
+        with self._lock:
+            self.counts[status] += 1
+            if self.fmt == "csv":
+                self._csv.writerow(row)
+            else:
+                self.stream.write(json.dumps(row) + "\n")
+            self.stream.flush()
+
+
+class Ingestor:
+    """
+    Reader -> bounded queue -> N engine workers -> ResultWriter.
+
+    engine_factory() returns a fresh engine; solve(engine) returns the captcha
+    text for the login page the engine is showing (None when it can't be solved).
+    """
+
+    def __init__(self, engine_factory, solve, writer, master_data=None, workers=1, chunk_size=20, queue_size=2,
+                 credentials=None):
+        self.engine_factory = engine_factory
+        self.solve = solve
+        self.writer = writer
+        self.master_data = master_data
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.credentials = credentials or {"username": Config.username, "password": Config.password}
+        self.queue = queue.Queue(maxsize=queue_size)
+
+    # ---------- reader side ----------
+    def run(self, rows):
+        threads = [threading.Thread(target=self._worker, args=(i,), name=f"ingest-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for t in threads:
+            t.start()
+
+        seen = set()
+        chunk = []
+        for line, invoice in rows:
+            doc_no = invoice.get("doc_no")
+            if "_error" in invoice:
+                self.writer.write(line, doc_no, "rejected", error=invoice["_error"])
+                continue
+            errors = self.master_data.validate(invoice) if self.master_data is not None else []
+            if errors:
+                self.writer.write(line, doc_no, "rejected", error="Invalid invoice: " + "; ".join(errors))
+                continue
+            key = (doc_no or "").upper()
+            if key in seen:
+                self.writer.write(line, doc_no, "duplicate", error="doc_no already seen earlier in this input")
+                continue
+            seen.add(key)
+            chunk.append((line, invoice))
+            if len(chunk) >= self.chunk_size:
+                self.queue.put(chunk)   # blocks while every worker is busy: backpressure on the reader
+                chunk = []
+        if chunk:
+            self.queue.put(chunk)
+        for _ in threads:
+            self.queue.put(None)
+        for t in threads:
+            t.join()
+        return dict(self.writer.counts)
+
+    # ---------- worker side ----------
+    def _worker(self, index):
+        sid = f"ingest-{index}"
+        engine = None
+        try:
+            while True:
+                chunk = self.queue.get()
+                if chunk is None:
+                    return
+                try:
+                    if engine is None:
+                        engine = self.engine_factory()
+                    self._process(engine, sid, chunk)
+                except Exception as e:
+                    logger.exception("Ingest worker %s failed a chunk", index)
+                    for line, invoice in chunk:
+                        self.writer.write(line, invoice.get("doc_no"), "failed", error=str(e))
+        finally:
+            if engine is not None:
+                engine.close()
+
+    def _login_page(self, engine, sid):
+        if engine.logged_in or engine.resume_session(self.credentials["username"]):
+            return True
+        return engine.load_login_page(sid).get("success")
+
+    def _process(self, engine, sid, chunk):
+        # documents generated on an earlier run are answered from the bill store, no login needed
+        pending = []
+        for line, invoice in chunk:
+            stored = engine.stored_bill(self.credentials["username"], invoice)
+            if stored:
+                self._write_result(line, invoice, stored)
+            else:
+                pending.append((line, invoice))
+        if not pending:
+            return
+        # one extra round for invoices cut off by an expired portal session
+        for _ in range(2):
+            result = None
+            for _ in range(Config.CAPTCHA_MAX_RETRIES):
+                if not self._login_page(engine, sid):
+                    continue
+                captcha = "" if engine.logged_in else self.solve(engine)
+                if not engine.logged_in and not captcha:
+                    result = {"error": "Captcha could not be solved", "results": []}
+                    continue
+                credentials = dict(self.credentials, captcha=captcha)
+                result = engine.create_eway_bills(credentials, [inv for _, inv in pending], sid)
+                if result.get("results"):
+                    break
+            results = (result or {}).get("results") or []
+            if not results:
+                error = (result or {}).get("error") or "Could not log in to the portal"
+                for line, invoice in pending:
+                    self.writer.write(line, invoice.get("doc_no"), "failed", error=error)
+                return
+
+            retry = []
+            expired = False
+            for (line, invoice), res in zip(pending, results):
+                expired = expired or bool(res.get("session_expired"))
+                if expired:
+                    retry.append((line, invoice))
+                else:
+                    self._write_result(line, invoice, res)
+            if not retry:
+                return
+            logger.info("%s: portal session expired, retrying %d invoices after a new login", sid, len(retry))
+            pending = retry
+        for line, invoice in pending:
+            self.writer.write(line, invoice.get("doc_no"), "failed", error="Portal session expired")
+
+    def _write_result(self, line, invoice, res):
+        if res.get("success"):
+            status = "duplicate" if res.get("duplicate") else "generated"
+        else:
+            status = "failed"
+        self.writer.write(line, invoice.get("doc_no"), status, res)
+
+
+def make_engine_factory(engine_name, master_data):
+    from cookie_store import CookieStore
+    from captcha_dataset import CaptchaDataset
+    from bill_store import BillStore
+
+    cookie_store = CookieStore(ttl=Config.PORTAL_SESSION_TTL_MINUTES * 60)
+    dataset = CaptchaDataset(Config.CAPTCHA_DATASET_PATH) if Config.CAPTCHA_DATASET_PATH else None
+    # re-running a file (or overlapping files) never generates a document twice
+    bill_store = BillStore(Config.BILL_STORE_PATH, flush_interval=Config.BILL_STORE_FLUSH_SECONDS)
+    kwargs = dict(cookie_store=cookie_store, captcha_dataset=dataset, master_data=master_data, bill_store=bill_store)
+    if engine_name == "http":
+        from http_engine import HttpPortalEngine
+        return lambda: HttpPortalEngine(**kwargs)
+    from gst_automator import GSTAutomator
+    return lambda: GSTAutomator(**kwargs)
+
+
+def make_solver(fixed_answer=None):
+    if fixed_answer:
+        return lambda engine: fixed_answer
+    from captcha_solver import CaptchaSolver  # optional cv2/genai backends
+    solver = CaptchaSolver()
+
+    def solve(engine):
+        if engine.captcha_info and engine.captcha_info["answer"]:
+            return engine.captcha_info["answer"]   # pre-solved while the browser was parked
+        png = engine.images.get("captcha")
+        return solver.solve_captcha(png).get("text") if png else None
+    return solve
+
+
+def detect_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate e-way bills for every invoice in a CSV or JSONL file")
+    parser.add_argument("input", help="CSV or JSONL file, '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="result file (.jsonl or .csv), '-' for stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="input format (default: by extension)")
+    parser.add_argument("--engine", choices=["http", "selenium"], default=Config.ENGINE)
+    parser.add_argument("--workers", type=int, default=1, help="parallel portal sessions")
+    parser.add_argument("--chunk-size", type=int, default=20, help="invoices generated per login round")
+    parser.add_argument("--queue-size", type=int, default=2, help="chunks buffered ahead of the workers")
+    parser.add_argument("--captcha", default=None, help="fixed captcha answer (test portals), default: CaptchaSolver")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    fmt = args.format or detect_format(args.input)
+    out_fmt = "csv" if args.output.lower().endswith(".csv") else "jsonl"
+    master_data = MasterData(Config.MASTER_DATA_PATH, ttl=Config.MASTER_DATA_TTL_HOURS * 3600)
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", newline="", encoding="utf-8-sig")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        ingestor = Ingestor(
+            make_engine_factory(args.engine, master_data), make_solver(args.captcha), ResultWriter(sink, out_fmt),
+            master_data=master_data, workers=args.workers, chunk_size=args.chunk_size, queue_size=args.queue_size,
+        )
+        start = time.perf_counter()
+        counts = ingestor.run(read_rows(source, fmt))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    elapsed = time.perf_counter() - start
+    print(f"📦 {sum(counts.values())} rows in {elapsed:.1f}s: " + ", ".join(f"{k} {v}" for k, v in counts.items()),
+          file=sys.stderr)
+    return 0 if counts["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+Invoice checks that run before any browser or captcha is spent: field formats,
+GSTIN checksums, and the portal's own master data (state list, IGST rate
+options, pincode -> state), cached on disk and refreshed from the bill page.
+"""
+import os, re, json, math, time, logging, threading
+
+logger = logging.getLogger("InvoiceValidation")
+
+GSTIN_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+GSTIN_RE = re.compile(r"^\d{2}[0-9A-Z]{13}$")
+DOC_NO_RE = re.compile(r"^[0-9A-Za-z/\-]{1,16}$")
+PINCODE_RE = re.compile(r"^[1-9]\d{5}$")
+HSN_RE = re.compile(r"^\d{4,8}$")
+
+# GST state codes (first two digits of a GSTIN) -> portal state name
+STATE_CODES = {
+    "01": "JAMMU AND KASHMIR", "02": "HIMACHAL PRADESH", "03": "PUNJAB", "04": "CHANDIGARH",
+    "05": "UTTARAKHAND", "06": "HARYANA", "07": "DELHI", "08": "RAJASTHAN", "09": "UTTAR PRADESH",
+    "10": "BIHAR", "11": "SIKKIM", "12": "ARUNACHAL PRADESH", "13": "NAGALAND", "14": "MANIPUR",
+    "15": "MIZORAM", "16": "TRIPURA", "17": "MEGHALAYA", "18": "ASSAM", "19": "WEST BENGAL",
+    "20": "JHARKHAND", "21": "ODISHA", "22": "CHHATTISGARH", "23": "MADHYA PRADESH", "24": "GUJARAT",
+    "25": "DAMAN AND DIU", "26": "DADRA AND NAGAR HAVELI AND DAMAN AND DIU", "27": "MAHARASHTRA",
+    "29": "KARNATAKA", "30": "GOA", "31": "LAKSHADWEEP", "32": "KERALA", "33": "TAMIL NADU",
+    "34": "PUDUCHERRY", "35": "ANDAMAN AND NICOBAR ISLANDS", "36": "TELANGANA", "37": "ANDHRA PRADESH",
+    "38": "LADAKH", "97": "OTHER TERRITORY", "99": "CENTRE JURISDICTION",
+}
+
+DEFAULT_IGST_RATES = ["0.000", "0.100", "0.250", "1.000", "1.500", "3.000", "5.000",
+                      "6.000", "7.500", "12.000", "18.000", "28.000"]
+
+# India Post pincode ranges (first three digits) -> state; overlapping rows are border
+# circles that serve more than one state, a pincode is fine if any of them matches
+PINCODE_RANGES = [
+    (110, 110, "DELHI"), (121, 136, "HARYANA"), (140, 160, "PUNJAB"), (160, 160, "CHANDIGARH"),
+    (171, 177, "HIMACHAL PRADESH"), (180, 193, "JAMMU AND KASHMIR"), (194, 194, "LADAKH"),
+    (194, 194, "JAMMU AND KASHMIR"), (201, 285, "UTTAR PRADESH"), (244, 249, "UTTARAKHAND"),
+    (262, 263, "UTTARAKHAND"), (301, 345, "RAJASTHAN"), (360, 396, "GUJARAT"),
+    (396, 396, "DADRA AND NAGAR HAVELI AND DAMAN AND DIU"), (396, 396, "DAMAN AND DIU"),
+    (400, 445, "MAHARASHTRA"), (403, 403, "GOA"), (450, 488, "MADHYA PRADESH"),
+    (490, 497, "CHHATTISGARH"), (500, 509, "TELANGANA"), (500, 535, "ANDHRA PRADESH"),
+    (560, 591, "KARNATAKA"), (600, 643, "TAMIL NADU"), (605, 605, "PUDUCHERRY"), (609, 609, "PUDUCHERRY"),
+    (670, 695, "KERALA"), (673, 673, "PUDUCHERRY"), (682, 682, "LAKSHADWEEP"),
+    (700, 743, "WEST BENGAL"), (737, 737, "SIKKIM"), (744, 744, "ANDAMAN AND NICOBAR ISLANDS"),
+    (751, 770, "ODISHA"), (781, 788, "ASSAM"), (790, 792, "ARUNACHAL PRADESH"), (793, 794, "MEGHALAYA"),
+    (795, 795, "MANIPUR"), (796, 796, "MIZORAM"), (797, 798, "NAGALAND"), (799, 799, "TRIPURA"),
+    (800, 855, "BIHAR"), (813, 835, "JHARKHAND"),
+]
+
+
+def normalize_state(name):
+    return re.sub(r"\s+", " ", (name or "").upper().replace("&", " AND ")).strip()
+
+
+def gstin_check_char(gstin):
+    total = 0
+    for i, ch in enumerate(gstin[:14]):
+        product = GSTIN_CHARS.index(ch) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return GSTIN_CHARS[(36 - total % 36) % 36]
+
+
+def gstin_error(gstin, label="GSTIN"):
+    """None when gstin is well formed with a valid state code and check character, else a message."""
+    gstin = (gstin or "").strip().upper()
+    if not GSTIN_RE.match(gstin):
+        return f"{label} must be 15 characters (2-digit state code + 13 letters/digits)"
+    if gstin[:2] not in STATE_CODES:
+        return f"{label} has unknown state code {gstin[:2]}"
+    if gstin_check_char(gstin) != gstin[-1]:
+        return f"{label} check character is wrong"
+    return None
+
+
+class MasterData:
+    """
+    Portal master data with a refresh policy: built-in defaults, replaced by what
+    the bill page actually offers whenever an engine is on it and the cache is
+    older than ttl seconds. Persisted as JSON so restarts don't start cold.
+    """
+
+    def __init__(self, path=None, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.states = sorted(set(STATE_CODES.values()))
+        self.igst_rates = list(DEFAULT_IGST_RATES)
+        self.fetched_at = 0.0
+        self.stats = {"refreshes": 0, "refresh_failures": 0}
+        self._load()
+        self._index()
+
+    def _index(self):
+        self._state_set = {normalize_state(s) for s in self.states}
+        self._rate_set = {self._rate_key(r) for r in self.igst_rates}
+
+    @staticmethod
+    def _rate_key(rate):
+        try:
+            return round(float(rate), 3)
+        except (TypeError, ValueError):
+            return None
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.states = data.get("states") or self.states
+            self.igst_rates = data.get("igst_rates") or self.igst_rates
+            self.fetched_at = data.get("fetched_at", 0.0)
+        except Exception:
+            logger.warning("Could not read master data cache %s", self.path, exc_info=True)
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"states": self.states, "igst_rates": self.igst_rates, "fetched_at": self.fetched_at}, f)
+        os.replace(tmp, self.path)
+
+    # ---------- refresh policy ----------
+    def claim_refresh(self):
+        """True (once) when the data is older than ttl and nobody else is refreshing it."""
+        with self._lock:
+            if self._refreshing or time.time() - self.fetched_at < self.ttl:
+                return False
+            self._refreshing = True
+            return True
+
+    def update(self, scraped):
+        """scraped: {"states": [option texts], "igst_rates": [option values]} from the bill page; None = failed."""
+        with self._lock:
+            self._refreshing = False
+            if not scraped:
+                self.stats["refresh_failures"] += 1
+                return
+            states = [s.strip() for s in scraped.get("states") or [] if s.strip() and "SELECT" not in s.upper()]
+            rates = [r for r in scraped.get("igst_rates") or [] if self._rate_key(r) is not None]
+            if states:
+                self.states = states
+            if rates:
+                self.igst_rates = rates
+            self.fetched_at = time.time()
+            self.stats["refreshes"] += 1
+            self._index()
+            try:
+                self._save()
+            except Exception:
+                logger.warning("Could not write master data cache %s", self.path, exc_info=True)
+        logger.info("Master data refreshed: %d states, %d IGST rates", len(self.states), len(self.igst_rates))
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, states=len(self.states), igst_rates=len(self.igst_rates),
+                        age_seconds=time.time() - self.fetched_at if self.fetched_at else None)
+
+    # ---------- lookups ----------
+    def has_state(self, name):
+        return normalize_state(name) in self._state_set
+
+    def has_rate(self, rate):
+        return self._rate_key(rate) in self._rate_set
+
+    @staticmethod
+    def pincode_states(pincode):
+        """States served by a pincode's 3-digit prefix; empty when the prefix isn't in the table."""
+        prefix = int(pincode[:3])
+        return {state for lo, hi, state in PINCODE_RANGES if lo <= prefix <= hi}
+
+    # ---------- validation ----------
+    def validate(self, invoice):
+        """List of problems with an invoice dict (empty when it can go to the portal)."""
+        errors = []
+        doc_no = str(invoice.get("doc_no") or "").strip()
+        if not DOC_NO_RE.match(doc_no):
+            errors.append("doc_no must be 1-16 letters, digits, '/' or '-'")
+
+        gstin = (invoice.get("gstin") or "").strip().upper()
+        if gstin and gstin != "URP":
+            error = gstin_error(gstin)
+            if error:
+                errors.append(error)
+        else:
+            if not (invoice.get("name") or "").strip():
+                errors.append("name is required for an unregistered (URP) consignee")
+            state = invoice.get("state") or ""
+            if not self.has_state(state):
+                errors.append(f"state {state!r} is not in the portal's state list")
+            if not (invoice.get("city") or "").strip():
+                errors.append("city is required for an unregistered (URP) consignee")
+            pincode = str(invoice.get("pincode") or "").strip()
+            if not PINCODE_RE.match(pincode):
+                errors.append("pincode must be 6 digits")
+            else:
+                served = self.pincode_states(pincode)
+                if served and normalize_state(state) not in {normalize_state(s) for s in served}:
+                    errors.append(f"pincode {pincode} is in {'/'.join(sorted(served))}, not {state}")
+
+        try:
+            amount = float(invoice.get("amount"))
+            if not math.isfinite(amount):
+                errors.append("amount must be a finite number")
+            elif amount <= 0:
+                errors.append("amount must be greater than 0")
+        except (TypeError, ValueError):
+            errors.append("amount must be a number")
+
+        rate = invoice.get("igst_rate", "5.000")
+        if not self.has_rate(rate):
+            errors.append(f"IGST rate {rate!r} is not offered by the portal")
+
+        hsn = str(invoice.get("hsn_code") or "").strip()
+        if hsn and not HSN_RE.match(hsn):
+            errors.append("hsn_code must be 4-8 digits")
+        error = gstin_error(invoice.get("transporter_id"), "transporter_id")
+        if error:
+            errors.append(error)
+        if (invoice.get("transporter_gstin") or "").strip():
+            error = gstin_error(invoice["transporter_gstin"], "transporter_gstin")
+            if error:
+                errors.append(error)
+        return errors
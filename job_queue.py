@@ -0,0 +1,161 @@
+import time, uuid, queue, logging, threading
+
+logger = logging.getLogger("JobQueue")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, fn, args, kwargs, session_id=None, job_id=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.kind = kind
+        self.session_id = session_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        wait = (self.started_at or time.time()) - self.submitted_at
+        run = None
+        if self.started_at:
+            run = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "wait_seconds": round(wait, 3),
+            "run_seconds": round(run, 3) if run is not None else None,
+        }
+
+
+class JobQueue:
+    """
+    Bounded worker pool for the long GSTAutomator flows.
+
+    submit() returns a Job immediately; workers run it in the background and
+    clients poll (or long-poll with wait()) for status and result.
+    """
+
+    def __init__(self, workers=4, max_queue=100, result_ttl=3600, id_factory=None):
+        self.workers = workers
+        self.id_factory = id_factory
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._busy = 0
+        self.stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "run_seconds_total": 0.0,
+            "run_seconds_max": 0.0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return self
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job.started_at = time.time()
+            job.status = RUNNING
+            waited = job.started_at - job.submitted_at
+            with self._lock:
+                self._busy += 1
+                self.stats["wait_seconds_total"] += waited
+                self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+            try:
+                job.result = job.fn(*job.args, **job.kwargs)
+                job.status = DONE
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job.id, job.kind)
+                job.error = str(e)
+                job.status = FAILED
+            job.finished_at = time.time()
+            ran = job.finished_at - job.started_at
+            with self._lock:
+                self._busy -= 1
+                self.stats["completed" if job.status == DONE else "failed"] += 1
+                self.stats["run_seconds_total"] += ran
+                self.stats["run_seconds_max"] = max(self.stats["run_seconds_max"], ran)
+            job.done.set()
+            self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at and job.finished_at < cutoff:
+                self._jobs.pop(job_id, None)
+
+    def submit(self, kind, fn, *args, session_id=None, **kwargs):
+        self.start()
+        job = Job(kind, fn, args, kwargs, session_id=session_id,
+                  job_id=self.id_factory() if self.id_factory else None)
+        with self._lock:
+            self._prune()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.stats["rejected"] += 1
+                raise QueueFull("Job queue is full, try again later")
+            self._jobs[job.id] = job
+            self.stats["submitted"] += 1
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=0):
+        """Long-poll: block up to `timeout` seconds for the job to finish."""
+        job = self.get(job_id)
+        if job is not None and timeout:
+            job.done.wait(timeout)
+        return job
+
+    def snapshot(self):
+        with self._lock:
+            snap = dict(self.stats)
+            snap.update({
+                "workers": self.workers,
+                "busy_workers": self._busy,
+                "queue_depth": self._queue.qsize(),
+                "queue_max": self._queue.maxsize,
+                "tracked_jobs": len(self._jobs),
+            })
+        started = (snap["completed"] + snap["failed"] + snap["busy_workers"]) or 1
+        finished = (snap["completed"] + snap["failed"]) or 1
+        snap["avg_wait_seconds"] = snap["wait_seconds_total"] / started
+        snap["avg_run_seconds"] = snap["run_seconds_total"] / finished
+        return snap
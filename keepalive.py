@@ -0,0 +1,53 @@
+import time, logging, threading
+
+logger = logging.getLogger("KeepAlive")
+
+
+class KeepAlive:
+    """
+    Schedule for portal heartbeats on idle logged-in sessions.
+
+    The portal's idle timeout isn't published, so it is estimated: a session
+    still alive after `idle` seconds proves the timeout is longer than that, one
+    found logged out after `idle` seconds proves it is at most that long. Sessions
+    are pinged every `safety` x estimate (clamped to [min_interval, max_interval]),
+    so a shorter real timeout is learnt after one or two logouts.
+    """
+
+    def __init__(self, timeout_guess, min_interval=60, max_interval=600, safety=0.5):
+        self.timeout = float(timeout_guess)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.safety = safety
+        self._lock = threading.Lock()
+        self.stats = {"beats": 0, "alive": 0, "logged_out": 0, "errors": 0, "skipped_busy": 0}
+
+    @property
+    def interval(self):
+        return max(self.min_interval, min(self.max_interval, self.timeout * self.safety))
+
+    def due(self, last_activity, now=None):
+        """True when a session last seen on the portal at last_activity (epoch seconds) should be pinged."""
+        return (now or time.time()) - last_activity >= self.interval
+
+    def observe(self, idle, alive):
+        """Record a heartbeat made `idle` seconds after the session's previous portal request."""
+        with self._lock:
+            self.stats["beats"] += 1
+            if alive:
+                self.stats["alive"] += 1
+                self.timeout = max(self.timeout, idle)
+                return
+            self.stats["logged_out"] += 1
+            previous = self.timeout
+            self.timeout = max(self.min_interval / self.safety, min(self.timeout, idle))
+        if self.timeout < previous:
+            logger.info("Portal logged a session out after %.0fs idle, heartbeat every %.0fs now", idle, self.interval)
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, timeout_estimate=self.timeout, interval=self.interval)
@@ -0,0 +1,182 @@
+import os, sys, logging
+import numpy as np
+
+logger = logging.getLogger("LocalCaptcha")
+
+CAPTCHA_LENGTH = 6
+GLYPH_SIZE = 20
+
+
+# ---------- SEGMENTATION ----------
+def _runs(mask):
+    """[start, end) index pairs of consecutive True values in a 1-D bool array."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return [(int(a), int(b)) for a, b in zip(edges[::2], edges[1::2])]
+
+
+def _resize_nearest(img, size):
+    h, w = img.shape
+    rows = (np.arange(size) * h / size).astype(int)
+    cols = (np.arange(size) * w / size).astype(int)
+    return img[rows][:, cols]
+
+
+def segment(img, length=CAPTCHA_LENGTH):
+    """
+    Split a cleaned captcha (dark text on white, as returned by
+    CaptchaSolver.clean_captcha_image) into `length` glyph images.
+    Uses the vertical ink projection, then merges/splits runs until exactly
+    `length` glyphs remain. Returns a list of bool arrays, or None if no ink.
+    """
+    ink = np.asarray(img) < 128
+    runs = _runs(ink.any(axis=0))
+    if not runs:
+        return None
+
+    while len(runs) > length:
+        # merge the two neighbours separated by the narrowest gap
+        gaps = [runs[i + 1][0] - runs[i][1] for i in range(len(runs) - 1)]
+        i = int(np.argmin(gaps))
+        runs[i:i + 2] = [(runs[i][0], runs[i + 1][1])]
+    while len(runs) < length:
+        # touching characters: split the widest run in half
+        i = max(range(len(runs)), key=lambda j: runs[j][1] - runs[j][0])
+        a, b = runs[i]
+        if b - a < 2:
+            return None
+        mid = (a + b) // 2
+        runs[i:i + 1] = [(a, mid), (mid, b)]
+
+    glyphs = []
+    for a, b in runs:
+        col = ink[:, a:b]
+        rows = np.flatnonzero(col.any(axis=1))
+        glyphs.append(col[rows[0]:rows[-1] + 1] if rows.size else col)
+    return glyphs
+
+
+def glyph_features(glyph, size=GLYPH_SIZE):
+    """Pad a glyph to a square (keeps aspect ratio), resize and L2-normalise it."""
+    h, w = glyph.shape
+    side = max(h, w)
+    square = np.zeros((side, side), dtype=np.float32)
+    top, left = (side - h) // 2, (side - w) // 2
+    square[top:top + h, left:left + w] = glyph
+    vec = _resize_nearest(square, size).ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+# ---------- MODEL ----------
+class LocalCaptchaRecognizer:
+    """
+    Offline captcha reader: segments the 6 characters and classifies each one
+    with k-nearest-neighbours over labelled glyph templates (cosine similarity).
+    predict() returns (text, confidence) in a few milliseconds on CPU.
+    """
+
+    def __init__(self, templates=None, labels=None, k=3):
+        self.templates = templates if templates is not None else np.zeros((0, GLYPH_SIZE * GLYPH_SIZE), np.float32)
+        self.labels = labels if labels is not None else np.zeros((0,), dtype="<U1")
+        self.k = k
+
+    @property
+    def trained(self):
+        return len(self.labels) > 0
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["templates"], data["labels"], k=int(data["k"]))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(path, templates=self.templates, labels=self.labels, k=self.k)
+
+    def fit(self, samples):
+        """samples: iterable of (cleaned_image, text). Samples that don't segment cleanly are skipped."""
+        feats, labels, skipped = [], [], 0
+        for img, text in samples:
+            glyphs = segment(img, len(text))
+            if glyphs is None:
+                skipped += 1
+                continue
+            for glyph, ch in zip(glyphs, text):
+                feats.append(glyph_features(glyph))
+                labels.append(ch)
+        if skipped:
+            logger.warning("Skipped %d samples that could not be segmented", skipped)
+        if feats:
+            self.templates = np.vstack(feats).astype(np.float32)
+            self.labels = np.array(labels)
+        return self
+
+    def classify(self, feats):
+        """Per-glyph (label, confidence) for a (n, d) feature matrix."""
+        sims = feats @ self.templates.T
+        k = min(self.k, sims.shape[1])
+        top = np.argsort(-sims, axis=1)[:, :k]
+        out = []
+        for row, idx in zip(sims, top):
+            weights = {}
+            for i in idx:
+                weights[self.labels[i]] = weights.get(self.labels[i], 0.0) + max(float(row[i]), 0.0)
+            label = max(weights, key=weights.get)
+            total = sum(weights.values()) or 1.0
+            # vote share among the neighbours, scaled by how close the best match is
+            out.append((label, weights[label] / total * float(row[idx[0]])))
+        return out
+
+    def predict(self, img):
+        """Returns (text, confidence in [0, 1]); (None, 0.0) when untrained or unsegmentable."""
+        if not self.trained or img is None:
+            return None, 0.0
+        glyphs = segment(img)
+        if glyphs is None:
+            return None, 0.0
+        feats = np.vstack([glyph_features(g) for g in glyphs])
+        chars = self.classify(feats)
+        text = "".join(label for label, _ in chars)
+        return text, min(conf for _, conf in chars)
+
+
+def load_labelled_dir(directory):
+    """Yield (cleaned_image, label) from files named <LABEL>.png or <LABEL>_<anything>.png."""
+    from captcha_solver import CaptchaSolver
+
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        label = os.path.splitext(name)[0].split("_")[0]
+        if len(label) != CAPTCHA_LENGTH:
+            continue
+        img = CaptchaSolver.clean_captcha_image(os.path.join(directory, name))
+        if img is not None:
+            yield img, label
+
+
+def load_dataset(path):
+    """Yield (cleaned_image, label) from a CaptchaDataset file (correct logins only)."""
+    from captcha_solver import CaptchaSolver
+    from captcha_dataset import CaptchaDataset
+
+    for png, label in CaptchaDataset(path).labelled():
+        img = CaptchaSolver.clean_captcha_image(png)
+        if img is not None:
+            yield img, label
+
+
+if __name__ == "__main__":
+    # python local_captcha.py <labelled_dir | dataset.bin> [model_path]
+    from config import Config
+
+    if len(sys.argv) < 2:
+        print("usage: python local_captcha.py <labelled_dir | dataset.bin> [model_path]")
+        sys.exit(1)
+    source = sys.argv[1]
+    model_path = sys.argv[2] if len(sys.argv) > 2 else Config.LOCAL_CAPTCHA_MODEL_PATH
+    samples = load_labelled_dir(source) if os.path.isdir(source) else load_dataset(source)
+    model = LocalCaptchaRecognizer(k=Config.LOCAL_CAPTCHA_K).fit(samples)
+    model.save(model_path)
+    print(f"✅ Trained on {len(model.labels)} glyphs, saved to {model_path}")
@@ -0,0 +1,189 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain dicts keyed by label values behind one lock,
+so recording a sample is a dict lookup plus a bisect; cheap enough to stay on
+in production. Gauges are callbacks evaluated only when /metrics is scraped.
+"""
+import time, bisect, functools, threading
+from contextlib import contextmanager
+
+# seconds; portal steps range from ~50ms (HTTP engine) to tens of seconds (browser + slow portal)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, key)} {_fmt(v)}" for key, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}   # label key -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[idx] += 1
+            row[-1] += value
+
+    def collect(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(row[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value is read from fn() at scrape time; fn returns a number or {label value: number}."""
+
+    def __init__(self, name, help, fn, labelname=None):
+        self.name, self.help, self.fn, self.labelname = name, help, fn, labelname
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        value = self.fn()
+        if isinstance(value, dict):
+            lines += [f"{self.name}{_labels([self.labelname], [k])} {_fmt(v)}" for k, v in sorted(value.items())]
+        elif value is not None:
+            lines.append(f"{self.name} {_fmt(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, fn, labelname=None):
+        """(Re-)register a scrape-time gauge; later registrations replace earlier ones."""
+        with self._lock:
+            self._metrics = [m for m in self._metrics if m.name != name]
+            self._metrics.append(Gauge(name, help, fn, labelname))
+
+    def exposition(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines += metric.collect()
+            except Exception:
+                # a broken gauge callback must not take the whole scrape down
+                continue
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STEP_SECONDS = REGISTRY.register(Histogram(
+    "ewb_step_duration_seconds", "Duration of portal automation steps", ("engine", "step", "outcome")))
+DRIVER_LAUNCH_SECONDS = REGISTRY.register(Histogram(
+    "ewb_driver_launch_seconds", "Time to launch and park a Chrome driver", ()))
+CAPTCHA_SOLVE_SECONDS = REGISTRY.register(Histogram(
+    "ewb_captcha_solve_seconds", "Captcha solver latency", ("solver", "outcome")))
+LOGIN_FAILURES = REGISTRY.register(Counter(
+    "ewb_login_failures_total", "Failed portal logins by reason", ("reason",)))
+ALERTS_SEEN = REGISTRY.register(Counter(
+    "ewb_alerts_total", "Portal JS alerts seen, by step", ("step",)))
+RETRIES = REGISTRY.register(Counter(
+    "ewb_retries_total", "Fallbacks and retries, by kind", ("kind",)))
+WAIT_TIMEOUTS = REGISTRY.register(Counter(
+    "ewb_wait_timeouts_total", "Step waits that ran out of time", ("step",)))
+INVOICES_REJECTED = REGISTRY.register(Counter(
+    "ewb_invoices_rejected_total", "Invoices rejected by local validation before reaching the portal", ()))
+CAPTCHA_AGE_SECONDS = REGISTRY.register(Histogram(
+    "ewb_captcha_age_seconds", "Age of the captcha image when a login was attempted with it", ("outcome",),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200)))
+TIME_TO_FIRST_CAPTCHA_SECONDS = REGISTRY.register(Histogram(
+    "ewb_time_to_first_captcha_seconds", "New session request to captcha ready, by captcha source", ("source",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)))
+CAPTCHA_REFRESHES = REGISTRY.register(Counter(
+    "ewb_captcha_refreshes_total", "Captchas re-captured ahead of use, by where they are kept", ("where",)))
+
+
+def _outcome(result):
+    if isinstance(result, dict):
+        return "success" if result.get("success") else "failure"
+    return "success" if result else "failure"
+
+
+@contextmanager
+def span(histogram, **labels):
+    """Time a block into histogram; set labels["outcome"] inside the block to override "success"."""
+    labels.setdefault("outcome", "success")
+    start = time.perf_counter()
+    try:
+        yield labels
+    except Exception:
+        labels["outcome"] = "error"
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def timed_step(step):
+    """Method decorator: record the step's duration under the engine's ENGINE_NAME."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = method(self, *args, **kwargs)
+                outcome = _outcome(result)
+                return result
+            finally:
+                STEP_SECONDS.observe(time.perf_counter() - start,
+                                     engine=getattr(self, "ENGINE_NAME", ""), step=step, outcome=outcome)
+        return wrapper
+    return decorator
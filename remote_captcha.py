@@ -0,0 +1,174 @@
+import re, time, logging, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import Config
+
+logger = logging.getLogger("RemoteCaptcha")
+
+ANSWER_RE = re.compile(r"^[A-Za-z0-9]{6}$")
+PROMPT = ("The CAPTCHA image contains a 6-character alphanumeric string. Identify this exact string. "
+          "Output ONLY the 6-character result, nothing else, no explanation, no quotes.")
+
+
+def normalize_answer(text):
+    """Strip quotes/whitespace/markdown; returns the 6-char answer or None if malformed."""
+    if not text:
+        return None
+    text = text.strip().strip("`*\"' \n")
+    return text if ANSWER_RE.match(text) else None
+
+
+# ---------- PROVIDERS ----------
+class GeminiProvider:
+    """One Gemini model behind a single long-lived client; image bytes are sent inline."""
+
+    def __init__(self, model, client):
+        self.name = f"gemini:{model}"
+        self.model = model
+        self.client = client
+
+    def solve(self, png):
+        from google.genai import types
+
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=[types.Part.from_bytes(data=bytes(png), mime_type="image/png"), PROMPT],
+        )
+        return response.text
+
+
+class HttpProvider:
+    """
+    Plain HTTP solver: POST the PNG body, answer is {"text": "..."} or the raw body.
+    Used for self-hosted models and for the local stub server (captcha_stub.py).
+    """
+
+    def __init__(self, url, timeout):
+        import requests
+
+        self.name = f"http:{url}"
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()   # keep-alive connection pool
+
+    def solve(self, png):
+        resp = self.session.post(self.url, data=bytes(png), headers={"Content-Type": "image/png"}, timeout=self.timeout)
+        resp.raise_for_status()
+        if resp.headers.get("Content-Type", "").startswith("application/json"):
+            return resp.json().get("text")
+        return resp.text
+
+
+def make_gemini_client(api_key, timeout, base_url=None):
+    from google import genai
+    from google.genai import types
+
+    http_options = types.HttpOptions(timeout=int(timeout * 1000), base_url=base_url or None)
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+# ---------- SERVICE ----------
+class RemoteCaptchaService:
+    """
+    Long-lived remote solver: providers are built once and raced concurrently on
+    every captcha; the first well-formed 6-character answer wins. Slower
+    providers keep running in the background and their answers are dropped.
+    """
+
+    def __init__(self, providers, timeout=10, max_workers=None):
+        self.providers = list(providers)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(4, len(self.providers) * 2),
+                                            thread_name_prefix="captcha-remote")
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "solved": 0,
+            "timeouts": 0,
+            "malformed": 0,
+            "errors": 0,
+            "latency_seconds_total": 0.0,
+            "wins": {p.name: 0 for p in self.providers},
+        }
+
+    @classmethod
+    def from_config(cls):
+        timeout = Config.REMOTE_CAPTCHA_TIMEOUT
+        providers = []
+        if Config.GEMINI_API_KEY and Config.REMOTE_CAPTCHA_MODELS:
+            try:
+                client = make_gemini_client(Config.GEMINI_API_KEY, timeout, Config.GEMINI_BASE_URL)
+                providers += [GeminiProvider(model, client) for model in Config.REMOTE_CAPTCHA_MODELS]
+            except ImportError as e:
+                # google-genai is optional: the HTTP providers still run without it
+                logger.warning("Gemini captcha solver unavailable (%s)", e)
+        providers += [HttpProvider(url, timeout) for url in Config.REMOTE_CAPTCHA_HTTP_URLS]
+        return cls(providers, timeout=timeout)
+
+    def _call(self, provider, png):
+        start = time.perf_counter()
+        text = provider.solve(png)
+        return provider, normalize_answer(text), time.perf_counter() - start
+
+    def solve(self, png, timeout=None):
+        """Returns {"text", "provider", "latency"} for the first valid answer, or None."""
+        timeout = self.timeout if timeout is None else timeout
+        if not self.providers:
+            logger.warning("No remote captcha providers configured")
+            return None
+        with self._lock:
+            self.stats["requests"] += 1
+
+        start = time.perf_counter()
+        deadline = start + timeout
+        pending = {self._executor.submit(self._call, p, png) for p in self.providers}
+        while pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    provider, answer, latency = future.result()
+                except Exception as e:
+                    logger.warning("Remote captcha provider failed: %s", e)
+                    with self._lock:
+                        self.stats["errors"] += 1
+                    continue
+                if answer is None:
+                    with self._lock:
+                        self.stats["malformed"] += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.stats["solved"] += 1
+                    self.stats["wins"][provider.name] = self.stats["wins"].get(provider.name, 0) + 1
+                    self.stats["latency_seconds_total"] += elapsed
+                for f in pending:
+                    f.cancel()
+                return {"text": answer, "provider": provider.name, "latency": elapsed}
+
+        for f in pending:
+            f.cancel()
+        with self._lock:
+            if pending:
+                self.stats["timeouts"] += 1
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            snap = dict(self.stats, wins=dict(self.stats["wins"]))
+        snap["avg_latency_seconds"] = snap["latency_seconds_total"] / snap["solved"] if snap["solved"] else None
+        return snap
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_remote_service():
+    """Process-wide RemoteCaptchaService, created on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RemoteCaptchaService.from_config()
+        return _service
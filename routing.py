@@ -0,0 +1,18 @@
+"""
+Ids that name their owning worker process, "w<worker id>-<uuid4>", so the
+dispatcher can send every request for a session or job to the process that
+holds its browser.
+"""
+import re, uuid
+
+_OWNER_RE = re.compile(r"^w(\d+)-")
+
+
+def new_id(worker_id):
+    return f"w{worker_id}-{uuid.uuid4()}"
+
+
+def owner_of(identifier):
+    """Worker id encoded in a session/job id, or None for ids without one."""
+    match = _OWNER_RE.match(identifier or "")
+    return int(match.group(1)) if match else None
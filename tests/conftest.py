@@ -0,0 +1,25 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fake_portal import start_fake_portal
+
+# Config reads PORTAL_BASE_URL at import time: the fake portal is up before any engine module is imported
+PORTAL, _SERVER, PORTAL_URL = start_fake_portal(captcha_answer="ABC123", password="secret", preview_delay=0)
+os.environ["PORTAL_BASE_URL"] = PORTAL_URL
+
+CREDENTIALS = {"username": "09AAEFC1392H1ZH", "password": "secret", "captcha": "ABC123"}
+INVOICE = {"doc_no": "D1", "gstin": "URP", "name": "X", "state": "UTTAR PRADESH", "city": "L", "pincode": "226001",
+           "amount": "100", "igst_rate": "5.000", "transporter_id": "09AAEFC1392H1ZH"}
+
+
+@pytest.fixture
+def portal():
+    from config import Config
+
+    backoff = Config.STEP_RETRY_BACKOFF
+    Config.STEP_RETRY_BACKOFF = 0.01
+    yield PORTAL
+    PORTAL.session_timeout = 1200
+    Config.STEP_RETRY_BACKOFF = backoff
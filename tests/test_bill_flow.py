@@ -0,0 +1,88 @@
+import time
+
+from conftest import CREDENTIALS, INVOICE
+from bill_store import BillStore, GENERATED, UNKNOWN
+from cookie_store import CookieStore
+from http_engine import HttpPortalEngine
+
+
+def new_engine(**kwargs):
+    engine = HttpPortalEngine(**kwargs)
+    assert engine.load_login_page("s")["success"]
+    return engine
+
+
+def test_logged_out_step_reports_session_expired(portal):
+    cookies = CookieStore(ttl=600)
+    engine = new_engine(cookie_store=cookies)
+    assert engine.create_eway_bill(CREDENTIALS, INVOICE, "s")["success"]
+    assert cookies.get(CREDENTIALS["username"])
+
+    portal.session_timeout = 0.2
+    time.sleep(0.5)
+    res = engine.create_eway_bill(CREDENTIALS, dict(INVOICE, doc_no="D2"), "s")
+
+    assert res["success"] is False
+    assert res["session_expired"] is True
+    assert res["error"] == "Portal session expired"
+    assert engine.logged_in is False
+    assert not cookies.get(CREDENTIALS["username"])
+    engine.close()
+
+
+def _submit_then_fail_print(engine, keep_ewb_no):
+    submit_form = engine.submit_form
+
+    def submit_without_ewb_no():
+        res = submit_form()
+        return res if keep_ewb_no else dict(res, ewb_no=None)
+    engine.submit_form = submit_without_ewb_no
+    engine.print_bill = lambda ewb_no=None: {"success": False, "error": "print failed"}
+
+
+def test_print_failure_after_submit_blocks_resubmit(portal, tmp_path):
+    store = BillStore(str(tmp_path / "bills.sqlite3"))
+    engine = new_engine(bill_store=store)
+    _submit_then_fail_print(engine, keep_ewb_no=False)
+    bills = portal.stats["bills"]
+
+    res = engine.create_eway_bill(CREDENTIALS, dict(INVOICE, doc_no="P1"), "s", auto_submit=True)
+
+    assert res["success"] is False
+    assert store.get(CREDENTIALS["username"], "P1")["status"] == UNKNOWN
+    # a second flow for the same document is answered from the store, nothing is posted again
+    other = new_engine(bill_store=store)
+    again = other.create_eway_bill(CREDENTIALS, dict(INVOICE, doc_no="P1"), "s", auto_submit=True)
+    assert again["success"] is False
+    assert portal.stats["bills"] == bills + 1
+    engine.close()
+    other.close()
+    store.close()
+
+
+def test_print_failure_with_known_ewb_no_is_generated(portal, tmp_path):
+    store = BillStore(str(tmp_path / "bills.sqlite3"))
+    engine = new_engine(bill_store=store)
+    _submit_then_fail_print(engine, keep_ewb_no=True)
+
+    engine.create_eway_bill(CREDENTIALS, dict(INVOICE, doc_no="P2"), "s", auto_submit=True)
+
+    record = store.get(CREDENTIALS["username"], "P2")
+    assert record["status"] == GENERATED
+    assert record["ewb_no"]
+    engine.close()
+    store.close()
+
+
+def test_logout_during_print_keeps_submitted_bill_blocking(portal, tmp_path):
+    store = BillStore(str(tmp_path / "bills.sqlite3"))
+    engine = new_engine(bill_store=store)
+    _submit_then_fail_print(engine, keep_ewb_no=False)
+    engine.locate = lambda: "login"
+
+    res = engine.create_eway_bill(CREDENTIALS, dict(INVOICE, doc_no="P3"), "s", auto_submit=True)
+
+    assert res["session_expired"] is True
+    assert store.get(CREDENTIALS["username"], "P3")["status"] == UNKNOWN
+    engine.close()
+    store.close()
@@ -0,0 +1,17 @@
+from bill_store import BillStore, GENERATED
+
+
+def test_numeric_doc_no_matches_its_string_form(tmp_path):
+    store = BillStore(str(tmp_path / "bills.sqlite3"))
+    assert store.claim("24ahjpr6707k1zy", "1001") is None
+    store.record("24AHJPR6707K1ZY", "1001", GENERATED, ewb_no="331000000001")
+
+    record = store.get("24AHJPR6707K1ZY", 1001)
+    assert record["status"] == GENERATED
+    assert record["doc_no"] == "1001"
+    assert store.claim("24AHJPR6707K1ZY", 1001)["ewb_no"] == "331000000001"
+    store.close()
+
+    reopened = BillStore(str(tmp_path / "bills.sqlite3"))
+    assert reopened.get("24AHJPR6707K1ZY", 1001)["ewb_no"] == "331000000001"
+    reopened.close()
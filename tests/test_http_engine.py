@@ -0,0 +1,17 @@
+from bill_flow import EWB_NO_ID, read_ewb_no
+from http_engine import PortalPage
+
+PRINT_PAGE = """<html><body><div>Ack 123456789012</div>
+<table><tr><td>E-Way Bill No:</td><td id="lblEwbNo"> 331000000042 </td></tr>
+<tr><td>Document No:</td><td>999999999999</td></tr></table></body></html>"""
+
+
+def test_ewb_no_is_read_from_its_label():
+    page = PortalPage(PRINT_PAGE, "http://portal/BillGeneration/BillGeneration.aspx")
+    assert page.texts[EWB_NO_ID].strip() == "331000000042"
+    assert read_ewb_no(page.texts.get(EWB_NO_ID), page.html) == "331000000042"
+
+
+def test_ewb_no_falls_back_to_page_text_without_label():
+    page = PortalPage(PRINT_PAGE.replace(' id="lblEwbNo"', ""), "http://portal/")
+    assert read_ewb_no(page.texts.get(EWB_NO_ID), page.html) == "123456789012"
@@ -0,0 +1,10 @@
+import pytest
+
+from conftest import INVOICE
+from invoice_validation import MasterData
+
+
+@pytest.mark.parametrize("amount", ["nan", "inf", "-inf", "NaN"])
+def test_non_finite_amount_is_rejected(tmp_path, amount):
+    master = MasterData(str(tmp_path / "master_data.json"))
+    assert master.validate(dict(INVOICE, amount=amount)) == ["amount must be a finite number"]
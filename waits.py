@@ -0,0 +1,111 @@
+import time, logging
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
+from config import Config
+from metrics import WAIT_TIMEOUTS
+
+logger = logging.getLogger("Waits")
+
+
+# ---------- CONDITIONS ----------
+# Each condition takes the driver and returns something truthy once the portal is ready.
+
+def page_idle(driver):
+    """Document loaded and no jQuery / ASP.NET AJAX request in flight."""
+    return driver.execute_script(
+        "if (document.readyState !== 'complete') return false;"
+        "if (window.jQuery && window.jQuery.active > 0) return false;"
+        "try { var prm = Sys.WebForms.PageRequestManager.getInstance();"
+        "      if (prm.get_isInAsyncPostBack()) return false; } catch (e) {}"
+        "return true;"
+    )
+
+
+def field_has_value(element_id):
+    """Input got a non-empty value (e.g. trade name filled by the GSTIN lookup)."""
+    def _cond(driver):
+        try:
+            value = driver.find_element(By.ID, element_id).get_attribute("value")
+        except (NoSuchElementException, StaleElementReferenceException):
+            return False
+        return value if value and value.strip() else False
+    return _cond
+
+
+def element_visible(by, locator):
+    def _cond(driver):
+        try:
+            el = driver.find_element(by, locator)
+            return el if el.is_displayed() else False
+        except (NoSuchElementException, StaleElementReferenceException):
+            return False
+    return _cond
+
+
+def element_has_text(element_id):
+    def _cond(driver):
+        try:
+            text = driver.find_element(By.ID, element_id).text
+        except (NoSuchElementException, StaleElementReferenceException):
+            return False
+        return text.strip() if text and text.strip() else False
+    return _cond
+
+
+def images_settled(driver):
+    """Every <img> on the page finished loading (or failed)."""
+    return driver.execute_script("return Array.prototype.every.call(document.images, function(i) { return i.complete; });")
+
+
+def js_flag(name):
+    """window[name] was set to true by page script (e.g. a hooked window.print)."""
+    def _cond(driver):
+        return driver.execute_script("return window[arguments[0]] === true;", name)
+    return _cond
+
+
+# ---------- WAITER ----------
+class StepWaiter:
+    """
+    Finishes each step as soon as the portal is ready instead of sleeping.
+
+    mode "condition" polls the given condition up to Config.STEP_TIMEOUTS[step].
+    mode "fixed" keeps the old behaviour: sleep the legacy delay and move on.
+    """
+
+    def __init__(self, driver, mode=None):
+        self.driver = driver
+        self.mode = mode or Config.WAIT_MODE
+
+    def timeout_for(self, step):
+        return Config.STEP_TIMEOUTS.get(step, Config.STEP_TIMEOUT_DEFAULT)
+
+    def wait(self, step, condition, fixed_delay=0, required=False):
+        """
+        Returns the condition result, or None when it timed out and required=False.
+        Raises TimeoutException on timeout when required=True.
+        """
+        if self.mode == "fixed":
+            if fixed_delay:
+                time.sleep(fixed_delay)
+            if not required:
+                return None
+            # legacy flow still needs the element/result after the sleep, fall through
+
+        start = time.monotonic()
+        try:
+            result = WebDriverWait(
+                self.driver,
+                self.timeout_for(step),
+                poll_frequency=Config.WAIT_POLL_INTERVAL,
+                ignored_exceptions=(NoSuchElementException, StaleElementReferenceException),
+            ).until(condition)
+            logger.debug("wait %s ready after %.2fs", step, time.monotonic() - start)
+            return result
+        except TimeoutException:
+            WAIT_TIMEOUTS.inc(step=step)
+            if required:
+                raise
+            logger.warning("wait %s not ready after %ss, continuing", step, self.timeout_for(step))
+            return None